@@ -1,3 +1,6 @@
+-- 旧版字符串三元组数据导入脚本；导入后启动服务，结构迁移（src/schema_migrations.py）会自动
+-- 转换为实体/关系字典表 + 整数ID，去重并添加唯一约束和复合索引
+
 -- 创建知识图谱三元组表
 CREATE TABLE knowledge_triples (
                                    id INTEGER PRIMARY KEY AUTO_INCREMENT,
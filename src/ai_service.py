@@ -2,12 +2,56 @@
 AI服务模块：Word2Vec和Kimi API集成
 """
 import logging
-from typing import Optional, List
+from typing import Dict, Optional, List
 import os
+
+import numpy as np
 from openai import OpenAI
 
+from ann_index import load_model_ann
+from model_store import load_with_stats, process_memory
+
 logger = logging.getLogger(__name__)
 
+# 候选词不在模型词汇表中时的相似度
+OUT_OF_VOCABULARY_SIMILARITY = 0.1
+
+
+def _top_candidates(model, word: str, candidate_words: List[str], topn: Optional[int] = None) -> List[tuple]:
+    """
+    输入词与候选词的余弦相似度（一次矩阵-向量乘法），argpartition 取最高的 topn 个
+
+    Args:
+        model: gensim KeyedVectors 或 CompactKeyedVectors（输入词必须在词汇表中）
+        word: 输入词
+        candidate_words: 候选词列表
+        topn: 返回数量，None 表示全部
+
+    Returns:
+        [(词, 相似度), ...]，按相似度降序；不在词汇表中的候选词相似度为 OUT_OF_VOCABULARY_SIMILARITY
+    """
+    key_to_index = model.key_to_index
+    positions = [position for position, candidate in enumerate(candidate_words) if candidate in key_to_index]
+    scores = np.full(len(candidate_words), OUT_OF_VOCABULARY_SIMILARITY, dtype=np.float64)
+    if positions:
+        vectors = np.asarray(
+            model.vectors[[key_to_index[candidate_words[position]] for position in positions]], dtype=np.float32
+        )
+        norms = np.linalg.norm(vectors, axis=1)
+        norms[norms == 0] = 1.0
+        query = np.asarray(model.get_vector(word), dtype=np.float32)
+        query_norm = np.linalg.norm(query)
+        if query_norm > 0:
+            query = query / query_norm
+        scores[positions] = (vectors @ query) / norms
+
+    count = len(scores) if topn is None else min(topn, len(scores))
+    if count <= 0:
+        return []
+    top = np.argpartition(-scores, count - 1)[:count] if count < len(scores) else np.arange(len(scores))
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return [(candidate_words[i], float(scores[i])) for i in top]
+
 
 class Word2VecService:
     """Word2Vec服务（支持多级备用模型）"""
@@ -21,16 +65,23 @@ class Word2VecService:
         """
         self.model = None  # 自定义模型
         self.fallback_model = None  # 备用通用模型
+        # 模型文件旁离线构建的ANN索引（ann_index.py），没有时使用精确搜索
+        self.model_ann = None
+        self.fallback_ann = None
+        # 各模型的加载耗时、是否内存映射等信息
+        self.load_stats: Dict[str, dict] = {}
         self.model_path = model_path
         self.kimi_client = None  # 用于在线词向量查询
 
         # 加载自定义模型
         if model_path and os.path.exists(model_path):
             try:
-                from gensim.models import KeyedVectors
                 logger.info(f"正在加载自定义Word2Vec模型: {model_path}")
-                self.model = KeyedVectors.load_word2vec_format(model_path, binary=True)
+                self.model, self.load_stats["custom"] = load_with_stats(model_path, binary=True)
                 logger.info(f"自定义模型加载成功，词汇量: {len(self.model.key_to_index)}")
+                # 服务模型已裁剪词表，直接暴力计算即可，不使用ANN索引
+                if not self.load_stats["custom"]["serving"]:
+                    self.model_ann = load_model_ann(model_path, self.model)
             except Exception as e:
                 logger.warning(f"自定义模型加载失败: {e}")
                 self.model = None
@@ -56,7 +107,7 @@ class Word2VecService:
         """
         if self.model is not None:
             try:
-                similar_words = self.model.most_similar(word, topn=topn)
+                similar_words = self._most_similar(self.model, self.model_ann, word, topn)
                 if similar_words:
                     most_similar_word = similar_words[0][0]
                     similarity_score = similar_words[0][1]
@@ -85,29 +136,38 @@ class Word2VecService:
             return
             
         try:
-            from gensim.models import KeyedVectors
             logger.info(f"正在加载备用Word2Vec模型: {fallback_path}")
-            
-            # 根据文件扩展名判断加载方式
-            if fallback_path.endswith('.bin'):
-                self.fallback_model = KeyedVectors.load_word2vec_format(fallback_path, binary=True)
-            elif fallback_path.endswith('.txt'):
-                self.fallback_model = KeyedVectors.load_word2vec_format(fallback_path, binary=False)
-            else:
-                # 尝试gensim原生格式
-                self.fallback_model = KeyedVectors.load(fallback_path)
-                
+            # 根据文件扩展名判断加载方式，已转换为原生格式时以内存映射方式加载
+            self.fallback_model, self.load_stats["fallback"] = load_with_stats(fallback_path)
             logger.info(f"✅ 备用模型加载成功，词汇量: {len(self.fallback_model.key_to_index)}")
+            if not self.load_stats["fallback"]["serving"]:
+                self.fallback_ann = load_model_ann(fallback_path, self.fallback_model)
         except Exception as e:
             logger.warning(f"备用模型加载失败: {e}")
             self.fallback_model = None
 
+    def status(self) -> dict:
+        """各模型的加载信息及本进程的内存占用"""
+        return {
+            "pid": os.getpid(),
+            "models": {
+                name: {**stats, "ann_index": ann is not None}
+                for name, stats, ann in (
+                    ("custom", self.load_stats.get("custom"), self.model_ann),
+                    ("fallback", self.load_stats.get("fallback"), self.fallback_ann)
+                )
+                if stats is not None
+            },
+            "memory": process_memory()
+        }
+
     def _init_kimi_client(self):
         """初始化Kimi客户端（仅用于关系推理，不用于相似词查询）"""
         # Kimi客户端只在KimiService中使用，这里不需要初始化
         self.kimi_client = None
 
-    def calculate_similarity_with_candidates(self, word: str, candidate_words: List[str]) -> List[tuple]:
+    def calculate_similarity_with_candidates(self, word: str, candidate_words: List[str],
+                                             topn: Optional[int] = None) -> List[tuple]:
         """
         计算输入词与候选词列表的相似度（从数据库获取的词语）
         
@@ -119,6 +179,7 @@ class Word2VecService:
         Args:
             word: 输入词
             candidate_words: 候选词列表（从数据库获取的实体）
+            topn: 只返回相似度最高的前N个，None 表示全部
             
         Returns:
             [(词, 相似度), ...] 列表，按相似度降序排列
@@ -153,29 +214,17 @@ class Word2VecService:
             except Exception as e:
                 logger.warning(f"检查备用模型失败: {e}")
         
-        # 如果有可用模型，计算相似度
+        # 如果有可用模型，计算相似度（候选词不在模型中时给一个较低的相似度）
         if active_model is not None:
-            for candidate in candidate_words:
-                try:
-                    # 检查候选词是否在模型中
-                    if candidate in active_model.key_to_index:
-                        similarity = active_model.similarity(word, candidate)
-                        results.append((candidate, float(similarity)))
-                    else:
-                        # 候选词不在模型中，给一个较低的相似度
-                        results.append((candidate, 0.1))
-                except Exception as e:
-                    logger.warning(f"计算 '{word}' 和 '{candidate}' 的相似度失败: {e}")
-                    results.append((candidate, 0.0))
-            
-            # 按相似度降序排序
-            results.sort(key=lambda x: x[1], reverse=True)
-            logger.info(f"使用{model_name}计算了 {len(results)} 个词的相似度")
+            results = _top_candidates(active_model, word, candidate_words, topn)
+            logger.info(f"使用{model_name}计算了 {len(candidate_words)} 个词的相似度")
             
         else:
             # 策略3: 都没有，使用Mock模式
             logger.warning(f"⚠️  词 '{word}' 不在任何模型中，使用Mock模式")
             results = self._mock_similarity_with_candidates(word, candidate_words)
+            if topn is not None:
+                results = results[:topn]
         
         return results
     
@@ -190,7 +239,15 @@ class Word2VecService:
         logger.info(f"🔄 Mock模式生成了 {len(results)} 个词的相似度")
         return results
 
-    def find_most_similar_topn(self, word: str, topn: int = 10) -> List[tuple]:
+    def _most_similar(self, model, ann, word: str, topn: int, nprobe: Optional[int] = None,
+                      rerank: Optional[int] = None, exact: bool = False) -> List[tuple]:
+        """模型有ANN索引时近似查询，否则（或要求精确时）使用 gensim 暴力搜索"""
+        if ann is not None and not exact:
+            return ann.most_similar(word, topn=topn, nprobe=nprobe, rerank=rerank)
+        return model.most_similar(word, topn=topn)
+
+    def find_most_similar_topn(self, word: str, topn: int = 10, nprobe: Optional[int] = None,
+                               rerank: Optional[int] = None, exact: bool = False) -> List[tuple]:
         """
         找到与给定词最相似的Top-N个词（多级备用策略）
         
@@ -202,9 +259,14 @@ class Word2VecService:
         2. 备用通用Word2Vec模型（广泛覆盖）
         3. Mock数据（兜底保障）
         
+        模型有ANN索引时只扫描部分倒排列表，召回率与延迟可按次调整
+        
         Args:
             word: 输入词
             topn: 返回前N个相似词
+            nprobe: ANN扫描的倒排列表数，None 使用默认值（WORD2VEC_ANN_NPROBE）
+            rerank: ANN用原始向量精确重排的候选数，None 使用默认值（WORD2VEC_ANN_RERANK）
+            exact: 为True时忽略ANN索引，暴力搜索整个词汇表
             
         Returns:
             [(词, 相似度), ...] 列表
@@ -212,7 +274,7 @@ class Word2VecService:
         # 策略1: 尝试自定义模型
         if self.model is not None:
             try:
-                similar_words = self.model.most_similar(word, topn=topn)
+                similar_words = self._most_similar(self.model, self.model_ann, word, topn, nprobe, rerank, exact)
                 logger.info(f"✅ 自定义模型找到{len(similar_words)}个相似词: {word}")
                 return similar_words
             except KeyError:
@@ -223,7 +285,7 @@ class Word2VecService:
         # 策略2: 尝试备用通用模型
         if self.fallback_model is not None:
             try:
-                similar_words = self.fallback_model.most_similar(word, topn=topn)
+                similar_words = self._most_similar(self.fallback_model, self.fallback_ann, word, topn, nprobe, rerank, exact)
                 logger.info(f"✅ 备用通用模型找到{len(similar_words)}个相似词: {word}")
                 return similar_words
             except KeyError:
@@ -0,0 +1,106 @@
+"""
+图像分析完整结果的持久化编码
+分析ID按时间可排序且不会在同一秒内冲突；完整响应JSON压缩后存入 image_analysis_results，
+查看历史结果时直接返回，无需重新识别和推理
+"""
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:  # zstandard为可选依赖，未安装时使用gzip
+    zstandard = None
+
+ANALYSIS_ID_PREFIX = "img_analysis_"
+
+CODEC_ZSTD = "zstd"
+CODEC_GZIP = "gzip"
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+
+# Crockford Base32，字典序与数值序一致
+_BASE32_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_RANDOM_BITS = 80
+
+
+def _encode_base32(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        chars.append(_BASE32_ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+class AnalysisIdGenerator:
+    """
+    ULID 形式的分析ID：48位毫秒时间戳 + 80位随机数，共26个字符
+
+    同一毫秒内生成的ID在随机部分上递增，保证本进程内严格递增；
+    不同进程之间依靠80位随机数避免冲突
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._last_random = 0
+
+    def new_id(self) -> str:
+        with self._lock:
+            now_ms = int(time.time() * 1000)
+            if now_ms <= self._last_ms:
+                # 同一毫秒（或时钟回拨）时沿用上一个时间戳并递增随机部分
+                now_ms = self._last_ms
+                random_part = self._last_random + 1
+                if random_part >> _RANDOM_BITS:
+                    now_ms += 1
+                    random_part = int.from_bytes(os.urandom(10), "big")
+            else:
+                random_part = int.from_bytes(os.urandom(10), "big")
+            self._last_ms = now_ms
+            self._last_random = random_part
+        return ANALYSIS_ID_PREFIX + _encode_base32(now_ms, 10) + _encode_base32(random_part, 16)
+
+
+analysis_id_generator = AnalysisIdGenerator()
+
+
+def new_analysis_id() -> str:
+    """生成新的分析ID（按生成时间可排序）"""
+    return analysis_id_generator.new_id()
+
+
+def compress_result(result: Dict[str, Any]) -> Tuple[bytes, str]:
+    """
+    将分析结果编码为压缩后的JSON
+
+    Returns:
+        (压缩数据, 压缩格式 zstd / gzip)
+    """
+    body = json.dumps(result, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body), CODEC_ZSTD
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0), CODEC_GZIP
+
+
+def decompress_result(payload: bytes, codec: str) -> bytes:
+    """
+    解压为JSON字节串
+
+    Raises:
+        RuntimeError: 结果以 zstd 压缩但未安装 zstandard
+        ValueError: 未知的压缩格式
+    """
+    if codec == CODEC_GZIP:
+        return gzip.decompress(payload)
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("该分析结果以zstd压缩，未安装zstandard无法读取（pip install zstandard）")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    raise ValueError(f"未知的压缩格式: {codec}")
@@ -0,0 +1,500 @@
+"""
+词向量近似最近邻（ANN）索引
+gensim 的 most_similar 对整个词汇表暴力计算，备用通用模型有数百万词时每次查询都很慢。
+这里实现基于 NumPy 的 IVF-PQ 索引：
+
+- 粗量化：对归一化后的词向量做球面 k-means，每个词归入最近的一个倒排列表
+- 乘积量化：词向量与所属中心的残差按维度切成 m 段，每段用 256 个码字编码为 1 字节
+- 查询：只扫描与查询向量最相似的 nprobe 个倒排列表，
+  内积 q·x ≈ q·c + Σ q_j·codebook_j[code_j]，查表求和即可；
+  再对得分最高的 rerank 个候选用原始向量精确重排
+
+索引离线构建（python ann_index.py build <模型路径>），保存在模型文件旁的
+<模型路径>.ivfpq/ 目录，加载时编码和倒排列表以内存映射方式打开
+
+索引目录结构:
+    meta.json       索引参数、模型指纹、构建时测得的召回率
+    centroids.npy   float32 (nlist, dim)        粗量化中心
+    codebooks.npy   float32 (m, 256, dsub)      残差的乘积量化码本
+    offsets.npy     int64   (nlist + 1,)        各倒排列表在 codes/ids 中的起止位置
+    ids.npy         int32   (n,)                按倒排列表排序的词在模型中的行号
+    codes.npy       uint8   (n, m)              按倒排列表排序的 PQ 编码
+"""
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from model_store import load_keyed_vectors
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT = "ivfpq"
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".ivfpq"
+META_FILE = "meta.json"
+
+PQ_CODEWORDS = 256
+# 每个 PQ 子空间的默认维数
+DEFAULT_SUBVECTOR_DIM = 4
+DEFAULT_TRAIN_SIZE = 100_000
+DEFAULT_KMEANS_ITERATIONS = 20
+# 编码 / 精确搜索时每批处理的行数
+CHUNK_SIZE = 65_536
+
+# 查询默认参数（可通过环境变量调整，也可以每次查询单独指定）
+DEFAULT_NPROBE = int(os.getenv("WORD2VEC_ANN_NPROBE", "16"))
+DEFAULT_RERANK = int(os.getenv("WORD2VEC_ANN_RERANK", "100"))
+
+
+def index_path(model_path: Union[str, Path]) -> Path:
+    """模型对应的索引目录"""
+    return Path(str(model_path) + INDEX_SUFFIX)
+
+
+def model_fingerprint(model_path: Union[str, Path], model) -> Dict[str, Any]:
+    """模型文件及词汇表的指纹，用于判断索引是否与模型匹配"""
+    stat = os.stat(model_path)
+    return {
+        "size": stat.st_size,
+        "mtime": int(stat.st_mtime),
+        "vocab_size": len(model.index_to_key),
+        "dim": int(model.vector_size)
+    }
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_indices(scores: np.ndarray, count: int) -> np.ndarray:
+    """得分最高的 count 个位置，按得分降序"""
+    count = min(count, len(scores))
+    if count <= 0:
+        return np.empty(0, dtype=np.int64)
+    if count < len(scores):
+        top = np.argpartition(-scores, count - 1)[:count]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def _kmeans(data: np.ndarray, k: int, iterations: int, rng: np.random.Generator,
+            spherical: bool = False) -> np.ndarray:
+    """
+    Lloyd k-means
+
+    Args:
+        data: float32 (n, d)
+        k: 中心数
+        iterations: 迭代次数
+        rng: 随机数生成器（初始中心从样本中随机抽取）
+        spherical: True 时按内积分配并把中心归一化（用于归一化向量的粗量化）
+
+    Returns:
+        float32 (k, d) 中心
+    """
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _assign(data, centroids, spherical)
+        counts = np.bincount(assignment, minlength=k)
+        # 按簇排序后分段求和（比 np.add.at 快得多）
+        order = np.argsort(assignment, kind="stable")
+        sums = np.zeros_like(centroids)
+        present = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[present]
+        sums[present] = np.add.reduceat(data[order], starts, axis=0)
+        empty = counts == 0
+        counts[empty] = 1
+        centroids = sums / counts[:, None]
+        if empty.any():
+            # 空簇重新从样本中随机取点
+            centroids[empty] = data[rng.choice(len(data), int(empty.sum()), replace=False)]
+        if spherical:
+            centroids = _normalize(centroids)
+    return centroids.astype(np.float32)
+
+
+def _assign(data: np.ndarray, centroids: np.ndarray, spherical: bool = False) -> np.ndarray:
+    """每行最近的中心（分批计算，避免 n×k 的距离矩阵占用过多内存）"""
+    assignment = np.empty(len(data), dtype=np.int64)
+    centroid_norms = None if spherical else (centroids ** 2).sum(axis=1)
+    for start in range(0, len(data), CHUNK_SIZE):
+        chunk = data[start:start + CHUNK_SIZE]
+        scores = chunk @ centroids.T
+        if not spherical:
+            # 最小化 ||x-c||² 等价于最大化 2x·c - ||c||²
+            scores = 2 * scores - centroid_norms
+        assignment[start:start + CHUNK_SIZE] = scores.argmax(axis=1)
+    return assignment
+
+
+def _subvector_count(dim: int, m: Optional[int]) -> int:
+    if m is None:
+        m = max(1, dim // DEFAULT_SUBVECTOR_DIM)
+        while dim % m:
+            m -= 1
+    if dim % m:
+        raise ValueError(f"向量维数 {dim} 不能被子空间数 {m} 整除")
+    return m
+
+
+class IVFPQIndex:
+    """IVF-PQ 索引（只读，可多线程并发查询）"""
+
+    def __init__(self, meta: Dict[str, Any], centroids: np.ndarray, codebooks: np.ndarray,
+                 offsets: np.ndarray, ids: np.ndarray, codes: np.ndarray):
+        self.meta = meta
+        self.centroids = centroids
+        self.codebooks = codebooks
+        self.offsets = offsets
+        self.ids = ids
+        self.codes = codes
+        self.nlist = len(centroids)
+        self.m, _, self.dsub = codebooks.shape
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # ---------- 构建 ----------
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, nlist: Optional[int] = None, m: Optional[int] = None,
+              train_size: int = DEFAULT_TRAIN_SIZE, iterations: int = DEFAULT_KMEANS_ITERATIONS,
+              seed: int = 0) -> "IVFPQIndex":
+        """
+        从词向量矩阵构建索引
+
+        Args:
+            vectors: (n, dim) 词向量（KeyedVectors.vectors，行号即词在模型中的下标）
+            nlist: 倒排列表数，默认 4·√n
+            m: PQ 子空间数（须整除 dim），默认每段 4 维
+            train_size: 训练 k-means 使用的样本数
+            iterations: k-means 迭代次数
+            seed: 随机种子
+
+        Returns:
+            构建好的索引
+        """
+        started = time.time()
+        n, dim = vectors.shape
+        rng = np.random.default_rng(seed)
+        nlist = min(nlist or max(1, int(4 * np.sqrt(n))), n)
+        m = _subvector_count(dim, m)
+        dsub = dim // m
+
+        sample = np.sort(rng.choice(n, min(train_size, n), replace=False))
+        train = _normalize(vectors[sample])
+        logger.info(f"训练粗量化中心: {nlist} 个, 样本 {len(train)}")
+        centroids = _kmeans(train, nlist, iterations, rng, spherical=True)
+
+        residuals = train - centroids[_assign(train, centroids, spherical=True)]
+        logger.info(f"训练乘积量化码本: {m} 段 × {PQ_CODEWORDS} 码字")
+        codebooks = np.stack([
+            _kmeans(residuals[:, j * dsub:(j + 1) * dsub], PQ_CODEWORDS, iterations, rng)
+            for j in range(m)
+        ])
+        # 样本少于 256 时码字数不足，编码只使用已训练的码字，码本补零到 256 个
+        trained = codebooks.shape[1]
+        if trained < PQ_CODEWORDS:
+            padding = np.zeros((m, PQ_CODEWORDS - trained, dsub), dtype=np.float32)
+            codebooks = np.concatenate([codebooks, padding], axis=1)
+
+        assignment = np.empty(n, dtype=np.int64)
+        codes = np.empty((n, m), dtype=np.uint8)
+        for start in range(0, n, CHUNK_SIZE):
+            chunk = _normalize(vectors[start:start + CHUNK_SIZE])
+            lists = _assign(chunk, centroids, spherical=True)
+            assignment[start:start + len(chunk)] = lists
+            residual = chunk - centroids[lists]
+            for j in range(m):
+                codes[start:start + len(chunk), j] = _assign(residual[:, j * dsub:(j + 1) * dsub], codebooks[j, :trained])
+            logger.info(f"已编码 {start + len(chunk)}/{n}")
+
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=nlist), out=offsets[1:])
+
+        meta = {
+            "format": INDEX_FORMAT,
+            "version": INDEX_VERSION,
+            "count": int(n),
+            "dim": int(dim),
+            "nlist": int(nlist),
+            "m": int(m),
+            "train_size": int(len(train)),
+            "build_seconds": round(time.time() - started, 1)
+        }
+        return cls(meta, centroids, codebooks, offsets, order.astype(np.int32), codes[order])
+
+    # ---------- 存取 ----------
+
+    def save(self, directory: Union[str, Path]):
+        """保存到索引目录"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / "centroids.npy", self.centroids)
+        np.save(directory / "codebooks.npy", self.codebooks)
+        np.save(directory / "offsets.npy", self.offsets)
+        np.save(directory / "ids.npy", self.ids)
+        np.save(directory / "codes.npy", self.codes)
+        # meta.json 最后写入，构建中断时不会留下看似完整的索引
+        with open(directory / META_FILE, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, directory: Union[str, Path]) -> "IVFPQIndex":
+        """加载索引，编码和行号以内存映射方式打开"""
+        directory = Path(directory)
+        with open(directory / META_FILE, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != INDEX_FORMAT or meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"不支持的索引格式: {meta.get('format')} v{meta.get('version')}")
+        return cls(
+            meta,
+            np.load(directory / "centroids.npy"),
+            np.load(directory / "codebooks.npy"),
+            np.load(directory / "offsets.npy"),
+            np.load(directory / "ids.npy", mmap_mode="r"),
+            np.load(directory / "codes.npy", mmap_mode="r")
+        )
+
+    # ---------- 查询 ----------
+
+    def search(self, query: np.ndarray, topn: int, nprobe: Optional[int] = None,
+               rerank: Optional[int] = None, vectors: Optional[np.ndarray] = None,
+               exclude: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        近似最近邻查询（余弦相似度）
+
+        Args:
+            query: 查询向量
+            topn: 返回数量
+            nprobe: 扫描的倒排列表数，越大召回率越高、越慢
+            rerank: 用原始向量精确重排的候选数，0 表示直接返回 PQ 近似得分
+            vectors: 原始词向量矩阵（重排时需要）
+            exclude: 从结果中排除的行号（查询词本身）
+
+        Returns:
+            [(行号, 相似度), ...]，按相似度降序
+        """
+        nprobe = min(nprobe or DEFAULT_NPROBE, self.nlist)
+        rerank = DEFAULT_RERANK if rerank is None else rerank
+        query = _normalize(query)
+
+        coarse = self.centroids @ query
+        probe = _top_indices(coarse, nprobe)
+        # 残差码本在各倒排列表间共享，查询向量与各码字的内积表只需计算一次
+        table = np.einsum("mkd,md->mk", self.codebooks, query.reshape(self.m, self.dsub))
+
+        candidate_ids = []
+        candidate_scores = []
+        for list_no in probe:
+            start, end = self.offsets[list_no], self.offsets[list_no + 1]
+            if start == end:
+                continue
+            codes = np.asarray(self.codes[start:end])
+            candidate_ids.append(np.asarray(self.ids[start:end]))
+            candidate_scores.append(coarse[list_no] + table[np.arange(self.m), codes].sum(axis=1))
+        if not candidate_ids:
+            return []
+        ids = np.concatenate(candidate_ids)
+        scores = np.concatenate(candidate_scores)
+        if exclude is not None:
+            keep = ids != exclude
+            ids, scores = ids[keep], scores[keep]
+
+        if rerank and vectors is not None:
+            top = _top_indices(scores, max(rerank, topn))
+            ids = ids[top]
+            rows = np.sort(ids)
+            exact = _normalize(vectors[rows]) @ query
+            scores = exact[np.searchsorted(rows, ids)]
+
+        top = _top_indices(scores, topn)
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+
+def exact_search(vectors: np.ndarray, norms: np.ndarray, query: np.ndarray, topn: int,
+                 exclude: Optional[int] = None) -> List[Tuple[int, float]]:
+    """
+    精确最近邻查询（分批暴力计算，作为召回率评估的基准）
+
+    Args:
+        vectors: 原始词向量矩阵
+        norms: 各行的 L2 范数
+        query: 查询向量
+        topn: 返回数量
+        exclude: 排除的行号
+
+    Returns:
+        [(行号, 相似度), ...]，按相似度降序
+    """
+    query = _normalize(query)
+    best_ids = np.empty(0, dtype=np.int64)
+    best_scores = np.empty(0, dtype=np.float32)
+    for start in range(0, len(vectors), CHUNK_SIZE):
+        scores = (np.asarray(vectors[start:start + CHUNK_SIZE], dtype=np.float32) @ query) / norms[start:start + CHUNK_SIZE]
+        if exclude is not None and start <= exclude < start + len(scores):
+            scores[exclude - start] = -np.inf
+        top = _top_indices(scores, topn + 1)
+        best_ids = np.concatenate([best_ids, top + start])
+        best_scores = np.concatenate([best_scores, scores[top]])
+        keep = _top_indices(best_scores, topn)
+        best_ids, best_scores = best_ids[keep], best_scores[keep]
+    return [(int(i), float(s)) for i, s in zip(best_ids, best_scores)]
+
+
+def evaluate_recall(index: IVFPQIndex, vectors: np.ndarray, k: int = 10, queries: int = 200,
+                    nprobe: Optional[int] = None, rerank: Optional[int] = None,
+                    seed: int = 1) -> Dict[str, Any]:
+    """
+    以词汇表中随机抽取的词为查询，统计 ANN 相对精确搜索的 recall@k 和平均延迟
+
+    Returns:
+        {k, queries, nprobe, rerank, recall, ann_ms, exact_ms}
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(vectors), min(queries, len(vectors)), replace=False)
+    norms = np.linalg.norm(vectors, axis=1)
+    norms[norms == 0] = 1.0
+    nprobe = min(nprobe or DEFAULT_NPROBE, index.nlist)
+    rerank = DEFAULT_RERANK if rerank is None else rerank
+
+    hits = 0
+    total = 0
+    ann_seconds = 0.0
+    exact_seconds = 0.0
+    for row in rows:
+        query = vectors[row]
+        started = time.perf_counter()
+        approximate = index.search(query, k, nprobe=nprobe, rerank=rerank, vectors=vectors, exclude=int(row))
+        ann_seconds += time.perf_counter() - started
+        started = time.perf_counter()
+        exact = exact_search(vectors, norms, query, k, exclude=int(row))
+        exact_seconds += time.perf_counter() - started
+        hits += len({i for i, _ in approximate} & {i for i, _ in exact})
+        total += len(exact)
+
+    return {
+        "k": k,
+        "queries": len(rows),
+        "nprobe": nprobe,
+        "rerank": rerank,
+        "recall": round(hits / total, 4) if total else 0.0,
+        "ann_ms": round(ann_seconds * 1000 / max(len(rows), 1), 3),
+        "exact_ms": round(exact_seconds * 1000 / max(len(rows), 1), 3)
+    }
+
+
+class ModelANN:
+    """绑定到某个 KeyedVectors 的 ANN 索引，提供与 most_similar 相同形式的结果"""
+
+    def __init__(self, model, index: IVFPQIndex):
+        self.model = model
+        self.index = index
+
+    def most_similar(self, word: str, topn: int = 10, nprobe: Optional[int] = None,
+                     rerank: Optional[int] = None) -> List[tuple]:
+        """
+        近似的 most_similar
+
+        Raises:
+            KeyError: 词不在模型词汇表中（与 gensim 行为一致）
+        """
+        row = self.model.key_to_index[word]
+        results = self.index.search(
+            self.model.vectors[row], topn, nprobe=nprobe, rerank=rerank,
+            vectors=self.model.vectors, exclude=row
+        )
+        index_to_key = self.model.index_to_key
+        return [(index_to_key[i], score) for i, score in results]
+
+
+def load_model_ann(model_path: Optional[str], model) -> Optional[ModelANN]:
+    """
+    加载模型文件旁的 ANN 索引；不存在或与模型不匹配时返回None（使用精确搜索）
+    """
+    if not model_path or model is None:
+        return None
+    directory = index_path(model_path)
+    if not (directory / META_FILE).exists():
+        return None
+    try:
+        index = IVFPQIndex.load(directory)
+        expected = index.meta.get("model")
+        actual = model_fingerprint(model_path, model)
+        if expected != actual:
+            logger.warning(f"ANN索引与模型不匹配（模型已更新？），忽略索引: {directory}")
+            return None
+        logger.info(
+            f"ANN索引加载成功: {directory}, {len(index)} 个词, {index.nlist} 个倒排列表, "
+            f"构建时 recall@{index.meta.get('evaluation', {}).get('k')}="
+            f"{index.meta.get('evaluation', {}).get('recall')}"
+        )
+        return ModelANN(model, index)
+    except Exception as e:
+        logger.warning(f"ANN索引加载失败，使用精确搜索: {e}")
+        return None
+
+
+def build_model_index(model_path: str, model=None, nlist: Optional[int] = None, m: Optional[int] = None,
+                      train_size: int = DEFAULT_TRAIN_SIZE, iterations: int = DEFAULT_KMEANS_ITERATIONS,
+                      eval_queries: int = 200, k: int = 10) -> Dict[str, Any]:
+    """
+    为模型构建 ANN 索引并保存到模型文件旁，同时记录默认参数下的 recall@k
+
+    Returns:
+        索引的 meta 信息
+    """
+    if model is None:
+        model = load_keyed_vectors(model_path)
+    index = IVFPQIndex.build(model.vectors, nlist=nlist, m=m, train_size=train_size, iterations=iterations)
+    index.meta["model"] = model_fingerprint(model_path, model)
+    if eval_queries:
+        index.meta["evaluation"] = evaluate_recall(index, model.vectors, k=k, queries=eval_queries)
+    index.save(index_path(model_path))
+    return index.meta
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Word2Vec 模型 ANN（IVF-PQ）索引构建 / 评估')
+    parser.add_argument('mode', type=str, choices=['build', 'evaluate'], help='构建索引或评估召回率')
+    parser.add_argument('model_path', type=str, help='模型文件路径（索引保存在 <模型路径>.ivfpq/）')
+    parser.add_argument('--nlist', type=int, default=None, help='倒排列表数，默认 4·√词汇量')
+    parser.add_argument('--m', type=int, default=None, help='PQ 子空间数（须整除向量维数）')
+    parser.add_argument('--train-size', type=int, default=DEFAULT_TRAIN_SIZE, help='k-means 训练样本数')
+    parser.add_argument('--iterations', type=int, default=DEFAULT_KMEANS_ITERATIONS, help='k-means 迭代次数')
+    parser.add_argument('--queries', type=int, default=200, help='评估使用的查询数')
+    parser.add_argument('--k', type=int, default=10, help='评估 recall@k 的 k')
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[DEFAULT_NPROBE], help='评估的 nprobe（可多个）')
+    parser.add_argument('--rerank', type=int, nargs='+', default=[DEFAULT_RERANK], help='评估的重排候选数（可多个）')
+    args = parser.parse_args()
+
+    keyed_vectors = load_keyed_vectors(args.model_path)
+    if args.mode == 'build':
+        result = build_model_index(
+            args.model_path, keyed_vectors, nlist=args.nlist, m=args.m, train_size=args.train_size,
+            iterations=args.iterations, eval_queries=args.queries, k=args.k
+        )
+    else:
+        ann_index = IVFPQIndex.load(index_path(args.model_path))
+        result = [
+            evaluate_recall(ann_index, keyed_vectors.vectors, k=args.k, queries=args.queries,
+                            nprobe=nprobe, rerank=rerank)
+            for nprobe in args.nprobe
+            for rerank in args.rerank
+        ]
+    print(json.dumps(result, ensure_ascii=False, indent=2))
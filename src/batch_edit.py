@@ -0,0 +1,219 @@
+"""
+图谱批量编辑
+在一个事务中按顺序执行一批节点/边编辑操作，并返回每个操作的结果；
+相邻的同类删除操作合并为集合SQL（id IN (...)），相邻的边更新一次性解析名称
+
+支持的操作:
+    {"op": "rename_node", "old_name": ..., "new_name": ...}   新名称已存在时自动合并
+    {"op": "merge_nodes", "old_name": ..., "new_name": ...}   将 old_name 合并到已存在的 new_name
+    {"op": "delete_node", "name": ...}
+    {"op": "update_edge", "id": ..., "head_entity": ..., "relation": ..., "tail_entity": ...}
+    {"op": "delete_edge", "id": ...}
+"""
+import logging
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from triple_store import get_triple_store
+from repositories import get_high_level_node_repository
+from storage import INTEGRITY_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# 单次请求允许的最大操作数
+MAX_BATCH_OPERATIONS = 10000
+
+OPERATION_FIELDS = {
+    "rename_node": ("old_name", "new_name"),
+    "merge_nodes": ("old_name", "new_name"),
+    "delete_node": ("name",),
+    "update_edge": ("id", "head_entity", "relation", "tail_entity"),
+    "delete_edge": ("id",),
+}
+
+# 相邻的同类操作合并执行
+GROUPED_OPERATIONS = {"delete_node", "delete_edge", "update_edge"}
+
+# 单个边更新的保存点，唯一键冲突时只回滚该操作
+EDGE_SAVEPOINT = "batch_edit_edge"
+
+STATUS_OK = "ok"
+STATUS_NOT_FOUND = "not_found"
+STATUS_CONFLICT = "conflict"
+STATUS_INVALID = "invalid"
+
+
+def _validate(operation: Dict[str, Any]) -> Optional[str]:
+    """检查操作类型和必填字段，返回错误信息"""
+    fields = OPERATION_FIELDS.get(operation.get("op"))
+    if fields is None:
+        return f"不支持的操作类型: {operation.get('op')}"
+    missing = [field for field in fields if operation.get(field) in (None, "")]
+    if missing:
+        return f"缺少字段: {', '.join(missing)}"
+    if operation["op"] in ("rename_node", "merge_nodes") and operation["old_name"] == operation["new_name"]:
+        return "新旧名称相同"
+    return None
+
+
+class BatchEditor:
+    """在同一连接、同一事务中执行一批编辑操作"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.store = get_triple_store()
+        self.high_level_nodes = get_high_level_node_repository()
+        # 已执行操作产生的图谱变更，提交后统一发布
+        self.changes: List[Dict[str, Any]] = []
+
+    # ---------- 节点 ----------
+
+    def delete_nodes(self, operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        names = [operation["name"] for operation in operations]
+        deleted = self.store.delete_entities(self.cursor, names)
+        self.high_level_nodes.remove_many(self.cursor, names)
+
+        results = []
+        done = set()
+        for name in names:
+            edge_ids = deleted[name] if name not in done else []
+            done.add(name)
+            if not edge_ids:
+                results.append({"status": STATUS_NOT_FOUND, "message": f"节点 '{name}' 不存在"})
+                continue
+            self.changes.append({"op": "delete_node", "name": name, "edge_ids": edge_ids})
+            results.append({"status": STATUS_OK, "deleted_count": len(edge_ids)})
+        return results
+
+    def rename_node(self, operation: Dict[str, Any]) -> Dict[str, Any]:
+        old_name, new_name = operation["old_name"], operation["new_name"]
+        if operation["op"] == "merge_nodes" and not self.store.entity_exists(self.cursor, new_name):
+            return {"status": STATUS_NOT_FOUND, "message": f"合并目标 '{new_name}' 不存在"}
+
+        updated_count, merged_ids = self.store.rename_entity(self.cursor, old_name, new_name)
+        if updated_count == 0 and not merged_ids:
+            return {"status": STATUS_NOT_FOUND, "message": f"节点 '{old_name}' 不存在"}
+        self.high_level_nodes.rename(self.cursor, old_name, new_name)
+
+        self.changes.extend({"op": "delete_edge", "edge_id": edge_id} for edge_id in merged_ids)
+        self.changes.append({"op": "rename_node", "old_name": old_name, "new_name": new_name})
+        return {"status": STATUS_OK, "updated_count": updated_count, "merged_count": len(merged_ids)}
+
+    # ---------- 边 ----------
+
+    def delete_edges(self, operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        deleted = set(self.store.delete_triples(self.cursor, [operation["id"] for operation in operations]))
+
+        results = []
+        for operation in operations:
+            edge_id = operation["id"]
+            if edge_id not in deleted:
+                results.append({"status": STATUS_NOT_FOUND, "message": f"边 {edge_id} 不存在"})
+                continue
+            deleted.discard(edge_id)
+            self.changes.append({"op": "delete_edge", "edge_id": edge_id})
+            results.append({"status": STATUS_OK})
+        return results
+
+    def update_edges(self, operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # 先一次性写入新名称：保存点回滚时字典项保留，名称缓存不会失效
+        self.store.intern_triples(
+            self.cursor,
+            [(operation["head_entity"], operation["relation"], operation["tail_entity"]) for operation in operations]
+        )
+
+        results = []
+        for operation in operations:
+            self.cursor.execute(f"SAVEPOINT {EDGE_SAVEPOINT}")
+            try:
+                updated = self.store.update_triple(
+                    self.cursor, operation["id"],
+                    operation["head_entity"], operation["relation"], operation["tail_entity"]
+                )
+            except INTEGRITY_ERRORS:
+                self.cursor.execute(f"ROLLBACK TO SAVEPOINT {EDGE_SAVEPOINT}")
+                self.cursor.execute(f"RELEASE SAVEPOINT {EDGE_SAVEPOINT}")
+                results.append({"status": STATUS_CONFLICT, "message": "相同的三元组已存在"})
+                continue
+            self.cursor.execute(f"RELEASE SAVEPOINT {EDGE_SAVEPOINT}")
+
+            if updated == 0:
+                results.append({"status": STATUS_NOT_FOUND, "message": f"边 {operation['id']} 不存在"})
+                continue
+            self.changes.append({
+                "op": "update_edge",
+                "edge": {
+                    "id": operation["id"],
+                    "source": operation["head_entity"],
+                    "target": operation["tail_entity"],
+                    "value": operation["relation"]
+                }
+            })
+            results.append({"status": STATUS_OK})
+        return results
+
+    # ---------- 执行 ----------
+
+    def _run_group(self, op: str, operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if op == "delete_node":
+            return self.delete_nodes(operations)
+        if op == "delete_edge":
+            return self.delete_edges(operations)
+        return self.update_edges(operations)
+
+    def apply(self, operations: List[Dict[str, Any]], atomic: bool = True) -> Dict[str, Any]:
+        """
+        执行一批操作
+
+        Args:
+            operations: 操作列表
+            atomic: 为True时任一操作未成功（不存在、冲突、无效）即回滚整批；
+                    为False时提交所有成功的操作
+
+        Returns:
+            {applied, results: [{index, op, status, ...}], summary: {status: 数量}}
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(operations)
+        for index, operation in enumerate(operations):
+            error = _validate(operation)
+            if error:
+                results[index] = {"status": STATUS_INVALID, "message": error}
+
+        self.conn.begin()
+        try:
+            index = 0
+            while index < len(operations):
+                if results[index] is not None:
+                    index += 1
+                    continue
+                op = operations[index]["op"]
+                if op not in GROUPED_OPERATIONS:
+                    results[index] = self.rename_node(operations[index])
+                    index += 1
+                    continue
+
+                # 收集相邻的同类有效操作
+                group = []
+                while index < len(operations) and (results[index] is not None or operations[index]["op"] == op):
+                    if results[index] is None:
+                        group.append(index)
+                    index += 1
+                for position, result in zip(group, self._run_group(op, [operations[i] for i in group])):
+                    results[position] = result
+
+            for index, operation in enumerate(operations):
+                results[index] = {"index": index, "op": operation.get("op"), **results[index]}
+            summary = dict(Counter(result["status"] for result in results))
+            applied = not atomic or summary.get(STATUS_OK, 0) == len(operations)
+            if applied:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+                self.changes = []
+        except Exception:
+            self.conn.rollback()
+            raise
+
+        logger.info(f"批量编辑: {len(operations)} 项操作, {summary}, {'已提交' if applied else '已回滚'}")
+        return {"applied": applied, "results": results, "summary": summary}
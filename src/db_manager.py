@@ -5,7 +5,14 @@ MySQL数据库管理器
 
 import pymysql
 from pymysql.cursors import DictCursor
-from typing import List, Dict, Any, Optional
+from typing import Any, Callable, Dict, List, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import asyncio
+import functools
+import threading
+import time
 import logging
 
 # 配置日志
@@ -13,6 +20,51 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+class TransactionConnection(pymysql.connections.Connection):
+    """
+    支持提交后回调的 pymysql 连接（用法与 storage.SQLiteConnection 一致）
+
+    pymysql 无法得知当前事务是否写入过数据，由写入方调用 defer_after_commit 标记；
+    标记之后登记的回调推迟到事务提交后执行，回滚时丢弃
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._after_commit: List[Callable[[], None]] = []
+        self._deferring = False
+        super().__init__(*args, **kwargs)
+
+    def defer_after_commit(self):
+        """当前事务写入了提交前不应进入缓存的数据，此后的 after_commit 回调推迟到提交后"""
+        self._deferring = True
+
+    def after_commit(self, callback: Callable[[], None]):
+        """当前事务提交后执行回调；事务未标记时立即执行"""
+        if self._deferring:
+            self._after_commit.append(callback)
+        else:
+            callback()
+
+    def _run_after_commit(self):
+        callbacks, self._after_commit = self._after_commit, []
+        self._deferring = False
+        for callback in callbacks:
+            callback()
+
+    def begin(self):
+        # BEGIN 会隐式提交未结束的事务
+        super().begin()
+        self._run_after_commit()
+
+    def commit(self):
+        super().commit()
+        self._run_after_commit()
+
+    def rollback(self):
+        self._after_commit = []
+        self._deferring = False
+        super().rollback()
+
+
 class DBManager:
     """MySQL数据库管理器类"""
     
@@ -34,6 +86,8 @@ class DBManager:
         self.password = password
         self.database = database
         self.connection = None
+        self.connected_at = 0.0  # 建立连接的时间
+        self.released_at = 0.0   # 最近一次归还连接池的时间
         
     def connect(self) -> bool:
         """
@@ -43,7 +97,7 @@ class DBManager:
             bool: 连接成功返回True，失败返回False
         """
         try:
-            self.connection = pymysql.connect(
+            self.connection = TransactionConnection(
                 host=self.host,
                 port=self.port,
                 user=self.user,
@@ -53,11 +107,13 @@ class DBManager:
                 cursorclass=DictCursor,
                 autocommit=False
             )
+            self.connected_at = time.time()
             logger.info(f"成功连接到数据库: {self.database}@{self.host}:{self.port}")
             return True
         except pymysql.Error as e:
             logger.error(f"数据库连接失败: {e}")
             return False
+    
     def disconnect(self):
         """断开数据库连接"""
         if self.connection:
@@ -73,6 +129,254 @@ class DBManager:
             bool: 已连接返回True，否则返回False
         """
         return self.connection is not None and self.connection.open
+    
+    def ping(self) -> bool:
+        """
+        检查连接是否仍然可用（不自动重连）
+        
+        Returns:
+            bool: 可用返回True，否则返回False
+        """
+        if not self.is_connected():
+            return False
+        try:
+            self.connection.ping(reconnect=False)
+            return True
+        except pymysql.Error as e:
+            logger.warning(f"数据库连接检测失败: {e}")
+            return False
+
+
+class PoolTimeoutError(Exception):
+    """在等待时间内未能从连接池获取连接"""
+
+
+class ConnectionPool:
+    """
+    基于 DBManager 的有界MySQL连接池
+    
+    借出前对空闲超过 ping_after_idle 秒的连接执行 ping，超过 max_lifetime 的连接在借出或归还时关闭重建；
+    归还时回滚未提交的事务，保证下一个使用者拿到干净的连接
+    """
+    
+    def __init__(self, db_config: Dict[str, Any], max_size: int = 10, acquire_timeout: float = 10.0,
+                 max_lifetime: float = 3600.0, ping_after_idle: float = 0.0):
+        """
+        初始化连接池（连接按需创建）
+        
+        Args:
+            db_config: 数据库配置（host/port/user/password/database）
+            max_size: 最大连接数
+            acquire_timeout: 获取连接的最长等待时间（秒）
+            max_lifetime: 单个连接的最长存活时间（秒）
+            ping_after_idle: 空闲超过该时间（秒）的连接借出前先 ping，0 表示每次借出都 ping
+        """
+        self.db_config = {
+            key: db_config[key]
+            for key in ("host", "port", "user", "password", "database")
+            if key in db_config
+        }
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_lifetime = max_lifetime
+        self.ping_after_idle = ping_after_idle
+        
+        self._idle: deque = deque()
+        self._size = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self._stats = {"created": 0, "discarded": 0, "timeouts": 0, "borrowed": 0}
+    
+    def _expired(self, manager: DBManager) -> bool:
+        return time.time() - manager.connected_at > self.max_lifetime
+    
+    def _discard(self, manager: DBManager):
+        """关闭连接并释放名额（调用方不持有锁）"""
+        try:
+            manager.disconnect()
+        except Exception:
+            pass
+        with self._condition:
+            self._size -= 1
+            self._stats["discarded"] += 1
+            self._condition.notify()
+    
+    def acquire(self, timeout: Optional[float] = None) -> DBManager:
+        """
+        借出一个可用连接
+        
+        Args:
+            timeout: 等待时间（秒），默认使用 acquire_timeout
+            
+        Returns:
+            DBManager: 已连接的数据库管理器
+            
+        Raises:
+            PoolTimeoutError: 超时仍无可用连接
+        """
+        deadline = time.monotonic() + (self.acquire_timeout if timeout is None else timeout)
+        while True:
+            manager = None
+            create = False
+            with self._condition:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("连接池已关闭")
+                    if self._idle:
+                        manager = self._idle.pop()  # 后进先出，优先复用最近使用的连接
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeoutError(f"获取数据库连接超时（连接池上限 {self.max_size}）")
+                    self._condition.wait(remaining)
+            
+            if create:
+                manager = DBManager(**self.db_config)
+                if not manager.connect():
+                    with self._condition:
+                        self._size -= 1
+                        self._condition.notify()
+                    raise pymysql.err.OperationalError(f"无法连接数据库: {self.db_config.get('host')}")
+                with self._condition:
+                    self._stats["created"] += 1
+                    self._stats["borrowed"] += 1
+                return manager
+            
+            if self._expired(manager):
+                self._discard(manager)
+                continue
+            if time.time() - manager.released_at >= self.ping_after_idle and not manager.ping():
+                self._discard(manager)
+                continue
+            with self._condition:
+                self._stats["borrowed"] += 1
+            return manager
+    
+    def release(self, manager: DBManager, discard: bool = False):
+        """
+        归还连接
+        
+        Args:
+            manager: acquire 借出的数据库管理器
+            discard: 为True时直接关闭（如连接已出错）
+        """
+        if not discard and manager.is_connected():
+            try:
+                manager.connection.rollback()
+            except pymysql.Error:
+                discard = True
+        else:
+            discard = True
+        
+        if discard or self._closed or self._expired(manager):
+            self._discard(manager)
+            return
+        
+        manager.released_at = time.time()
+        with self._condition:
+            self._idle.append(manager)
+            self._condition.notify()
+    
+    @contextmanager
+    def connection(self):
+        """借用连接的上下文管理器，退出时自动归还（未提交的事务会被回滚）"""
+        manager = self.acquire()
+        discard = False
+        try:
+            yield manager.connection
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.release(manager, discard)
+    
+    def stats(self) -> Dict[str, Any]:
+        """连接池状态统计"""
+        with self._condition:
+            return {
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                **self._stats
+            }
+    
+    def close(self):
+        """关闭所有空闲连接，借出中的连接归还时关闭"""
+        with self._condition:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._condition.notify_all()
+        for manager in idle:
+            self._discard(manager)
+        logger.info("数据库连接池已关闭")
+
+
+# 全局连接池实例，以及执行阻塞数据库调用的专用线程池（线程数与连接数上限一致）
+db_pool = None
+db_executor = None
+
+
+def init_db_pool(db_config: Dict[str, Any], **pool_options) -> ConnectionPool:
+    """
+    初始化全局连接池
+    
+    Args:
+        db_config: 数据库配置
+        **pool_options: ConnectionPool 的其他参数
+    """
+    global db_pool
+    
+    if db_pool is not None:
+        db_pool.close()
+    db_pool = ConnectionPool(db_config, **pool_options)
+    logger.info(f"数据库连接池初始化完成，最大连接数 {db_pool.max_size}")
+    return db_pool
+
+
+def init_db_executor(max_workers: int) -> ThreadPoolExecutor:
+    """
+    初始化数据库线程池（线程数应与存储后端的连接数上限一致）
+    
+    Args:
+        max_workers: 最大线程数
+    """
+    global db_executor
+    
+    if db_executor is not None:
+        db_executor.shutdown(wait=False)
+    db_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+    return db_executor
+
+
+def get_db_pool() -> ConnectionPool:
+    """获取全局连接池实例"""
+    if db_pool is None:
+        raise RuntimeError("数据库连接池未初始化")
+    return db_pool
+
+
+async def run_db(func, *args, **kwargs):
+    """
+    在数据库线程池中执行阻塞调用，避免阻塞事件循环
+    
+    Args:
+        func: 阻塞函数（内部自行借用连接，或读取快照等可能触发数据库加载的调用）
+        *args, **kwargs: 传给 func 的参数
+        
+    Returns:
+        func 的返回值
+    """
+    if db_executor is None:
+        raise RuntimeError("数据库线程池未初始化")
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, functools.partial(func, *args, **kwargs))
 
 
 # 使用示例
@@ -0,0 +1,424 @@
+"""
+实体向量索引
+为图谱中的每个实体保存其在自定义/备用 Word2Vec 模型中的归一化向量，
+启动时根据图谱快照构建一次，之后通过图谱变更日志原地增量维护；
+多词实体名（不在词汇表中）使用 jieba 分词后各词向量的均值，计算一次后缓存
+（只缓存图谱中的实体，查询词每次计算）；加载的是服务模型时实体行同样以量化表示保存并直接评分；
+图谱中本身在词汇表中的实体名加入分词词典（与训练时加入专业词汇的做法一致），
+使“松材线虫病”切分为“松材线虫 / 病”而不是“松材 / 线虫病”
+"""
+import logging
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from graph_cache import GraphSnapshot, get_graph_snapshot_cache
+from serving_model import quantize, score_codes
+
+logger = logging.getLogger(__name__)
+
+try:
+    import jieba
+except ImportError:  # jieba为可选依赖，未安装时多词实体名视为不在词汇表中
+    jieba = None
+
+MODEL_CUSTOM = "custom"
+MODEL_FALLBACK = "fallback"
+
+VECTOR_DIRECT = "direct"        # 实体名本身在词汇表中
+VECTOR_COMPOSED = "composed"    # 分词后各词向量的均值
+VECTOR_OOV = "oov"              # 无法得到向量
+
+# 不在词汇表中的实体的相似度（与 ai_service.OUT_OF_VOCABULARY_SIMILARITY 相同）
+OOV_SIMILARITY = 0.1
+
+INITIAL_CAPACITY = 1024
+
+
+def _normalized(vector: np.ndarray) -> Optional[np.ndarray]:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else None
+
+
+class _ModelVectors:
+    """
+    一个模型下的实体向量矩阵（按行存放，删除的行放入空闲列表复用）
+
+    服务模型（serving_model.CompactKeyedVectors）的实体行同样以 int8 / float16 加缩放系数保存，
+    评分直接在量化表示上计算
+    """
+
+    def __init__(self, name: str, model, previous: Optional["_ModelVectors"] = None):
+        """
+        Args:
+            name: 模型名称（custom / fallback）
+            model: gensim KeyedVectors 或 CompactKeyedVectors
+            previous: 同一模型重建前的实例，已有实体的向量行直接复制，不重新计算
+        """
+        self.name = name
+        self.model = model
+        codes = getattr(model, "codes", None)
+        self.dtype = codes.dtype if codes is not None else np.dtype(np.float32)
+        self.vectors = np.zeros((INITIAL_CAPACITY, model.vector_size), dtype=self.dtype)
+        # 量化行的缩放系数（float32 行不使用）
+        self.scales = np.ones(INITIAL_CAPACITY, dtype=np.float32)
+        self.active = np.zeros(INITIAL_CAPACITY, dtype=bool)
+        self.row_names: List[Optional[str]] = [None] * INITIAL_CAPACITY
+        self.rows: Dict[str, int] = {}
+        self.free: List[int] = []
+        self.size = 0
+        # 实体名 -> 向量来源，实体删除时移除；有向量的实体向量只保存在矩阵行中
+        self._sources: Dict[str, str] = {}
+        self.previous = previous if previous is not None and previous.model is model else None
+
+    @property
+    def quantized(self) -> bool:
+        return self.dtype != np.float32
+
+    def _row_vector(self, row: int) -> np.ndarray:
+        if not self.quantized:
+            return self.vectors[row]
+        return self.vectors[row].astype(np.float32) * self.scales[row]
+
+    def resolve(self, name: str, tokenizer=None) -> Tuple[Optional[np.ndarray], str]:
+        """
+        名称在本模型中的归一化向量及来源（direct / composed / oov）
+
+        已加入的实体直接取矩阵行，其他名称（查询词）每次计算，不进入缓存
+
+        Args:
+            name: 实体名或查询词
+            tokenizer: jieba 分词器，None 时不做分词组合
+        """
+        source = self._sources.get(name)
+        if source is not None:
+            row = self.rows.get(name)
+            return (self._row_vector(row) if row is not None else None), source
+
+        key_to_index = self.model.key_to_index
+        index = key_to_index.get(name)
+        if index is not None:
+            return _normalized(self.model.vectors[index]), VECTOR_DIRECT
+        if tokenizer is not None:
+            indices = [key_to_index[token] for token in tokenizer.lcut(name) if token in key_to_index]
+            if indices:
+                return _normalized(self.model.vectors[indices].mean(axis=0)), VECTOR_COMPOSED
+        return None, VECTOR_OOV
+
+    def add(self, name: str, tokenizer=None) -> str:
+        """加入实体，返回向量来源"""
+        if name in self._sources:
+            return self._sources[name]
+        previous = self.previous
+        if previous is not None and name in previous._sources:
+            source = previous._sources[name]
+            row = previous.rows.get(name)
+            vector = None if row is None else (previous.vectors[row], previous.scales[row])
+        else:
+            vector, source = self.resolve(name, tokenizer)
+            if vector is not None and self.quantized:
+                codes, scales = quantize(vector[None, :], self.dtype.name)
+                vector = (codes[0], scales[0])
+            elif vector is not None:
+                vector = (vector, 1.0)
+        self._sources[name] = source
+        if vector is None:
+            return VECTOR_OOV
+        if self.free:
+            row = self.free.pop()
+        else:
+            if self.size == len(self.active):
+                self._grow()
+            row = self.size
+            self.size += 1
+        self.vectors[row], self.scales[row] = vector
+        self.active[row] = True
+        self.row_names[row] = name
+        self.rows[name] = row
+        return source
+
+    def remove(self, name: str):
+        self._sources.pop(name, None)
+        row = self.rows.pop(name, None)
+        if row is None:
+            return
+        self.active[row] = False
+        self.row_names[row] = None
+        self.free.append(row)
+
+    def _grow(self):
+        capacity = len(self.active) * 2
+        vectors = np.zeros((capacity, self.vectors.shape[1]), dtype=self.dtype)
+        vectors[:self.size] = self.vectors[:self.size]
+        scales = np.ones(capacity, dtype=np.float32)
+        scales[:self.size] = self.scales[:self.size]
+        active = np.zeros(capacity, dtype=bool)
+        active[:self.size] = self.active[:self.size]
+        self.vectors = vectors
+        self.scales = scales
+        self.active = active
+        self.row_names.extend([None] * (capacity - len(self.row_names)))
+
+    def top_k(self, query: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        """与查询向量余弦相似度最高的k个实体（只含有向量的实体）"""
+        if k <= 0 or not self.rows:
+            return []
+        if self.quantized:
+            scores = score_codes(self.vectors[:self.size], self.scales[:self.size], query)
+        else:
+            scores = self.vectors[:self.size] @ query
+        scores[~self.active[:self.size]] = -np.inf
+        k = min(k, len(self.rows))
+        top = np.argpartition(-scores, k - 1)[:k] if k < self.size else np.arange(self.size)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.row_names[row], float(scores[row])) for row in top if self.active[row]][:k]
+
+
+class EntityEmbeddingIndex:
+    """实体向量索引（进程级，随图谱变更增量更新）"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._ready = False
+        self.version = 0
+        self._models: List[_ModelVectors] = []
+        # 独立的分词器实例，加入的实体名词汇不影响全局 jieba 词典
+        self._tokenizer = jieba.Tokenizer() if jieba is not None else None
+        self._dictionary_words: Set[str] = set()
+        # 维护实体集合所需的边信息: 边ID -> (头实体, 尾实体)，实体 -> 边ID集合
+        self._edges: Dict[int, Tuple[str, str]] = {}
+        self._entity_edges: Dict[str, Set[int]] = defaultdict(set)
+        # 实体 -> (提供向量的模型, 向量来源)；两个模型都无法得到向量时模型为None
+        self._entities: Dict[str, Tuple[Optional[str], str]] = {}
+
+    @property
+    def ready(self) -> bool:
+        """索引是否可用（尚未构建或收到 reload 变更后为False）"""
+        return self._ready
+
+    def __len__(self) -> int:
+        return len(self._entities)
+
+    def entity_names(self) -> List[str]:
+        """图谱中的所有实体名称"""
+        with self._lock:
+            return list(self._entities)
+
+    def describe(self, name: str) -> Optional[Dict[str, Any]]:
+        """实体的向量信息 {model, source, oov}，实体不在图谱中时返回None"""
+        entry = self._entities.get(name)
+        if entry is None:
+            return None
+        model, source = entry
+        return {"model": model, "source": source, "oov": model is None}
+
+    # ---------- 构建与增量维护 ----------
+
+    def rebuild(self, snapshot: GraphSnapshot):
+        """
+        根据图谱快照全量重建实体集合，并补齐快照之后已提交的变更
+
+        仍在图谱中的实体沿用已计算的向量（含分词组合向量），不重新计算
+
+        Args:
+            snapshot: 图谱快照
+        """
+        from ai_service import get_word2vec_service
+
+        service = get_word2vec_service()
+        with self._lock:
+            previous = {model_vectors.name: model_vectors for model_vectors in self._models}
+            self._models = []
+            for name, model in ((MODEL_CUSTOM, service.model), (MODEL_FALLBACK, service.fallback_model)):
+                if model is None:
+                    continue
+                self._models.append(_ModelVectors(name, model, previous.get(name)))
+
+            self._edges = {}
+            self._entity_edges = defaultdict(set)
+            self._entities = {}
+            # 先登记分词词典，组合向量的分词结果与实体加入的顺序无关
+            for _, head, _, tail in snapshot.triples:
+                self._register_word(head)
+                self._register_word(tail)
+            for triple_id, head, _, tail in snapshot.triples:
+                self._add_edge(triple_id, head, tail)
+
+            self.version = snapshot.version
+            self._ready = True
+            self._catch_up()
+            for model_vectors in self._models:
+                model_vectors.previous = None
+            sources = Counter(source for _, source in self._entities.values())
+            logger.info(
+                f"实体向量索引构建完成: 版本 {self.version}, {len(self._entities)} 个实体, "
+                f"模型 {[model_vectors.name for model_vectors in self._models]}, 向量来源 {dict(sources)}"
+            )
+
+    def _catch_up(self) -> bool:
+        """从变更日志补齐当前版本之后的变更，日志不完整时标记索引需要重建"""
+        _, changes = get_graph_snapshot_cache().changes_since(self.version)
+        if changes is None:
+            self._ready = False
+            return False
+        self._apply(changes)
+        return True
+
+    def on_changes(self, changes: List[Dict[str, Any]]):
+        """图谱变更监听回调"""
+        if not changes:
+            return
+        with self._lock:
+            if not self._ready:
+                return
+            version = changes[0]["version"]
+            if version <= self.version:
+                return
+            if version > self.version + 1:
+                # 并发写入导致批次乱序，从日志补齐
+                self._catch_up()
+                return
+            self._apply(changes)
+
+    def _apply(self, changes: List[Dict[str, Any]]):
+        if not changes:
+            return
+        for change in changes:
+            op = change["op"]
+            if op in ("add_edge", "update_edge"):
+                edge = change["edge"]
+                self._add_edge(edge["id"], edge["source"], edge["target"])
+            elif op == "delete_edge":
+                self._remove_edge(change["edge_id"])
+            elif op == "delete_node":
+                for edge_id in change.get("edge_ids", []):
+                    self._remove_edge(edge_id)
+            elif op == "rename_node":
+                self._rename(change["old_name"], change["new_name"])
+            elif op == "reload":
+                self._ready = False
+                return
+        self.version = max(self.version, changes[-1]["version"])
+
+    def _register_word(self, name: str):
+        """在词汇表中的实体名加入分词词典"""
+        if self._tokenizer is None or name in self._dictionary_words:
+            return
+        if any(name in model_vectors.model.key_to_index for model_vectors in self._models):
+            self._tokenizer.add_word(name)
+            # 调高词频，保证实体名在更长的名称中也能整体切出
+            self._tokenizer.suggest_freq(name, tune=True)
+            self._dictionary_words.add(name)
+
+    def _add_entity(self, name: str):
+        self._register_word(name)
+        provider, provider_source = None, VECTOR_OOV
+        for model_vectors in self._models:
+            source = model_vectors.add(name, self._tokenizer)
+            if provider is None and source != VECTOR_OOV:
+                provider, provider_source = model_vectors.name, source
+        self._entities[name] = (provider, provider_source)
+
+    def _remove_entity(self, name: str):
+        for model_vectors in self._models:
+            model_vectors.remove(name)
+        self._entities.pop(name, None)
+
+    def _add_edge(self, edge_id: int, head: str, tail: str):
+        # 快照加载可能已包含其后的写入，重复应用时先移除旧边保证幂等
+        self._remove_edge(edge_id)
+        self._edges[edge_id] = (head, tail)
+        for name in (head, tail):
+            edges = self._entity_edges[name]
+            if not edges:
+                self._add_entity(name)
+            edges.add(edge_id)
+
+    def _remove_edge(self, edge_id: int):
+        endpoints = self._edges.pop(edge_id, None)
+        if endpoints is None:
+            return
+        for name in set(endpoints):
+            edges = self._entity_edges.get(name)
+            if edges is None:
+                continue
+            edges.discard(edge_id)
+            if not edges:
+                del self._entity_edges[name]
+                self._remove_entity(name)
+
+    def _rename(self, old_name: str, new_name: str):
+        for edge_id in list(self._entity_edges.get(old_name, ())):
+            head, tail = self._edges[edge_id]
+            self._add_edge(
+                edge_id,
+                new_name if head == old_name else head,
+                new_name if tail == old_name else tail
+            )
+
+    # ---------- 查询 ----------
+
+    def resolve_query(self, word: str) -> Tuple[Optional[str], Optional[np.ndarray], str]:
+        """
+        选择查询词使用的模型：依次尝试自定义模型、备用模型
+
+        Returns:
+            (模型名称, 归一化查询向量, 向量来源)；都无法得到向量时模型名称为None
+        """
+        with self._lock:
+            for model_vectors in self._models:
+                vector, source = model_vectors.resolve(word, self._tokenizer)
+                if vector is not None:
+                    return model_vectors.name, vector, source
+        return None, None, VECTOR_OOV
+
+    def most_similar(self, word: str, topn: int = 10) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        """
+        图谱中与输入词最相似的实体
+
+        在查询词所用模型中没有向量的实体相似度为固定的低值
+
+        Args:
+            word: 输入词
+            topn: 返回数量
+
+        Returns:
+            (使用的模型名称, [{entity, similarity, vector}])；查询词在所有模型中都无法得到向量时返回 (None, [])
+        """
+        with self._lock:
+            model_name, query, _ = self.resolve_query(word)
+            if model_name is None:
+                return None, []
+            model_vectors = next(item for item in self._models if item.name == model_name)
+
+            results = [(name, score, VECTOR_DIRECT) for name, score in model_vectors.top_k(query, topn)]
+            if len(results) < topn or results[-1][1] < OOV_SIMILARITY:
+                oov = []
+                for name in self._entities:
+                    if name not in model_vectors.rows:
+                        oov.append((name, OOV_SIMILARITY, VECTOR_OOV))
+                        if len(oov) >= topn:
+                            break
+                results = sorted(results + oov, key=lambda item: -item[1])[:topn]
+
+            return model_name, [
+                {
+                    "entity": name,
+                    "similarity": score,
+                    "vector": model_vectors.resolve(name, self._tokenizer)[1] if source != VECTOR_OOV else VECTOR_OOV
+                }
+                for name, score, source in results
+            ]
+
+
+# 全局索引实例，注册为图谱变更监听者
+entity_embedding_index = EntityEmbeddingIndex()
+get_graph_snapshot_cache().add_listener(entity_embedding_index.on_changes)
+
+
+def get_entity_embedding_index() -> EntityEmbeddingIndex:
+    """获取实体向量索引实例"""
+    return entity_embedding_index
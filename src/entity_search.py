@@ -0,0 +1,296 @@
+"""
+实体名称自动补全索引
+在内存中维护实体名的有序列表（前缀查询）和字符 n-gram 倒排索引（子串/模糊查询），
+通过图谱变更日志增量更新，无需每次查询扫描数据库
+"""
+import bisect
+import heapq
+import logging
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Set, Tuple
+
+from graph_cache import GraphSnapshot, get_graph_snapshot_cache
+
+logger = logging.getLogger(__name__)
+
+# 模糊匹配的最低 Dice 相似度
+FUZZY_MIN_SCORE = 0.4
+# 匹配类型得分：完全匹配 > 前缀 > 子串 > 模糊（模糊得分为 Dice 相似度，小于1）
+MATCH_SCORES = {"exact": 4.0, "prefix": 3.0, "substring": 2.0}
+
+
+def _normalize(text: str) -> str:
+    return text.strip().lower()
+
+
+def _bigrams(text: str) -> Set[str]:
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class EntityNameIndex:
+    """实体名称补全索引（进程级，随图谱变更增量更新）"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._ready = False
+        self.version = 0
+        # 规范化名称有序列表，用于前缀二分查找
+        self._sorted_keys: List[str] = []
+        # 规范化名称 -> 原始名称集合
+        self._names: Dict[str, Set[str]] = defaultdict(set)
+        # 单字 / 二元组倒排索引: gram -> 规范化名称集合
+        self._unigrams: Dict[str, Set[str]] = defaultdict(set)
+        self._bigrams: Dict[str, Set[str]] = defaultdict(set)
+        # 维护度数所需的边信息: 边ID -> (头实体, 尾实体)，实体 -> 边ID集合
+        self._edges: Dict[int, Tuple[str, str]] = {}
+        self._entity_edges: Dict[str, Set[int]] = defaultdict(set)
+        self._degree: Counter = Counter()
+        self._high_level: Set[str] = set()
+
+    @property
+    def ready(self) -> bool:
+        """索引是否可用（尚未构建或收到 reload 变更后为False）"""
+        return self._ready
+
+    def __len__(self) -> int:
+        return len(self._degree)
+
+    # ---------- 构建与增量维护 ----------
+
+    def rebuild(self, snapshot: GraphSnapshot):
+        """
+        根据图谱快照全量重建索引，并补齐快照之后已提交的变更
+
+        Args:
+            snapshot: 图谱快照
+        """
+        with self._lock:
+            self._sorted_keys = []
+            self._names = defaultdict(set)
+            self._unigrams = defaultdict(set)
+            self._bigrams = defaultdict(set)
+            self._edges = {}
+            self._entity_edges = defaultdict(set)
+            self._degree = Counter()
+            self._high_level = set(snapshot.high_level_nodes)
+
+            for triple_id, head, _, tail in snapshot.triples:
+                self._edges[triple_id] = (head, tail)
+                self._entity_edges[head].add(triple_id)
+                self._entity_edges[tail].add(triple_id)
+                self._degree[head] += 1
+                self._degree[tail] += 1
+            for name in self._degree:
+                self._index_name(name, sort=False)
+            self._sorted_keys.sort()
+
+            self.version = snapshot.version
+            self._ready = True
+            self._catch_up()
+            logger.info(f"实体补全索引构建完成: 版本 {self.version}, {len(self._degree)} 个实体")
+
+    def _catch_up(self) -> bool:
+        """从变更日志补齐当前版本之后的变更，日志不完整时标记索引需要重建"""
+        _, changes = get_graph_snapshot_cache().changes_since(self.version)
+        if changes is None:
+            self._ready = False
+            return False
+        self._apply(changes)
+        return True
+
+    def on_changes(self, changes: List[Dict[str, Any]]):
+        """图谱变更监听回调"""
+        if not changes:
+            return
+        with self._lock:
+            if not self._ready:
+                return
+            version = changes[0]["version"]
+            if version <= self.version:
+                return
+            if version > self.version + 1:
+                # 并发写入导致批次乱序，从日志补齐
+                self._catch_up()
+                return
+            self._apply(changes)
+
+    def _apply(self, changes: List[Dict[str, Any]]):
+        if not changes:
+            return
+        for change in changes:
+            op = change["op"]
+            if op == "add_edge":
+                edge = change["edge"]
+                self._add_edge(edge["id"], edge["source"], edge["target"])
+            elif op == "update_edge":
+                edge = change["edge"]
+                self._add_edge(edge["id"], edge["source"], edge["target"])
+            elif op == "delete_edge":
+                self._remove_edge(change["edge_id"])
+            elif op == "delete_node":
+                for edge_id in change.get("edge_ids", []):
+                    self._remove_edge(edge_id)
+            elif op == "rename_node":
+                self._rename(change["old_name"], change["new_name"])
+            elif op == "set_high_level":
+                if change.get("high_level"):
+                    self._high_level.add(change["name"])
+                else:
+                    self._high_level.discard(change["name"])
+            elif op == "reload":
+                self._ready = False
+                return
+        self.version = max(self.version, changes[-1]["version"])
+
+    def _add_edge(self, edge_id: int, head: str, tail: str):
+        # 快照加载可能已包含其后的写入，重复应用时先移除旧边保证幂等
+        self._remove_edge(edge_id)
+        self._edges[edge_id] = (head, tail)
+        for name in (head, tail):
+            self._entity_edges[name].add(edge_id)
+            self._degree[name] += 1
+            if self._degree[name] == 1:
+                self._index_name(name)
+
+    def _remove_edge(self, edge_id: int):
+        endpoints = self._edges.pop(edge_id, None)
+        if endpoints is None:
+            return
+        for name in set(endpoints):
+            edges = self._entity_edges.get(name)
+            if edges is not None:
+                edges.discard(edge_id)
+                if not edges:
+                    del self._entity_edges[name]
+        for name in endpoints:
+            self._degree[name] -= 1
+            if self._degree[name] <= 0:
+                del self._degree[name]
+                self._unindex_name(name)
+
+    def _rename(self, old_name: str, new_name: str):
+        for edge_id in list(self._entity_edges.get(old_name, ())):
+            head, tail = self._edges[edge_id]
+            self._add_edge(
+                edge_id,
+                new_name if head == old_name else head,
+                new_name if tail == old_name else tail
+            )
+        if old_name in self._high_level:
+            self._high_level.discard(old_name)
+            self._high_level.add(new_name)
+
+    def _index_name(self, name: str, sort: bool = True):
+        key = _normalize(name)
+        if not self._names[key]:
+            if sort:
+                bisect.insort(self._sorted_keys, key)
+            else:
+                self._sorted_keys.append(key)
+            for char in set(key):
+                self._unigrams[char].add(key)
+            for gram in _bigrams(key):
+                self._bigrams[gram].add(key)
+        self._names[key].add(name)
+
+    def _unindex_name(self, name: str):
+        key = _normalize(name)
+        names = self._names.get(key)
+        if not names:
+            return
+        names.discard(name)
+        if names:
+            return
+        del self._names[key]
+        position = bisect.bisect_left(self._sorted_keys, key)
+        if position < len(self._sorted_keys) and self._sorted_keys[position] == key:
+            del self._sorted_keys[position]
+        for char in set(key):
+            self._unigrams[char].discard(key)
+        for gram in _bigrams(key):
+            self._bigrams[gram].discard(key)
+
+    # ---------- 查询 ----------
+
+    def search(self, query: str, limit: int = 10, fuzzy: bool = True) -> List[Dict[str, Any]]:
+        """
+        查询匹配的实体名称
+
+        Args:
+            query: 输入文本
+            limit: 返回数量
+            fuzzy: 精确/前缀/子串匹配不足时是否补充模糊匹配
+
+        Returns:
+            按匹配类型、度数、名称长度排序的结果列表
+        """
+        key = _normalize(query)
+        if not key:
+            return []
+
+        with self._lock:
+            matches: Dict[str, Tuple[str, float]] = {}
+
+            # 前缀（含完全匹配）
+            position = bisect.bisect_left(self._sorted_keys, key)
+            while position < len(self._sorted_keys) and self._sorted_keys[position].startswith(key):
+                candidate = self._sorted_keys[position]
+                match = "exact" if candidate == key else "prefix"
+                matches[candidate] = (match, MATCH_SCORES[match])
+                position += 1
+
+            # 子串：所有 n-gram 倒排列表求交集后校验
+            # 各匹配类型得分分层，高层结果已足够时跳过低层查询
+            grams = _bigrams(key) if len(key) > 1 else {key}
+            postings = self._bigrams if len(key) > 1 else self._unigrams
+            lists = sorted((postings.get(gram, ()) for gram in grams), key=len)
+            if len(matches) < limit and lists and lists[0]:
+                candidates = set(lists[0]).intersection(*lists[1:])
+                for candidate in candidates:
+                    if candidate not in matches and key in candidate:
+                        matches[candidate] = ("substring", MATCH_SCORES["substring"])
+
+            # 模糊：二元组 Dice 相似度
+            if fuzzy and len(matches) < limit and len(key) > 1:
+                query_grams = _bigrams(key)
+                overlap: Counter = Counter()
+                for gram in query_grams:
+                    overlap.update(self._bigrams.get(gram, ()))
+                for candidate, shared in overlap.items():
+                    if candidate in matches:
+                        continue
+                    score = 2.0 * shared / (len(query_grams) + len(_bigrams(candidate)))
+                    if score >= FUZZY_MIN_SCORE:
+                        matches[candidate] = ("fuzzy", score)
+
+            results = []
+            for candidate, (match, score) in matches.items():
+                for name in self._names[candidate]:
+                    results.append((match, score, name))
+
+            top = heapq.nsmallest(
+                limit,
+                results,
+                key=lambda item: (-item[1], -self._degree[item[2]], len(item[2]), item[2])
+            )
+            return [
+                {
+                    "name": name,
+                    "match": match,
+                    "score": round(score, 3),
+                    "degree": self._degree[name],
+                    "high_level": name in self._high_level
+                }
+                for match, score, name in top
+            ]
+
+
+# 全局索引实例，注册为图谱变更监听者
+entity_name_index = EntityNameIndex()
+get_graph_snapshot_cache().add_listener(entity_name_index.on_changes)
+
+
+def get_entity_name_index() -> EntityNameIndex:
+    """获取实体名称补全索引实例"""
+    return entity_name_index
@@ -0,0 +1,278 @@
+"""
+知识图谱列式归档
+将三元组、有效关系、高级节点和图像分析历史导出为 Parquet 文件（zstd 压缩），
+实体/关系列使用字典编码；也可以从归档批量恢复到一个空实例，
+用于离线分析、备份以及快速初始化新部署
+
+归档目录结构:
+    manifest.json                   归档版本、创建时间、各表行数
+    knowledge_triples.parquet       id, head_entity, relation, tail_entity（字典编码）
+    valid_relations.parquet         relation_name
+    graph_high_level_nodes.parquet  node_name, node_type, description
+    image_analysis_history.parquet  analysis_id, timestamp, entity_count, detected_types, confidence, risk_level
+"""
+import json
+import logging
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Union
+
+import numpy as np
+
+from triple_store import get_triple_store, TRIPLE_TABLE
+from repositories import (
+    get_valid_relation_repository,
+    get_high_level_node_repository,
+    get_analysis_history_repository,
+    format_timestamp,
+    TIMESTAMP_FORMAT,
+    VALID_RELATION_TABLE,
+    HIGH_LEVEL_NODE_TABLE,
+    ANALYSIS_HISTORY_TABLE
+)
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow为可选依赖
+    pa = None
+    pq = None
+
+ARCHIVE_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+COMPRESSION = "zstd"
+# 每个 Parquet 行组 / 每个恢复事务的三元组数
+ROW_GROUP_SIZE = 100_000
+
+TRIPLE_COLUMNS = ("head_entity", "relation", "tail_entity")
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("未安装pyarrow，无法导出/导入列式归档（pip install pyarrow）")
+
+
+def _parquet_path(directory: Path, table: str) -> Path:
+    return directory / f"{table}.parquet"
+
+
+def _dictionary_column(ids: np.ndarray, dictionary_ids: np.ndarray, dictionary: "pa.Array") -> "pa.DictionaryArray":
+    """将ID列转换为以字典表为字典的字典编码列（dictionary_ids 已排序）"""
+    indices = np.searchsorted(dictionary_ids, ids).astype(np.int32)
+    return pa.DictionaryArray.from_arrays(pa.array(indices, type=pa.int32()), dictionary)
+
+
+def _load_dictionary(rows: List[Dict[str, Any]]):
+    ids = np.fromiter((row["id"] for row in rows), dtype=np.int64, count=len(rows))
+    names = pa.array([row["name"] for row in rows], type=pa.string())
+    return ids, names
+
+
+def _export_triples(conn, path: Path) -> int:
+    store = get_triple_store()
+    cursor = conn.cursor()
+    entity_ids, entity_names = _load_dictionary(store.entities.all(cursor))
+    relation_ids, relation_names = _load_dictionary(store.relations.all(cursor))
+
+    dictionary_type = pa.dictionary(pa.int32(), pa.string())
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("head_entity", dictionary_type),
+        ("relation", dictionary_type),
+        ("tail_entity", dictionary_type),
+    ])
+
+    count = 0
+    with pq.ParquetWriter(path, schema, compression=COMPRESSION) as writer:
+        for rows in store.iter_key_batches(conn, ROW_GROUP_SIZE):
+            keys = np.array(
+                [(row["id"], row["head_id"], row["relation_id"], row["tail_id"]) for row in rows],
+                dtype=np.int64
+            )
+            writer.write_table(pa.Table.from_arrays([
+                pa.array(keys[:, 0]),
+                _dictionary_column(keys[:, 1], entity_ids, entity_names),
+                _dictionary_column(keys[:, 2], relation_ids, relation_names),
+                _dictionary_column(keys[:, 3], entity_ids, entity_names),
+            ], schema=schema))
+            count += len(rows)
+    return count
+
+
+def export_archive(conn, directory: Union[str, Path]) -> Dict[str, Any]:
+    """
+    导出列式归档
+
+    Args:
+        conn: 数据库连接，导出期间独占
+        directory: 归档目录（不存在时创建，同名文件被覆盖）
+
+    Returns:
+        归档清单（manifest）
+    """
+    _require_pyarrow()
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    start = time.time()
+    cursor = conn.cursor()
+
+    tables = {TRIPLE_TABLE: _export_triples(conn, _parquet_path(directory, TRIPLE_TABLE))}
+
+    relations = get_valid_relation_repository().list_names(cursor)
+    pq.write_table(
+        pa.table({"relation_name": pa.array(relations, type=pa.string())}),
+        _parquet_path(directory, VALID_RELATION_TABLE), compression=COMPRESSION
+    )
+    tables[VALID_RELATION_TABLE] = len(relations)
+
+    nodes = get_high_level_node_repository().list_all(cursor)
+    pq.write_table(
+        pa.Table.from_pylist(nodes, schema=pa.schema([
+            ("node_name", pa.string()),
+            ("node_type", pa.dictionary(pa.int8(), pa.string())),
+            ("description", pa.string()),
+        ])),
+        _parquet_path(directory, HIGH_LEVEL_NODE_TABLE), compression=COMPRESSION
+    )
+    tables[HIGH_LEVEL_NODE_TABLE] = len(nodes)
+
+    history = get_analysis_history_repository().list_all(cursor)
+    for record in history:
+        record["timestamp"] = datetime.strptime(format_timestamp(record["timestamp"]), TIMESTAMP_FORMAT)
+        record["confidence"] = float(record["confidence"])
+    pq.write_table(
+        pa.Table.from_pylist(history, schema=pa.schema([
+            ("analysis_id", pa.string()),
+            ("timestamp", pa.timestamp("s")),
+            ("entity_count", pa.int32()),
+            ("detected_types", pa.list_(pa.dictionary(pa.int32(), pa.string()))),
+            ("confidence", pa.float32()),
+            ("risk_level", pa.dictionary(pa.int8(), pa.string())),
+        ])),
+        _parquet_path(directory, ANALYSIS_HISTORY_TABLE), compression=COMPRESSION
+    )
+    tables[ANALYSIS_HISTORY_TABLE] = len(history)
+
+    manifest = {
+        "version": ARCHIVE_VERSION,
+        "format": "parquet",
+        "compression": COMPRESSION,
+        "created_at": datetime.now().strftime(TIMESTAMP_FORMAT),
+        "tables": tables,
+    }
+    (directory / MANIFEST_FILE).write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    logger.info(f"归档导出完成: {directory}, {tables}, 耗时 {time.time() - start:.1f}s")
+    return manifest
+
+
+def _restore_triples(conn, path: Path) -> int:
+    store = get_triple_store()
+    cursor = conn.cursor()
+    parquet = pq.ParquetFile(path, read_dictionary=list(TRIPLE_COLUMNS))
+
+    count = 0
+    for batch in parquet.iter_batches(batch_size=ROW_GROUP_SIZE):
+        columns = {}
+        for name in TRIPLE_COLUMNS:
+            column = batch.column(name)
+            dictionary = column.dictionary.to_pylist()
+            # 同一批内字典只解析一次，每个名称只查询/写入一次字典表
+            dictionary_store = store.relations if name == "relation" else store.entities
+            name_ids = dictionary_store.intern(cursor, dictionary)
+            lookup = np.array([name_ids[value] for value in dictionary], dtype=np.int64)
+            columns[name] = lookup[column.indices.to_numpy(zero_copy_only=False)]
+        ids = batch.column("id").to_numpy()
+
+        rows = list(zip(
+            ids.tolist(),
+            columns["head_entity"].tolist(),
+            columns["relation"].tolist(),
+            columns["tail_entity"].tolist()
+        ))
+        store.restore_triples(cursor, rows)
+        conn.commit()
+        count += len(rows)
+        logger.info(f"已恢复 {count} 条三元组")
+    return count
+
+
+def import_archive(conn, directory: Union[str, Path]) -> Dict[str, int]:
+    """
+    从列式归档恢复数据到空实例
+
+    三元组保留原ID，每个批次一个事务；有效关系、高级节点和分析历史中已存在的记录被忽略
+
+    Args:
+        conn: 数据库连接，导入期间独占
+        directory: 归档目录
+
+    Returns:
+        各表恢复的行数
+
+    Raises:
+        ValueError: 归档无效或目标实例中已有三元组
+    """
+    _require_pyarrow()
+    directory = Path(directory)
+    manifest_path = directory / MANIFEST_FILE
+    if not manifest_path.exists():
+        raise ValueError(f"不是有效的归档目录（缺少 {MANIFEST_FILE}）: {directory}")
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    if manifest.get("version") != ARCHIVE_VERSION:
+        raise ValueError(f"不支持的归档版本: {manifest.get('version')}")
+
+    store = get_triple_store()
+    cursor = conn.cursor()
+    existing = store.count(cursor)
+    if existing:
+        raise ValueError(f"目标实例中已有 {existing} 条三元组，只能导入到空实例")
+
+    start = time.time()
+    restored = {}
+    try:
+        relations = pq.read_table(_parquet_path(directory, VALID_RELATION_TABLE)).column("relation_name").to_pylist()
+        restored[VALID_RELATION_TABLE] = get_valid_relation_repository().add(cursor, relations)
+
+        nodes = pq.read_table(_parquet_path(directory, HIGH_LEVEL_NODE_TABLE)).to_pylist()
+        restored[HIGH_LEVEL_NODE_TABLE] = get_high_level_node_repository().add_many(cursor, nodes)
+
+        history = pq.read_table(_parquet_path(directory, ANALYSIS_HISTORY_TABLE)).to_pylist()
+        for record in history:
+            record["timestamp"] = format_timestamp(record["timestamp"])
+        restored[ANALYSIS_HISTORY_TABLE] = get_analysis_history_repository().add_many(cursor, history)
+        conn.commit()
+
+        restored[TRIPLE_TABLE] = _restore_triples(conn, _parquet_path(directory, TRIPLE_TABLE))
+    except Exception:
+        conn.rollback()
+        raise
+
+    logger.info(f"归档导入完成: {directory}, {restored}, 耗时 {time.time() - start:.1f}s")
+    return restored
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from init_db import DB_CONFIG
+    from storage import init_storage, create_backend
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='知识图谱列式归档（Parquet）导出/导入')
+    parser.add_argument('mode', type=str, choices=['export', 'import'], help='导出或导入')
+    parser.add_argument('directory', type=str, help='归档目录')
+    args = parser.parse_args()
+
+    backend = init_storage(create_backend(DB_CONFIG))
+    backend.migrate()
+    with backend.connection() as conn:
+        if args.mode == 'export':
+            result = export_archive(conn, args.directory)
+        else:
+            result = import_archive(conn, args.directory)
+    backend.close()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
@@ -0,0 +1,333 @@
+"""
+知识图谱快照缓存
+进程内维护一个带单调递增版本号的图谱快照，写操作递增版本号后快照才会重建；
+每次版本递增同时记录变更日志，供客户端增量拉取或通过SSE订阅；
+版本号只反映本进程的写入，服务须以单进程运行（不支持 uvicorn --workers）
+"""
+import asyncio
+import logging
+import threading
+import time
+import json
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (id, head_entity, relation, tail_entity)
+TripleRow = Tuple[int, str, str, str]
+
+# 变更日志保留的最大条数，超出后过旧的增量请求需重新拉取全量图谱
+MAX_CHANGE_LOG_SIZE = 10000
+
+# 单个SSE订阅者允许积压的最大批次数
+MAX_SUBSCRIBER_BACKLOG = 1000
+
+
+class GraphSnapshot:
+    """某一版本下的图谱快照（只读）"""
+
+    def __init__(self, version: int, etag: str, triples: List[TripleRow], high_level_nodes: Set[str]):
+        """
+        Args:
+            version: 快照对应的图谱版本号
+            etag: HTTP ETag
+            triples: 三元组列表
+            high_level_nodes: 高级节点名称集合（已与图谱实体取交集前的原始集合）
+        """
+        self.version = version
+        self.etag = etag
+        self.triples = triples
+        self.high_level_nodes = high_level_nodes
+        self.built_at = time.time()
+
+        nodes_set = set()
+        links = []
+        for triple_id, head, relation, tail in triples:
+            nodes_set.add(head)
+            nodes_set.add(tail)
+            links.append({
+                "source": head,
+                "target": tail,
+                "value": relation,
+                "id": triple_id
+            })
+
+        self.links = links
+        self.nodes = [
+            {
+                "name": node,
+                "id": node,
+                "category": 1 if node in high_level_nodes else 0  # 1=高级节点，0=普通节点
+            }
+            for node in nodes_set
+        ]
+        self._json_body: Optional[bytes] = None
+        self._derived: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+
+    def json_body(self) -> bytes:
+        """序列化后的 /api/graph 响应体（每个版本只序列化一次）"""
+        if self._json_body is None:
+            with self._lock:
+                if self._json_body is None:
+                    self._json_body = json.dumps(
+                        {"nodes": self.nodes, "links": self.links},
+                        ensure_ascii=False,
+                        separators=(",", ":")
+                    ).encode("utf-8")
+        return self._json_body
+
+    def has_json_body(self) -> bool:
+        """响应体是否已序列化"""
+        return self._json_body is not None
+
+    def has_derived(self, name: str) -> bool:
+        """派生数据是否已构建"""
+        return name in self._derived
+
+    def derived(self, name: str, factory: Callable[["GraphSnapshot"], Any]) -> Any:
+        """
+        获取基于本快照派生的数据结构（邻接索引等），每个版本只构建一次
+
+        Args:
+            name: 派生数据名称
+            factory: 构建函数，参数为快照本身
+
+        Returns:
+            派生数据
+        """
+        value = self._derived.get(name)
+        if value is None:
+            with self._lock:
+                value = self._derived.get(name)
+                if value is None:
+                    value = factory(self)
+                    self._derived[name] = value
+        return value
+
+
+class GraphSnapshotCache:
+    """进程级图谱快照缓存"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._version = 1
+        self._snapshot: Optional[GraphSnapshot] = None
+        # 进程启动标识，避免重启后版本号相同但内容不同
+        self._epoch = format(int(time.time() * 1000), "x")
+        # 变更日志：每条变更带全局序号 seq 和所属版本号 version
+        self._changes: deque = deque(maxlen=MAX_CHANGE_LOG_SIZE)
+        self._seq = 0
+        # SSE订阅者: asyncio.Queue -> 所属事件循环
+        self._subscribers: Dict[asyncio.Queue, asyncio.AbstractEventLoop] = {}
+        # 进程内同步监听者（增量维护的索引等），在写入线程中调用
+        self._listeners: List[Callable[[List[Dict[str, Any]]], None]] = []
+
+    @property
+    def epoch(self) -> str:
+        """进程启动标识，版本号仅在同一 epoch 内可比较"""
+        return self._epoch
+
+    @property
+    def version(self) -> int:
+        """当前图谱版本号"""
+        return self._version
+
+    def etag_for(self, version: int, variant: str = "") -> str:
+        """
+        根据版本号生成 ETag
+
+        Args:
+            version: 图谱版本号
+            variant: 表示形式标识（如不同编码），同一版本的不同表示形式ETag不同
+        """
+        suffix = f"-{variant}" if variant else ""
+        return f'W/"{self._epoch}-{version}{suffix}"'
+
+    def bump_version(self, reason: str = "") -> int:
+        """
+        递增图谱版本号，使当前快照失效
+
+        无法描述具体变更时使用，记录一条 reload 变更，客户端收到后应重新拉取全量图谱
+
+        Args:
+            reason: 触发原因
+
+        Returns:
+            新的版本号
+        """
+        return self.record_mutations([{"op": "reload", "reason": reason}], reason)
+
+    def record_mutations(self, changes: List[Dict[str, Any]], reason: str = "") -> int:
+        """
+        记录一批已提交的图谱变更并递增版本号
+
+        Args:
+            changes: 变更列表，每项包含 op 及对应字段，例如
+                {"op": "add_edge", "edge": {...}} / {"op": "delete_edge", "edge_id": 1} /
+                {"op": "update_edge", "edge": {...}} / {"op": "rename_node", "old_name": ..., "new_name": ...} /
+                {"op": "delete_node", "name": ..., "edge_ids": [...]} /
+                {"op": "set_high_level", "name": ..., "high_level": True} / {"op": "reload"}
+            reason: 触发原因（仅用于日志）
+
+        Returns:
+            新的版本号
+        """
+        timestamp = time.time()
+        with self._lock:
+            self._version += 1
+            version = self._version
+            stamped = []
+            for change in changes:
+                self._seq += 1
+                stamped.append({"seq": self._seq, "version": version, "timestamp": timestamp, **change})
+            self._changes.extend(stamped)
+            subscribers = list(self._subscribers.items())
+            listeners = list(self._listeners)
+
+        logger.debug(f"图谱版本更新为 {version}: {reason}")
+        for listener in listeners:
+            try:
+                listener(stamped)
+            except Exception as e:
+                logger.error(f"图谱变更监听者处理失败: {e}")
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, stamped)
+            except RuntimeError:
+                # 订阅者所在的事件循环已关闭
+                self.unsubscribe(queue)
+        return version
+
+    def _deliver(self, queue: asyncio.Queue, changes: List[Dict[str, Any]]):
+        """在订阅者的事件循环中投递变更，积压过多时改为通知其重新同步"""
+        if queue.qsize() >= MAX_SUBSCRIBER_BACKLOG:
+            self.unsubscribe(queue)
+            queue.put_nowait(None)
+            return
+        queue.put_nowait(changes)
+
+    def changes_since(self, version: int) -> Tuple[int, Optional[List[Dict[str, Any]]]]:
+        """
+        获取指定版本之后的所有变更
+
+        Args:
+            version: 客户端当前持有的版本号
+
+        Returns:
+            (当前版本号, 变更列表)；所需变更已超出日志保留范围时变更列表为None，客户端需全量重载。
+            版本号大于当前版本（来自重启前的进程）时同样返回None
+        """
+        with self._lock:
+            current = self._version
+            if version == current:
+                return current, []
+            if version > current:
+                return current, None
+            oldest = self._changes[0]["version"] if self._changes else current + 1
+            if len(self._changes) == self._changes.maxlen:
+                # 日志已满时最旧版本的变更可能被部分淘汰，保守地视为不完整
+                oldest += 1
+            # 版本号从1开始，第一条变更对应版本2
+            if version + 1 < oldest:
+                return current, None
+            return current, [change for change in self._changes if change["version"] > version]
+
+    def add_listener(self, listener: Callable[[List[Dict[str, Any]]], None]):
+        """
+        注册同步变更监听者
+
+        每批变更提交后在写入线程中调用；并发写入时批次可能乱序到达，
+        监听者应根据 version 字段判断是否缺失并通过 changes_since 补齐
+
+        Args:
+            listener: 参数为带 seq/version 的变更列表
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    def subscribe(self) -> asyncio.Queue:
+        """订阅后续变更（需在事件循环中调用），队列中收到None表示需要重新同步"""
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        """取消订阅"""
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def current(self) -> Optional[GraphSnapshot]:
+        """返回与当前版本一致的已缓存快照，需要重建时返回None"""
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == self._version:
+            return snapshot
+        return None
+
+    def get_snapshot(self, loader: Callable[[], Tuple[List[TripleRow], Set[str]]]) -> GraphSnapshot:
+        """
+        获取当前版本的快照，版本号变化时调用 loader 重建
+
+        Args:
+            loader: 返回 (三元组列表, 高级节点集合) 的加载函数
+
+        Returns:
+            图谱快照
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == self._version:
+            return snapshot
+
+        with self._build_lock:
+            snapshot = self._snapshot
+            version = self._version
+            if snapshot is not None and snapshot.version == version:
+                return snapshot
+
+            # 先记录版本号再加载，加载期间若有写入，下次请求会再次重建
+            start = time.time()
+            triples, high_level_nodes = loader()
+            snapshot = GraphSnapshot(version, self.etag_for(version), triples, high_level_nodes)
+            self._snapshot = snapshot
+            logger.info(
+                f"图谱快照已重建: 版本 {version}, {len(snapshot.nodes)} 个节点, "
+                f"{len(snapshot.links)} 条边, 耗时 {(time.time() - start) * 1000:.1f}ms"
+            )
+            return snapshot
+
+    def etag_matches(self, if_none_match: Optional[str], variant: str = "") -> bool:
+        """判断 If-None-Match 请求头是否与当前版本（及表示形式）匹配"""
+        if not if_none_match:
+            return False
+        current = self.etag_for(self._version, variant)
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        # 弱比较：忽略 W/ 前缀
+        normalized = current[2:] if current.startswith("W/") else current
+        for tag in candidates:
+            if tag == "*":
+                return True
+            if (tag[2:] if tag.startswith("W/") else tag) == normalized:
+                return True
+        return False
+
+
+# 全局缓存实例
+graph_snapshot_cache = GraphSnapshotCache()
+
+
+def get_graph_snapshot_cache() -> GraphSnapshotCache:
+    """获取图谱快照缓存实例"""
+    return graph_snapshot_cache
+
+
+def bump_graph_version(reason: str = "") -> int:
+    """递增图谱版本号（供各写入端点和知识更新器调用）"""
+    return graph_snapshot_cache.bump_version(reason)
+
+
+def record_graph_mutations(changes: List[Dict[str, Any]], reason: str = "") -> int:
+    """记录一批已提交的图谱变更并递增版本号"""
+    return graph_snapshot_cache.record_mutations(changes, reason)
@@ -0,0 +1,216 @@
+"""
+知识图谱紧凑编码
+将实体名和关系名放入字符串表，边用整数下标数组表示，
+支持 MessagePack 和自定义类型化数组(typed-array)两种二进制格式
+"""
+import json
+import logging
+import struct
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from graph_cache import GraphSnapshot
+
+logger = logging.getLogger(__name__)
+
+try:
+    import msgpack
+except ImportError:  # msgpack为可选依赖
+    msgpack = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+TYPED_ARRAY_MEDIA_TYPE = "application/vnd.kgraph.typed-array"
+
+TYPED_ARRAY_MAGIC = b"KGT1"
+
+# 二进制媒体类型 -> 快照上缓存编码结果的派生数据名称
+ENCODED_DERIVED_NAMES = {
+    MSGPACK_MEDIA_TYPE: "compact_graph_msgpack",
+    TYPED_ARRAY_MEDIA_TYPE: "compact_graph_typed_array",
+}
+
+# 媒体类型 -> ETag表示形式标识
+ETAG_VARIANTS = {
+    JSON_MEDIA_TYPE: "",
+    MSGPACK_MEDIA_TYPE: "msgpack",
+    TYPED_ARRAY_MEDIA_TYPE: "typed",
+}
+
+
+class CompactGraph:
+    """
+    图谱的字符串表 + 整数数组表示
+
+    strings 前 node_count 项为实体名（第i项即第i个节点），其后为关系名；
+    edge_source / edge_target / edge_relation 均为 strings 的下标
+    """
+
+    def __init__(self, snapshot: GraphSnapshot):
+        """
+        Args:
+            snapshot: 图谱快照
+        """
+        self.version = snapshot.version
+
+        string_index: Dict[str, int] = {}
+        for node in snapshot.nodes:
+            string_index[node["name"]] = len(string_index)
+        self.node_count = len(string_index)
+
+        relation_index: Dict[str, int] = {}
+        for _, _, relation, _ in snapshot.triples:
+            if relation not in relation_index:
+                relation_index[relation] = self.node_count + len(relation_index)
+
+        self.strings: List[str] = list(string_index) + list(relation_index)
+        self.node_category = np.fromiter(
+            (node["category"] for node in snapshot.nodes), dtype="<u1", count=self.node_count
+        )
+
+        edge_count = len(snapshot.triples)
+        self.edge_count = edge_count
+        self.edge_source = np.empty(edge_count, dtype="<u4")
+        self.edge_target = np.empty(edge_count, dtype="<u4")
+        self.edge_relation = np.empty(edge_count, dtype="<u4")
+        self.edge_id = np.empty(edge_count, dtype="<u4")
+        for i, (triple_id, head, relation, tail) in enumerate(snapshot.triples):
+            self.edge_source[i] = string_index[head]
+            self.edge_target[i] = string_index[tail]
+            self.edge_relation[i] = relation_index[relation]
+            self.edge_id[i] = triple_id
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """按固定顺序返回所有数组"""
+        return {
+            "node_category": self.node_category,
+            "edge_source": self.edge_source,
+            "edge_target": self.edge_target,
+            "edge_relation": self.edge_relation,
+            "edge_id": self.edge_id,
+        }
+
+    def to_msgpack(self) -> bytes:
+        """
+        序列化为 MessagePack
+
+        数组以小端字节串(bin)存储，客户端可直接包装为 Uint8Array / Uint32Array
+        """
+        if msgpack is None:
+            raise RuntimeError("未安装msgpack，无法使用MessagePack编码")
+        payload: Dict[str, Any] = {
+            "version": self.version,
+            "node_count": self.node_count,
+            "edge_count": self.edge_count,
+            "strings": self.strings,
+            "dtypes": {name: array.dtype.str for name, array in self.arrays().items()},
+        }
+        for name, array in self.arrays().items():
+            payload[name] = array.tobytes()
+        return msgpack.packb(payload, use_bin_type=True)
+
+    def to_typed_arrays(self) -> bytes:
+        """
+        序列化为类型化数组布局
+
+        格式: magic(4B) | header长度(uint32 LE) | header JSON | 数组区
+        header 中记录每个数组的 dtype、字节偏移（相对数组区起点，4字节对齐）和长度
+        """
+        layout = []
+        offset = 0
+        for name, array in self.arrays().items():
+            layout.append({
+                "name": name,
+                "dtype": array.dtype.str,
+                "offset": offset,
+                "length": int(array.size)
+            })
+            offset += array.nbytes
+            offset += -offset % 4
+
+        header = json.dumps({
+            "version": self.version,
+            "node_count": self.node_count,
+            "edge_count": self.edge_count,
+            "strings": self.strings,
+            "arrays": layout
+        }, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        # 数组区起点4字节对齐，便于前端直接创建 Uint32Array 视图
+        header += b" " * (-(len(TYPED_ARRAY_MAGIC) + 4 + len(header)) % 4)
+
+        parts = [TYPED_ARRAY_MAGIC, struct.pack("<I", len(header)), header]
+        for array in self.arrays().values():
+            data = array.tobytes()
+            parts.append(data)
+            parts.append(b"\0" * (-len(data) % 4))
+        return b"".join(parts)
+
+
+def negotiate_graph_media_type(accept: Optional[str]) -> str:
+    """
+    根据 Accept 请求头选择图谱编码
+
+    Returns:
+        选中的媒体类型，未请求二进制编码（或msgpack不可用）时为JSON
+    """
+    if not accept:
+        return JSON_MEDIA_TYPE
+
+    candidates = []
+    for position, item in enumerate(accept.split(",")):
+        parts = [part.strip() for part in item.split(";")]
+        media_type = parts[0].lower()
+        quality = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            candidates.append((-quality, position, media_type))
+
+    for _, _, media_type in sorted(candidates):
+        if media_type == TYPED_ARRAY_MEDIA_TYPE:
+            return TYPED_ARRAY_MEDIA_TYPE
+        if media_type in (MSGPACK_MEDIA_TYPE, "application/msgpack") and msgpack is not None:
+            return MSGPACK_MEDIA_TYPE
+        if media_type in (JSON_MEDIA_TYPE, "application/*", "*/*"):
+            return JSON_MEDIA_TYPE
+    return JSON_MEDIA_TYPE
+
+
+def _build_compact_graph(snapshot: GraphSnapshot) -> CompactGraph:
+    compact = CompactGraph(snapshot)
+    logger.info(f"紧凑图谱编码构建完成: 版本 {snapshot.version}, 字符串表 {len(compact.strings)} 项")
+    return compact
+
+
+def is_graph_encoded(snapshot: GraphSnapshot, media_type: str) -> bool:
+    """快照是否已有该媒体类型的编码结果（已有时 encode_graph 不再序列化）"""
+    if media_type == JSON_MEDIA_TYPE:
+        return snapshot.has_json_body()
+    return snapshot.has_derived(ENCODED_DERIVED_NAMES[media_type])
+
+
+def encode_graph(snapshot: GraphSnapshot, media_type: str) -> bytes:
+    """
+    按媒体类型编码快照（每个版本、每种编码只序列化一次）
+
+    Args:
+        snapshot: 图谱快照
+        media_type: negotiate_graph_media_type 返回的媒体类型
+
+    Returns:
+        响应体字节
+    """
+    if media_type == JSON_MEDIA_TYPE:
+        return snapshot.json_body()
+
+    compact = snapshot.derived("compact_graph", _build_compact_graph)
+    if media_type == MSGPACK_MEDIA_TYPE:
+        return snapshot.derived(ENCODED_DERIVED_NAMES[media_type], lambda _: compact.to_msgpack())
+    if media_type == TYPED_ARRAY_MEDIA_TYPE:
+        return snapshot.derived(ENCODED_DERIVED_NAMES[media_type], lambda _: compact.to_typed_arrays())
+    raise ValueError(f"不支持的图谱编码: {media_type}")
@@ -0,0 +1,186 @@
+"""
+知识图谱邻接索引
+基于图谱快照在内存中构建出/入邻接表，支持k跳邻域（自我中心子图）查询
+"""
+import logging
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from graph_cache import GraphSnapshot, get_graph_snapshot_cache
+from triple_store import get_triple_store
+
+logger = logging.getLogger(__name__)
+
+
+class AdjacencyIndex:
+    """实体邻接索引（每个图谱版本构建一次）"""
+
+    def __init__(self, snapshot: GraphSnapshot):
+        """
+        Args:
+            snapshot: 图谱快照
+        """
+        self.version = snapshot.version
+        self.triples = snapshot.triples
+        self.high_level_nodes = snapshot.high_level_nodes
+
+        # 实体 -> 以其为头/尾实体的三元组下标
+        out_edges = defaultdict(list)
+        in_edges = defaultdict(list)
+        for idx, (_, head, _, tail) in enumerate(self.triples):
+            out_edges[head].append(idx)
+            in_edges[tail].append(idx)
+
+        self.out_edges: Dict[str, List[int]] = dict(out_edges)
+        self.in_edges: Dict[str, List[int]] = dict(in_edges)
+        logger.info(f"邻接索引构建完成: 版本 {self.version}, {len(self.triples)} 条边")
+
+    def __contains__(self, entity: str) -> bool:
+        return entity in self.out_edges or entity in self.in_edges
+
+    def degree(self, entity: str) -> int:
+        """实体的总度数"""
+        return len(self.out_edges.get(entity, ())) + len(self.in_edges.get(entity, ()))
+
+    def incident_edges(self, entity: str, direction: str) -> Iterable[int]:
+        """按方向返回实体关联的三元组下标"""
+        if direction in ("out", "both"):
+            yield from self.out_edges.get(entity, ())
+        if direction in ("in", "both"):
+            yield from self.in_edges.get(entity, ())
+
+    def edges_among(self, entities: Iterable[str]) -> List[Dict[str, Any]]:
+        """头尾实体都属于给定集合的所有三元组（按ID排序），与 TripleStore.find_among 结果一致"""
+        entities = set(entities)
+        rows = [
+            self.triples[idx]
+            for entity in entities
+            for idx in self.out_edges.get(entity, ())
+            if self.triples[idx][3] in entities
+        ]
+        rows.sort(key=lambda row: row[0])
+        return [
+            {"id": triple_id, "head_entity": head, "relation": relation, "tail_entity": tail}
+            for triple_id, head, relation, tail in rows
+        ]
+
+    def neighborhood(
+        self,
+        seeds: List[str],
+        depth: int = 1,
+        max_fanout: int = 50,
+        max_nodes: int = 500,
+        relations: Optional[Set[str]] = None,
+        direction: str = "both"
+    ) -> Dict[str, Any]:
+        """
+        广度优先查询种子实体的k跳邻域
+
+        Args:
+            seeds: 种子实体列表
+            depth: 最大跳数
+            max_fanout: 每个实体最多展开的邻居数
+            max_nodes: 返回的最大节点数
+            relations: 仅沿这些关系扩展（None表示不限）
+            direction: 扩展方向 out/in/both
+
+        Returns:
+            包含 nodes、links 及截断信息的子图
+        """
+        node_depth: Dict[str, int] = {}
+        missing_seeds = []
+        for seed in seeds:
+            if seed in self:
+                node_depth.setdefault(seed, 0)
+            else:
+                missing_seeds.append(seed)
+
+        truncated = False
+        frontier = list(node_depth)
+        for current_depth in range(1, depth + 1):
+            next_frontier = []
+            for entity in frontier:
+                expanded = 0
+                for idx in self.incident_edges(entity, direction):
+                    _, head, relation, tail = self.triples[idx]
+                    if relations is not None and relation not in relations:
+                        continue
+                    neighbor = tail if head == entity else head
+                    if neighbor in node_depth:
+                        continue
+                    if expanded >= max_fanout or len(node_depth) >= max_nodes:
+                        truncated = True
+                        break
+                    node_depth[neighbor] = current_depth
+                    next_frontier.append(neighbor)
+                    expanded += 1
+            if not next_frontier:
+                break
+            frontier = next_frontier
+
+        # 返回已选节点之间的所有边（诱导子图）
+        links = []
+        for entity in node_depth:
+            for idx in self.out_edges.get(entity, ()):
+                triple_id, head, relation, tail = self.triples[idx]
+                if tail not in node_depth:
+                    continue
+                if relations is not None and relation not in relations:
+                    continue
+                links.append({
+                    "source": head,
+                    "target": tail,
+                    "value": relation,
+                    "id": triple_id
+                })
+
+        nodes = [
+            {
+                "name": entity,
+                "id": entity,
+                "category": 1 if entity in self.high_level_nodes else 0,
+                "depth": entity_depth,
+                "degree": self.degree(entity)
+            }
+            for entity, entity_depth in node_depth.items()
+        ]
+
+        return {
+            "nodes": nodes,
+            "links": links,
+            "missing_seeds": missing_seeds,
+            "truncated": truncated
+        }
+
+
+def get_adjacency_index(snapshot: GraphSnapshot) -> AdjacencyIndex:
+    """获取快照对应的邻接索引（按版本缓存）"""
+    return snapshot.derived("adjacency_index", AdjacencyIndex)
+
+
+def find_relationships_among(cursor, entity_names: List[str], use_snapshot: bool = True) -> List[Dict[str, Any]]:
+    """
+    一组实体两两之间（任一方向）的所有已有三元组
+
+    结果与逐对调用 find_between 相同（去重后）：实体自身的环只在该名称出现多次时返回。
+    图谱快照是最新版本时直接查内存邻接索引，否则执行一次 SQL 查询
+
+    Args:
+        cursor: 数据库游标
+        entity_names: 实体名称列表（可重复）
+        use_snapshot: 是否允许使用内存快照；在写事务中需要看到本事务写入的边时传 False
+
+    Returns:
+        [{id, head_entity, relation, tail_entity}]，按ID排序
+    """
+    snapshot = get_graph_snapshot_cache().current() if use_snapshot else None
+    if snapshot is not None:
+        rows = get_adjacency_index(snapshot).edges_among(entity_names)
+    else:
+        rows = get_triple_store().find_among(cursor, entity_names)
+
+    counts = Counter(entity_names)
+    return [
+        row for row in rows
+        if row["head_entity"] != row["tail_entity"] or counts[row["head_entity"]] > 1
+    ]
@@ -0,0 +1,246 @@
+"""
+知识图谱服务端布局
+使用NumPy向量化的Fruchterman-Reingold力导向算法预先计算节点坐标，按图谱版本缓存；
+图谱发生小幅变更时以上一版本的布局为初始位置热启动，只需少量迭代
+"""
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from graph_cache import GraphSnapshot
+
+logger = logging.getLogger(__name__)
+
+# 冷启动 / 热启动迭代次数
+COLD_ITERATIONS = 200
+WARM_ITERATIONS = 40
+MIN_ITERATIONS = 20
+# 单次布局允许的斥力点对计算总量（n^2 * 迭代次数），大图自动减少迭代次数
+LAYOUT_PAIR_BUDGET = 1_000_000_000
+# 新增节点占比不超过该值时使用热启动
+WARM_START_MAX_NEW_RATIO = 0.3
+# 斥力分块计算时单块的最大元素数（控制内存峰值）
+REPULSION_BLOCK_ELEMENTS = 2_000_000
+# 输出坐标范围 [-OUTPUT_SCALE, OUTPUT_SCALE]
+OUTPUT_SCALE = 1000.0
+# 向心力系数，防止不连通的子图飘散
+GRAVITY = 0.1
+
+
+class LayoutResult:
+    """某一图谱版本的布局结果"""
+
+    def __init__(self, version: int, names: List[str], positions: np.ndarray,
+                 iterations: int, warm_start: bool, elapsed_ms: float):
+        """
+        Args:
+            version: 图谱版本号
+            names: 节点名称列表
+            positions: (n, 2) 单位坐标系下的节点坐标
+            iterations: 实际迭代次数
+            warm_start: 是否由上一版本布局热启动
+            elapsed_ms: 计算耗时
+        """
+        self.version = version
+        self.names = names
+        self.positions = positions
+        self.iterations = iterations
+        self.warm_start = warm_start
+        self.elapsed_ms = elapsed_ms
+        self.index = {name: i for i, name in enumerate(names)}
+
+    def to_response(self) -> Dict:
+        """转换为接口返回格式，坐标缩放到输出范围"""
+        if len(self.positions):
+            center = (self.positions.max(axis=0) + self.positions.min(axis=0)) / 2
+            span = float(np.abs(self.positions - center).max()) or 1.0
+            scaled = (self.positions - center) * (OUTPUT_SCALE / span)
+        else:
+            scaled = self.positions
+        return {
+            "version": self.version,
+            "nodes": [
+                {"id": name, "x": round(float(x), 2), "y": round(float(y), 2)}
+                for name, (x, y) in zip(self.names, scaled)
+            ],
+            "iterations": self.iterations,
+            "warm_start": self.warm_start,
+            "elapsed_ms": round(self.elapsed_ms, 1)
+        }
+
+
+def _edge_arrays(snapshot: GraphSnapshot, index: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """提取去重后的无向边（去除自环）"""
+    pairs = set()
+    for _, head, _, tail in snapshot.triples:
+        a, b = index[head], index[tail]
+        if a == b:
+            continue
+        pairs.add((a, b) if a < b else (b, a))
+    if not pairs:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    edges = np.array(sorted(pairs), dtype=np.int64)
+    return edges[:, 0], edges[:, 1]
+
+
+def fruchterman_reingold(positions: np.ndarray, src: np.ndarray, dst: np.ndarray,
+                         iterations: int, initial_temperature: float) -> np.ndarray:
+    """
+    向量化的Fruchterman-Reingold力导向布局
+
+    Args:
+        positions: (n, 2) 初始坐标（原地更新）
+        src, dst: 边的端点下标
+        iterations: 迭代次数
+        initial_temperature: 初始最大位移，线性冷却至0
+
+    Returns:
+        布局后的坐标
+    """
+    n = len(positions)
+    if n < 2:
+        return positions
+
+    k = np.sqrt(1.0 / n)
+    k2 = k * k
+    # 最小距离，避免重合节点产生过大的斥力
+    min_dist2 = (k * 0.01) ** 2
+    block = max(1, min(n, REPULSION_BLOCK_ELEMENTS // n))
+    displacement = np.empty_like(positions)
+
+    for step in range(iterations):
+        temperature = initial_temperature * (1.0 - step / iterations)
+        displacement.fill(0.0)
+
+        # 斥力: k^2 / d，分块计算避免 n*n 矩阵；
+        # 距离平方由 |p_i|^2 + |p_j|^2 - 2 p_i·p_j 得到，合力 = p_i * sum_j w_ij - W @ P，均走BLAS
+        squared_norm = np.einsum("ij,ij->i", positions, positions)
+        for start in range(0, n, block):
+            end = min(start + block, n)
+            weights = positions[start:end] @ positions.T
+            weights *= -2.0
+            weights += squared_norm[start:end, None]
+            weights += squared_norm[None, :]
+            np.maximum(weights, min_dist2, out=weights)
+            np.divide(k2, weights, out=weights)
+            # 排除自身
+            weights[np.arange(end - start), np.arange(start, end)] = 0.0
+            displacement[start:end] += (
+                positions[start:end] * weights.sum(axis=1)[:, None] - weights @ positions
+            )
+
+        # 引力: d^2 / k，沿边方向
+        if len(src):
+            delta = positions[src] - positions[dst]
+            dist = np.sqrt(np.einsum("ij,ij->i", delta, delta))
+            force = delta * (dist / k)[:, None]
+            for axis in range(2):
+                displacement[:, axis] -= np.bincount(src, weights=force[:, axis], minlength=n)
+                displacement[:, axis] += np.bincount(dst, weights=force[:, axis], minlength=n)
+
+        # 向心力
+        displacement -= GRAVITY * (positions - positions.mean(axis=0)) / k
+
+        length = np.sqrt(np.einsum("ij,ij->i", displacement, displacement))
+        np.maximum(length, 1e-12, out=length)
+        positions += displacement * (np.minimum(length, temperature) / length)[:, None]
+
+    return positions
+
+
+class GraphLayoutEngine:
+    """按图谱版本缓存布局结果的布局引擎"""
+
+    def __init__(self, seed: int = 42):
+        self._lock = threading.Lock()
+        self._latest: Optional[LayoutResult] = None
+        self._seed = seed
+
+    def get_layout(self, snapshot: GraphSnapshot) -> LayoutResult:
+        """
+        获取快照对应的布局（同一版本只计算一次）
+
+        Args:
+            snapshot: 图谱快照
+
+        Returns:
+            布局结果
+        """
+        latest = self._latest
+        if latest is not None and latest.version == snapshot.version:
+            return latest
+
+        with self._lock:
+            latest = self._latest
+            if latest is not None and latest.version == snapshot.version:
+                return latest
+            result = self._compute(snapshot, latest)
+            # 并发请求时可能先计算了较新的版本，只保留最新结果
+            if self._latest is None or result.version >= self._latest.version:
+                self._latest = result
+            return result
+
+    def _compute(self, snapshot: GraphSnapshot, previous: Optional[LayoutResult]) -> LayoutResult:
+        start = time.time()
+        names = [node["name"] for node in snapshot.nodes]
+        index = {name: i for i, name in enumerate(names)}
+        src, dst = _edge_arrays(snapshot, index)
+        n = len(names)
+        rng = np.random.default_rng(self._seed)
+
+        positions = rng.random((n, 2))
+        placed = np.zeros(n, dtype=bool)
+        if previous is not None:
+            for i, name in enumerate(names):
+                j = previous.index.get(name)
+                if j is not None:
+                    positions[i] = previous.positions[j]
+                    placed[i] = True
+
+        new_count = n - int(placed.sum())
+        warm_start = previous is not None and n > 0 and new_count <= n * WARM_START_MAX_NEW_RATIO
+
+        if warm_start:
+            # 新节点放在已布局邻居的质心附近
+            k = np.sqrt(1.0 / n)
+            neighbor_sum = np.zeros((n, 2))
+            neighbor_count = np.zeros(n)
+            for a, b in zip(src, dst):
+                if placed[b]:
+                    neighbor_sum[a] += positions[b]
+                    neighbor_count[a] += 1
+                if placed[a]:
+                    neighbor_sum[b] += positions[a]
+                    neighbor_count[b] += 1
+            for i in np.flatnonzero(~placed):
+                if neighbor_count[i]:
+                    positions[i] = neighbor_sum[i] / neighbor_count[i] + rng.normal(scale=k * 0.5, size=2)
+                elif placed.any():
+                    positions[i] = positions[placed].mean(axis=0) + rng.normal(scale=k * 2, size=2)
+            iterations = WARM_ITERATIONS
+            initial_temperature = np.sqrt(1.0 / n) * 0.5
+        else:
+            iterations = COLD_ITERATIONS
+            initial_temperature = 0.1
+
+        if n:
+            iterations = max(MIN_ITERATIONS, min(iterations, LAYOUT_PAIR_BUDGET // (n * n)))
+        positions = fruchterman_reingold(positions, src, dst, iterations, initial_temperature)
+        elapsed_ms = (time.time() - start) * 1000
+        logger.info(
+            f"图谱布局计算完成: 版本 {snapshot.version}, {n} 个节点, {len(src)} 条边, "
+            f"{'热启动' if warm_start else '冷启动'} {iterations} 次迭代, 耗时 {elapsed_ms:.1f}ms"
+        )
+        return LayoutResult(snapshot.version, names, positions, iterations, warm_start, elapsed_ms)
+
+
+# 全局布局引擎实例
+graph_layout_engine = GraphLayoutEngine()
+
+
+def get_graph_layout_engine() -> GraphLayoutEngine:
+    """获取图谱布局引擎实例"""
+    return graph_layout_engine
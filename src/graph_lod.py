@@ -0,0 +1,172 @@
+"""
+知识图谱细节层次(LOD)聚合
+以高级节点为中心，通过多源广度优先搜索将普通节点归入距离最近的高级节点簇；
+默认返回簇超级节点及簇间聚合边，客户端可逐个展开簇查看成员
+"""
+import logging
+from collections import Counter, deque
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from graph_cache import GraphSnapshot
+from graph_index import get_adjacency_index
+
+logger = logging.getLogger(__name__)
+
+# 与任何高级节点都不连通的实体归入该簇
+UNCLUSTERED = "__unclustered__"
+UNCLUSTERED_NAME = "未归类"
+CLUSTER_ID_PREFIX = "cluster:"
+# 节点类别: 0=普通节点, 1=高级节点, 2=簇超级节点
+CLUSTER_CATEGORY = 2
+
+
+def cluster_node_id(cluster: str) -> str:
+    """簇超级节点的id"""
+    return CLUSTER_ID_PREFIX + cluster
+
+
+class ClusterIndex:
+    """节点到高级节点簇的归属关系及簇间聚合边（每个图谱版本构建一次）"""
+
+    def __init__(self, snapshot: GraphSnapshot):
+        """
+        Args:
+            snapshot: 图谱快照
+        """
+        self.version = snapshot.version
+        self.triples = snapshot.triples
+        self.adjacency = get_adjacency_index(snapshot)
+
+        centers = sorted(name for name in snapshot.high_level_nodes if name in self.adjacency)
+        self.assignment: Dict[str, str] = self._assign(centers)
+        for node in snapshot.nodes:
+            self.assignment.setdefault(node["name"], UNCLUSTERED)
+
+        self.members: Dict[str, List[str]] = {}
+        for entity, cluster in self.assignment.items():
+            self.members.setdefault(cluster, []).append(entity)
+
+        # 簇内边数及簇间聚合边 (源簇, 目标簇) -> 关系计数
+        self.internal_edges: Counter = Counter()
+        self.cluster_links: Dict[Tuple[str, str], Counter] = {}
+        for _, head, relation, tail in self.triples:
+            source = self.assignment[head]
+            target = self.assignment[tail]
+            if source == target:
+                self.internal_edges[source] += 1
+            else:
+                self.cluster_links.setdefault((source, target), Counter())[relation] += 1
+
+        logger.info(
+            f"LOD簇索引构建完成: 版本 {self.version}, {len(self.members)} 个簇, "
+            f"{len(self.cluster_links)} 条簇间聚合边"
+        )
+
+    def _assign(self, centers: List[str]) -> Dict[str, str]:
+        """多源BFS（忽略边方向），每个实体归入最先到达它的高级节点"""
+        assignment = {center: center for center in centers}
+        queue = deque(centers)
+        while queue:
+            entity = queue.popleft()
+            cluster = assignment[entity]
+            for idx in self.adjacency.incident_edges(entity, "both"):
+                _, head, _, tail = self.triples[idx]
+                neighbor = tail if head == entity else head
+                if neighbor not in assignment:
+                    assignment[neighbor] = cluster
+                    queue.append(neighbor)
+        return assignment
+
+    def _cluster_node(self, cluster: str) -> Dict[str, Any]:
+        return {
+            "name": UNCLUSTERED_NAME if cluster == UNCLUSTERED else cluster,
+            "id": cluster_node_id(cluster),
+            "category": CLUSTER_CATEGORY,
+            "cluster": cluster,
+            "member_count": len(self.members[cluster]),
+            "internal_edges": self.internal_edges[cluster]
+        }
+
+    def view(self, expand: Iterable[str] = ()) -> Dict[str, Any]:
+        """
+        生成LOD视图
+
+        Args:
+            expand: 需要展开的簇（高级节点名称，或 UNCLUSTERED）
+
+        Returns:
+            nodes、links 及展开信息；未展开的簇为超级节点，
+            聚合边的 value 为边数，relations 为各关系的边数
+        """
+        expanded: Set[str] = set()
+        missing = []
+        for cluster in expand:
+            if cluster in self.members:
+                expanded.add(cluster)
+            else:
+                missing.append(cluster)
+
+        def representative(entity: str) -> str:
+            cluster = self.assignment[entity]
+            return entity if cluster in expanded else cluster_node_id(cluster)
+
+        # 从簇间聚合边出发，将涉及已展开簇的边替换为成员级别的边
+        aggregated: Dict[Tuple[str, str], Counter] = {}
+        for (source, target), relations in self.cluster_links.items():
+            if source in expanded or target in expanded:
+                continue
+            aggregated[(cluster_node_id(source), cluster_node_id(target))] = relations
+
+        links = []
+        seen_edges: Set[int] = set()
+        for cluster in sorted(expanded):
+            for entity in self.members[cluster]:
+                for idx in self.adjacency.incident_edges(entity, "both"):
+                    if idx in seen_edges:
+                        continue
+                    seen_edges.add(idx)
+                    triple_id, head, relation, tail = self.triples[idx]
+                    source = representative(head)
+                    target = representative(tail)
+                    if source == target:
+                        continue
+                    if self.assignment[head] in expanded and self.assignment[tail] in expanded:
+                        links.append({"source": source, "target": target, "value": relation, "id": triple_id})
+                    else:
+                        aggregated.setdefault((source, target), Counter())[relation] += 1
+
+        for (source, target), relations in aggregated.items():
+            links.append({
+                "source": source,
+                "target": target,
+                "value": sum(relations.values()),
+                "relations": dict(relations),
+                "aggregated": True
+            })
+
+        nodes = []
+        for cluster in self.members:
+            if cluster not in expanded:
+                nodes.append(self._cluster_node(cluster))
+                continue
+            for entity in self.members[cluster]:
+                nodes.append({
+                    "name": entity,
+                    "id": entity,
+                    "category": 1 if entity == cluster else 0,
+                    "cluster": cluster,
+                    "degree": self.adjacency.degree(entity)
+                })
+
+        return {
+            "nodes": nodes,
+            "links": links,
+            "expanded": sorted(expanded),
+            "missing_clusters": missing,
+            "cluster_count": len(self.members)
+        }
+
+
+def get_cluster_index(snapshot: GraphSnapshot) -> ClusterIndex:
+    """获取快照对应的LOD簇索引（按版本缓存）"""
+    return snapshot.derived("cluster_index", ClusterIndex)
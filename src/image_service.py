@@ -12,6 +12,8 @@ from pathlib import Path
 import numpy as np
 from PIL import Image
 import cv2
+from triple_store import get_triple_store
+from storage import run_with_connection
 
 logger = logging.getLogger(__name__)
 
@@ -1080,18 +1082,21 @@ class KnowledgeInferenceService:
             symptoms = [e for e in detected_entities if e["type"] == "disease_symptom"]
             trees = [e for e in detected_entities if e["type"] == "tree"]
             
-            # 2. 从知识图谱中查询相关信息
-            with self._get_db_connection() as conn:
+            # 2. 从知识图谱中查询相关信息（在数据库线程池中执行）
+            def query(conn):
                 cursor = conn.cursor()
                 
                 # 查询相关的疾病信息
-                disease_info = await self._query_disease_info(cursor, detected_entities)
+                disease_info = self._query_disease_info(cursor, detected_entities)
                 
                 # 查询传播路径
-                transmission_info = await self._query_transmission_paths(cursor, insects)
+                transmission_info = self._query_transmission_paths(cursor, insects)
                 
                 # 查询防治措施
-                treatment_info = await self._query_treatment_methods(cursor, disease_info)
+                treatment_info = self._query_treatment_methods(cursor, disease_info)
+                return disease_info, transmission_info, treatment_info
+            
+            disease_info, transmission_info, treatment_info = await run_with_connection(query)
             
             # 3. 使用AI进行深度分析
             kimi = get_kimi_service()
@@ -1122,12 +1127,7 @@ class KnowledgeInferenceService:
             logger.error(f"病害预测分析失败: {e}")
             raise
     
-    def _get_db_connection(self):
-        """获取数据库连接"""
-        import pymysql
-        return pymysql.connect(**self.db_config)
-    
-    async def _query_disease_info(self, cursor, entities: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def _query_disease_info(self, cursor, entities: List[Dict[str, Any]]) -> Dict[str, Any]:
         """查询疾病相关信息"""
         diseases = []
         
@@ -1137,19 +1137,13 @@ class KnowledgeInferenceService:
                 entity_name = entity["matched_kb_entity"] or entity["name"]
                 
                 # 查询与症状相关的疾病
-                cursor.execute("""
-                    SELECT DISTINCT tail_entity as disease
-                    FROM knowledge_triples 
-                    WHERE head_entity = %s AND relation IN ('症状', '表现', '导致')
-                """, (entity_name,))
-                
-                for row in cursor.fetchall():
-                    if row["disease"] not in diseases:
-                        diseases.append(row["disease"])
+                for row in get_triple_store().find_by_head(cursor, entity_name, ('症状', '表现', '导致')):
+                    if row["tail_entity"] not in diseases:
+                        diseases.append(row["tail_entity"])
         
         return {"diseases": diseases}
     
-    async def _query_transmission_paths(self, cursor, insects: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def _query_transmission_paths(self, cursor, insects: List[Dict[str, Any]]) -> Dict[str, Any]:
         """查询传播路径信息"""
         transmission_paths = []
         
@@ -1157,13 +1151,7 @@ class KnowledgeInferenceService:
             insect_name = insect["matched_kb_entity"] or insect["name"]
             
             # 查询昆虫的传播作用
-            cursor.execute("""
-                SELECT head_entity, relation, tail_entity
-                FROM knowledge_triples 
-                WHERE head_entity = %s AND relation IN ('传播', '携带', '媒介')
-            """, (insect_name,))
-            
-            for row in cursor.fetchall():
+            for row in get_triple_store().find_by_head(cursor, insect_name, ('传播', '携带', '媒介')):
                 transmission_paths.append({
                     "vector": row["head_entity"],
                     "relation": row["relation"], 
@@ -1172,22 +1160,16 @@ class KnowledgeInferenceService:
         
         return {"paths": transmission_paths}
     
-    async def _query_treatment_methods(self, cursor, disease_info: Dict[str, Any]) -> Dict[str, Any]:
+    def _query_treatment_methods(self, cursor, disease_info: Dict[str, Any]) -> Dict[str, Any]:
         """查询防治方法"""
         treatments = []
         
         for disease in disease_info.get("diseases", []):
             # 查询防治方法
-            cursor.execute("""
-                SELECT tail_entity as treatment
-                FROM knowledge_triples 
-                WHERE head_entity = %s AND relation IN ('防治', '治疗', '控制')
-            """, (disease,))
-            
-            for row in cursor.fetchall():
+            for row in get_triple_store().find_by_head(cursor, disease, ('防治', '治疗', '控制')):
                 treatments.append({
                     "disease": disease,
-                    "treatment": row["treatment"]
+                    "treatment": row["tail_entity"]
                 })
         
         return {"treatments": treatments}
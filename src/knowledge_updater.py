@@ -6,7 +6,12 @@ import logging
 from typing import Dict, List, Optional, Any, Tuple
 import json
 from contextlib import contextmanager
-import pymysql
+from fastapi.concurrency import run_in_threadpool
+from graph_cache import bump_graph_version, record_graph_mutations
+from triple_store import get_triple_store
+from graph_index import find_relationships_among
+from storage import get_storage, run_with_connection
+from reference_data import get_reference_data_cache
 
 logger = logging.getLogger(__name__)
 
@@ -43,12 +48,9 @@ class KnowledgeGraphUpdater:
     
     @contextmanager
     def get_db(self):
-        """数据库连接上下文管理器"""
-        conn = pymysql.connect(**self.db_config)
-        try:
+        """数据库连接上下文管理器（从存储后端借用）"""
+        with get_storage().connection() as conn:
             yield conn
-        finally:
-            conn.close()
     
     async def process_image_analysis_result(self, analysis_result: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -65,37 +67,76 @@ class KnowledgeGraphUpdater:
             "new_relations_added": 0,
             "features_updated": 0,
             "skipped_low_confidence": 0,
-            "updates": []
+            "updates": [],
+            "added_triples": []  # 已插入的三元组（含ID），供客户端增量更新图谱
         }
+        succeeded = False
         
         detected_entities = analysis_result.get("detected_entities", [])
         
-        try:
-            with self.get_db() as conn:
-                for entity in detected_entities:
-                    # 检查是否需要添加新实体
-                    if await self._should_add_entity(entity):
-                        await self._add_new_entity(conn, entity, update_stats)
-                    
-                    # 检查是否需要添加新关系
-                    if len(detected_entities) > 1:
-                        await self._process_entity_relationships(conn, detected_entities, update_stats)
-                
-                # 处理实体间的关系发现
-                await self._discover_and_add_relationships(conn, detected_entities, update_stats)
+        def apply(conn):
+            for entity in detected_entities:
+                # 检查是否需要添加新实体
+                if self._should_add_entity(conn, entity):
+                    self._add_new_entity(conn, entity, update_stats)
                 
+                # 检查是否需要添加新关系
+                if len(detected_entities) > 1:
+                    self._process_entity_relationships(conn, detected_entities, update_stats)
+            
+            # 查出需要AI推理关系的实体对，推理期间不占用连接和事务
+            return self._pairs_to_infer(conn, detected_entities)
+        
+        def insert_inferred(conn):
+            cursor = conn.cursor()
+            for name_a, relation, name_b in inferred:
+                self._add_relationship_if_not_exists(cursor, name_a, relation, name_b, update_stats)
+            conn.commit()
+        
+        try:
+            # 数据库读写在数据库线程池中执行，不阻塞事件循环
+            pairs, valid_relations = await run_with_connection(apply)
+            
+            # 处理实体间的关系发现：逐对调用Kimi API（阻塞的HTTP请求）在通用线程池中执行，
+            # 推理结果再用一个短事务写入
+            inferred = await run_in_threadpool(self._infer_relationships, pairs, valid_relations)
+            if inferred:
+                await run_with_connection(insert_inferred)
+            succeeded = True
             logger.info(f"知识图谱更新完成: {update_stats}")
             return update_stats
             
         except Exception as e:
             logger.error(f"知识图谱更新失败: {e}")
             raise
+        finally:
+            # 有新增内容时记录图谱变更；失败时无法确定哪些已提交，通知客户端全量重载
+            if update_stats["added_triples"]:
+                if succeeded:
+                    record_graph_mutations(
+                        [
+                            {
+                                "op": "add_edge",
+                                "edge": {
+                                    "id": triple["id"],
+                                    "source": triple["head_entity"],
+                                    "target": triple["tail_entity"],
+                                    "value": triple["relation"]
+                                }
+                            }
+                            for triple in update_stats["added_triples"]
+                        ],
+                        "知识图谱自动更新"
+                    )
+                else:
+                    bump_graph_version("知识图谱自动更新失败")
     
-    async def _should_add_entity(self, entity: Dict[str, Any]) -> bool:
+    def _should_add_entity(self, conn, entity: Dict[str, Any]) -> bool:
         """
         判断是否应该添加新实体
         
         Args:
+            conn: 数据库连接
             entity: 检测到的实体
             
         Returns:
@@ -116,7 +157,7 @@ class KnowledgeGraphUpdater:
             actual_name = entity_name.split(":", 1)[1].strip() if ":" in entity_name else entity_name.split("：", 1)[1].strip()
             
             # 检查数据库中是否已存在该实体
-            if self._entity_exists_in_db(actual_name):
+            if self._entity_exists_in_db(actual_name, conn):
                 logger.info(f"实体 {actual_name} 已存在于数据库中，跳过未知实体 {entity_name} 的添加")
                 return False
         
@@ -126,31 +167,28 @@ class KnowledgeGraphUpdater:
         
         return False
     
-    def _entity_exists_in_db(self, entity_name: str) -> bool:
+    def _entity_exists_in_db(self, entity_name: str, conn=None) -> bool:
         """
         检查实体是否已存在于数据库中
         
         Args:
             entity_name: 实体名称
+            conn: 复用的数据库连接（为空时从连接池借用）
             
         Returns:
             是否存在
         """
         try:
+            if conn is not None:
+                return get_triple_store().entity_exists(conn.cursor(), entity_name)
             with self.get_db() as conn:
                 cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT COUNT(*) as cnt FROM knowledge_triples 
-                    WHERE head_entity = %s OR tail_entity = %s
-                """, (entity_name, entity_name))
-                
-                result = cursor.fetchone()
-                return result["cnt"] > 0
+                return get_triple_store().entity_exists(cursor, entity_name)
         except Exception as e:
             logger.error(f"检查实体存在性失败: {e}")
             return False
     
-    async def _add_new_entity(self, conn, entity: Dict[str, Any], update_stats: Dict[str, Any]):
+    def _add_new_entity(self, conn, entity: Dict[str, Any], update_stats: Dict[str, Any]):
         """
         添加新实体到知识图谱
         
@@ -166,12 +204,7 @@ class KnowledgeGraphUpdater:
             entity_type = entity["type"] 
             
             # 1. 检查实体是否已存在
-            cursor.execute("""
-                SELECT COUNT(*) as cnt FROM knowledge_triples 
-                WHERE head_entity = %s OR tail_entity = %s
-            """, (entity_name, entity_name))
-            
-            if cursor.fetchone()["cnt"] > 0:
+            if get_triple_store().entity_exists(cursor, entity_name):
                 logger.info(f"实体 {entity_name} 已存在，跳过添加")
                 return
             
@@ -179,16 +212,14 @@ class KnowledgeGraphUpdater:
             entity_type_cn = self.entity_type_mapping.get(entity_type, "未知类型")
             
             # 添加实体类型关系
-            cursor.execute("""
-                INSERT INTO knowledge_triples (head_entity, relation, tail_entity)
-                VALUES (%s, %s, %s)
-            """, (entity_name, "属于", entity_type_cn))
+            added_triples = [self._insert_triple(cursor, entity_name, "属于", entity_type_cn)]
             
             # 3. 根据特征添加更多关系
             features = entity.get("features", {})
-            await self._add_feature_relations(cursor, entity_name, features)
+            added_triples.extend(self._add_feature_relations(cursor, entity_name, features))
             
             conn.commit()
+            update_stats["added_triples"].extend(added_triples)
             
             update_stats["new_entities_added"] += 1
             update_stats["updates"].append({
@@ -204,7 +235,22 @@ class KnowledgeGraphUpdater:
             logger.error(f"添加实体失败: {e}")
             conn.rollback()
     
-    async def _add_feature_relations(self, cursor, entity_name: str, features: Dict[str, Any]):
+    def _insert_triple(self, cursor, head_entity: str, relation: str, tail_entity: str) -> Dict[str, Any]:
+        """
+        插入一条三元组
+        
+        Returns:
+            插入的三元组（含ID）
+        """
+        triple_id = get_triple_store().insert_triple(cursor, head_entity, relation, tail_entity)
+        return {
+            "id": triple_id,
+            "head_entity": head_entity,
+            "relation": relation,
+            "tail_entity": tail_entity
+        }
+    
+    def _add_feature_relations(self, cursor, entity_name: str, features: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
         根据实体特征添加关系
         
@@ -212,14 +258,16 @@ class KnowledgeGraphUpdater:
             cursor: 数据库游标
             entity_name: 实体名称
             features: 特征字典
+            
+        Returns:
+            插入的三元组列表
         """
+        added_triples = []
+        
         # 颜色特征
         if "dominant_color" in features:
             color = features["dominant_color"]
-            cursor.execute("""
-                INSERT INTO knowledge_triples (head_entity, relation, tail_entity)
-                VALUES (%s, %s, %s)
-            """, (entity_name, "颜色", color))
+            added_triples.append(self._insert_triple(cursor, entity_name, "颜色", color))
         
         # 大小特征
         if "area" in features:
@@ -231,19 +279,15 @@ class KnowledgeGraphUpdater:
             else:
                 size = "小型"
             
-            cursor.execute("""
-                INSERT INTO knowledge_triples (head_entity, relation, tail_entity)
-                VALUES (%s, %s, %s)
-            """, (entity_name, "大小", size))
+            added_triples.append(self._insert_triple(cursor, entity_name, "大小", size))
         
         # 纹理特征
         if "texture_roughness" in features and features["texture_roughness"] > 100:
-            cursor.execute("""
-                INSERT INTO knowledge_triples (head_entity, relation, tail_entity)
-                VALUES (%s, %s, %s)
-            """, (entity_name, "纹理", "粗糙"))
+            added_triples.append(self._insert_triple(cursor, entity_name, "纹理", "粗糙"))
+        
+        return added_triples
     
-    async def _process_entity_relationships(self, conn, detected_entities: List[Dict[str, Any]], update_stats: Dict[str, Any]):
+    def _process_entity_relationships(self, conn, detected_entities: List[Dict[str, Any]], update_stats: Dict[str, Any]):
         """
         处理多个实体间的关系
         
@@ -262,7 +306,7 @@ class KnowledgeGraphUpdater:
         # 昆虫-症状关系（传播关系）
         for insect in insects:
             for symptom in symptoms:
-                await self._add_relationship_if_not_exists(
+                self._add_relationship_if_not_exists(
                     cursor, 
                     insect["matched_kb_entity"] or insect["name"],
                     "传播",
@@ -273,7 +317,7 @@ class KnowledgeGraphUpdater:
         # 树种-症状关系（易感关系）
         for tree in trees:
             for symptom in symptoms:
-                await self._add_relationship_if_not_exists(
+                self._add_relationship_if_not_exists(
                     cursor,
                     tree["matched_kb_entity"] or tree["name"],
                     "易感",
@@ -284,7 +328,7 @@ class KnowledgeGraphUpdater:
         # 昆虫-树种关系（寄主关系）
         for insect in insects:
             for tree in trees:
-                await self._add_relationship_if_not_exists(
+                self._add_relationship_if_not_exists(
                     cursor,
                     insect["matched_kb_entity"] or insect["name"],
                     "寄主",
@@ -294,7 +338,7 @@ class KnowledgeGraphUpdater:
         
         conn.commit()
     
-    async def _add_relationship_if_not_exists(self, cursor, head_entity: str, relation: str, tail_entity: str, update_stats: Dict[str, Any]):
+    def _add_relationship_if_not_exists(self, cursor, head_entity: str, relation: str, tail_entity: str, update_stats: Dict[str, Any]):
         """
         如果关系不存在，则添加关系
         
@@ -306,17 +350,11 @@ class KnowledgeGraphUpdater:
             update_stats: 更新统计
         """
         # 检查关系是否已存在
-        cursor.execute("""
-            SELECT COUNT(*) as cnt FROM knowledge_triples 
-            WHERE head_entity = %s AND relation = %s AND tail_entity = %s
-        """, (head_entity, relation, tail_entity))
-        
-        if cursor.fetchone()["cnt"] == 0:
+        if not get_triple_store().triple_exists(cursor, head_entity, relation, tail_entity):
             # 添加新关系
-            cursor.execute("""
-                INSERT INTO knowledge_triples (head_entity, relation, tail_entity)
-                VALUES (%s, %s, %s)
-            """, (head_entity, relation, tail_entity))
+            update_stats["added_triples"].append(
+                self._insert_triple(cursor, head_entity, relation, tail_entity)
+            )
             
             update_stats["new_relations_added"] += 1
             update_stats["updates"].append({
@@ -328,52 +366,65 @@ class KnowledgeGraphUpdater:
             
             logger.info(f"添加新关系: {head_entity} --[{relation}]--> {tail_entity}")
     
-    async def _discover_and_add_relationships(self, conn, detected_entities: List[Dict[str, Any]], update_stats: Dict[str, Any]):
+    def _pairs_to_infer(self, conn, detected_entities: List[Dict[str, Any]]) -> Tuple[List[Tuple[str, str]], List[str]]:
         """
-        通过AI推理发现新的关系
+        查出需要通过AI推理关系的实体对
         
         Args:
             conn: 数据库连接
             detected_entities: 检测到的实体列表
-            update_stats: 更新统计
+            
+        Returns:
+            (实体对列表, 有效关系列表)
         """
-        from ai_service import get_kimi_service
-        
         cursor = conn.cursor()
-        kimi = get_kimi_service()
         
         # 获取有效关系列表
-        cursor.execute("SELECT relation_name FROM valid_relations")
-        valid_relations = [row["relation_name"] for row in cursor.fetchall()]
+        valid_relations = get_reference_data_cache().valid_relations(cursor)
         
         if len(detected_entities) < 2 or not valid_relations:
-            return
+            return [], valid_relations
+        
+        # 一次查出实体间已有的边（本事务中刚添加的实体和边也要看到，不使用内存快照）；
+        # 已有边或已列出的实体对不再推理
+        names = [entity["matched_kb_entity"] or entity["name"] for entity in detected_entities]
+        skipped_pairs = {
+            frozenset((row["head_entity"], row["tail_entity"]))
+            for row in find_relationships_among(cursor, names, use_snapshot=False)
+        }
         
-        # 对实体两两配对进行关系推理
-        for i, entity_a in enumerate(detected_entities):
-            for entity_b in detected_entities[i+1:]:
-                name_a = entity_a["matched_kb_entity"] or entity_a["name"]
-                name_b = entity_b["matched_kb_entity"] or entity_b["name"]
-                
-                # 检查是否已存在关系
-                cursor.execute("""
-                    SELECT COUNT(*) as cnt FROM knowledge_triples 
-                    WHERE (head_entity = %s AND tail_entity = %s) 
-                       OR (head_entity = %s AND tail_entity = %s)
-                """, (name_a, name_b, name_b, name_a))
-                
-                if cursor.fetchone()["cnt"] == 0:
-                    # 使用AI推理关系
-                    try:
-                        inferred_relation = kimi.infer_relation(name_a, name_b, valid_relations)
-                        if inferred_relation and inferred_relation in valid_relations:
-                            await self._add_relationship_if_not_exists(
-                                cursor, name_a, inferred_relation, name_b, update_stats
-                            )
-                    except Exception as e:
-                        logger.warning(f"关系推理失败: {name_a} <-> {name_b}, 错误: {e}")
+        pairs = []
+        for i, name_a in enumerate(names):
+            for name_b in names[i+1:]:
+                pair = frozenset((name_a, name_b))
+                if pair not in skipped_pairs:
+                    skipped_pairs.add(pair)
+                    pairs.append((name_a, name_b))
+        return pairs, valid_relations
+    
+    def _infer_relationships(self, pairs: List[Tuple[str, str]], valid_relations: List[str]) -> List[Tuple[str, str, str]]:
+        """
+        通过AI推理实体对之间的关系（不访问数据库）
         
-        conn.commit()
+        Args:
+            pairs: 实体对列表
+            valid_relations: 有效关系列表
+            
+        Returns:
+            推理出有效关系的三元组 [(头实体, 关系, 尾实体), ...]
+        """
+        from ai_service import get_kimi_service
+        
+        kimi = get_kimi_service()
+        inferred = []
+        for name_a, name_b in pairs:
+            try:
+                inferred_relation = kimi.infer_relation(name_a, name_b, valid_relations)
+                if inferred_relation and inferred_relation in valid_relations:
+                    inferred.append((name_a, inferred_relation, name_b))
+            except Exception as e:
+                logger.warning(f"关系推理失败: {name_a} <-> {name_b}, 错误: {e}")
+        return inferred
     
     async def update_entity_features(self, entity_name: str, new_features: Dict[str, Any]) -> bool:
         """
@@ -387,23 +438,10 @@ class KnowledgeGraphUpdater:
             是否更新成功
         """
         try:
-            with self.get_db() as conn:
+            def update(conn):
                 cursor = conn.cursor()
                 
-                # 检查是否存在特征表（如果没有可以创建）
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS entity_features (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
-                        entity_name VARCHAR(255) NOT NULL,
-                        feature_type VARCHAR(100) NOT NULL,
-                        feature_value TEXT,
-                        confidence FLOAT DEFAULT 1.0,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        INDEX idx_entity_name (entity_name)
-                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-                """)
-                
-                # 插入或更新特征
+                # 插入或更新特征（特征表由 schema_migrations 创建）
                 for feature_type, feature_value in new_features.items():
                     # 检查特征是否已存在
                     cursor.execute("""
@@ -428,7 +466,9 @@ class KnowledgeGraphUpdater:
                 conn.commit()
                 logger.info(f"成功更新实体 {entity_name} 的特征")
                 return True
-                
+
+            return await run_with_connection(update)
+        
         except Exception as e:
             logger.error(f"更新实体特征失败: {e}")
             return False
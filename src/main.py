@@ -1,8 +1,10 @@
 """
 松材线虫病知识图谱系统 - FastAPI后端
 """
-from fastapi import FastAPI, HTTPException, File, UploadFile, Form, Query, Body
+from fastapi import FastAPI, HTTPException, File, UploadFile, Form, Query, Body, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 import pymysql
@@ -10,9 +12,34 @@ import logging
 from contextlib import contextmanager
 import os
 from pathlib import Path
+from datetime import datetime
 import time
 import uvicorn
 import json
+import asyncio
+from graph_cache import get_graph_snapshot_cache, bump_graph_version, record_graph_mutations
+from triple_store import get_triple_store
+from graph_index import find_relationships_among
+from db_manager import run_db
+from storage import init_storage, create_backend, get_storage, run_with_connection, INTEGRITY_ERRORS
+from triple_import import (
+    import_triples,
+    iter_triples,
+    detect_format,
+    open_text,
+    DEFAULT_BATCH_SIZE as DEFAULT_IMPORT_BATCH_SIZE
+)
+from batch_edit import BatchEditor, MAX_BATCH_OPERATIONS
+from reference_data import get_reference_data_cache
+from analysis_results import new_analysis_id, compress_result, decompress_result
+from repositories import (
+    get_high_level_node_repository,
+    get_analysis_history_repository,
+    get_analysis_result_repository,
+    encode_page_cursor,
+    decode_page_cursor,
+    ROLLUP_GRANULARITIES
+)
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -37,6 +64,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 # MySQL数据库配置
@@ -50,8 +78,6 @@ DB_CONFIG = {
     'cursorclass': pymysql.cursors.DictCursor
 }
 
-HIGH_LEVEL_NODE_TABLE = "graph_high_level_nodes"
-
 _CORE_HIGH_LEVEL_NODE_RECORDS = [
     {"node_name": "松材线虫病", "node_type": "core", "description": "核心病害概念"},
     {"node_name": "松材线虫", "node_type": "core", "description": "主要病原线虫"},
@@ -106,6 +132,24 @@ class UpdateNode(BaseModel):
     new_name: str
 
 
+class BatchOperation(BaseModel):
+    """批量编辑中的单个操作（各操作类型使用的字段见 batch_edit.py）"""
+    op: str  # rename_node, merge_nodes, delete_node, update_edge, delete_edge
+    name: Optional[str] = None
+    old_name: Optional[str] = None
+    new_name: Optional[str] = None
+    id: Optional[int] = None
+    head_entity: Optional[str] = None
+    relation: Optional[str] = None
+    tail_entity: Optional[str] = None
+
+
+class BatchEditRequest(BaseModel):
+    """批量编辑请求模型"""
+    operations: List[BatchOperation]
+    atomic: bool = True  # 任一操作未成功时回滚整批
+
+
 class GraphResponse(BaseModel):
     """图谱响应模型"""
     nodes: List[dict]
@@ -145,82 +189,22 @@ class HighLevelNodePayload(BaseModel):
 # ==================== 数据库操作 ====================
 @contextmanager
 def get_db():
-    """数据库连接上下文管理器"""
-    conn = pymysql.connect(**DB_CONFIG)
-    try:
+    """数据库连接上下文管理器（从存储后端借用，退出时归还）"""
+    with get_storage().connection() as conn:
         yield conn
-    finally:
-        conn.close()
 
 
 def init_database():
-    """初始化数据库"""
-    with get_db() as conn:
-        cursor = conn.cursor()
-        
-        # 创建三元组表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS knowledge_triples (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                head_entity VARCHAR(255) NOT NULL,
-                relation VARCHAR(100) NOT NULL,
-                tail_entity VARCHAR(255) NOT NULL,
-                INDEX idx_head_entity (head_entity),
-                INDEX idx_tail_entity (tail_entity)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        """)
-        
-        # 创建有效关系表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS valid_relations (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                relation_name VARCHAR(100) UNIQUE NOT NULL
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        """)
-        
-        # 创建高级节点专用表
-        cursor.execute(f"""
-            CREATE TABLE IF NOT EXISTS {HIGH_LEVEL_NODE_TABLE} (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                node_name VARCHAR(255) UNIQUE NOT NULL,
-                node_type ENUM('core', 'generic') DEFAULT 'generic',
-                description VARCHAR(512) DEFAULT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                INDEX idx_node_name (node_name)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        """)
-        
-        # 创建图像分析历史表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS image_analysis_history (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                analysis_id VARCHAR(100) NOT NULL UNIQUE,
-                timestamp DATETIME NOT NULL,
-                entity_count INT NOT NULL,
-                detected_types JSON NOT NULL,
-                confidence FLOAT NOT NULL,
-                risk_level VARCHAR(20) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                INDEX idx_timestamp (timestamp),
-                INDEX idx_analysis_id (analysis_id)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        """)
-        
-        conn.commit()
-        logger.info("数据库初始化完成")
+    """初始化数据库（按版本执行结构迁移，已是最新版本时不执行DDL）"""
+    get_storage().migrate()
+    logger.info("数据库初始化完成")
 
 
 # ==================== 高级节点管理 ====================
 def load_high_level_nodes_from_db() -> set:
-    """从数据库加载高级节点"""
+    """加载高级节点（经参考数据缓存，仅在缓存过期时查询数据库）"""
     try:
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute(f"SELECT node_name FROM {HIGH_LEVEL_NODE_TABLE}")
-            nodes = {row["node_name"] for row in cursor.fetchall()}
-            logger.info(f"从数据库加载了 {len(nodes)} 个高级节点")
-            return nodes
+        return get_reference_data_cache().high_level_nodes()
     except Exception as e:
         logger.error(f"从数据库加载高级节点失败: {e}")
         return set()
@@ -237,30 +221,35 @@ def save_high_level_nodes_to_db(high_level_nodes: set, replace_all: bool = False
     try:
         with get_db() as conn:
             cursor = conn.cursor()
+            repository = get_high_level_node_repository()
             
             if replace_all:
                 # 完全替换：删除所有旧节点
-                cursor.execute(f"DELETE FROM {HIGH_LEVEL_NODE_TABLE}")
+                repository.remove_all(cursor)
                 logger.info("已清除所有旧的高级节点")
             
             # 获取现有的高级节点
-            cursor.execute(f"SELECT node_name FROM {HIGH_LEVEL_NODE_TABLE}")
-            existing_nodes = {row["node_name"] for row in cursor.fetchall()}
+            existing_nodes = repository.list_names(cursor)
             
             # 找出新增的节点
             new_nodes = high_level_nodes - existing_nodes
             
             if new_nodes:
                 # 插入新节点
-                cursor.executemany(
-                    f"INSERT IGNORE INTO {HIGH_LEVEL_NODE_TABLE} (node_name) VALUES (%s)",
-                    [(node,) for node in new_nodes]
-                )
+                repository.add_many(cursor, [{"node_name": node} for node in new_nodes])
                 conn.commit()
                 logger.info(f"新增 {len(new_nodes)} 个高级节点到数据库: {new_nodes}")
             else:
                 logger.info("没有新增的高级节点")
             
+            if replace_all:
+                bump_graph_version("替换高级节点")
+            elif new_nodes:
+                record_graph_mutations(
+                    [{"op": "set_high_level", "name": node, "high_level": True} for node in new_nodes],
+                    "保存高级节点"
+                )
+            
             # 如果完全替换，返回新的节点集合；否则返回合并后的
             if replace_all:
                 return high_level_nodes
@@ -286,23 +275,15 @@ def init_default_high_level_nodes():
     try:
         with get_db() as conn:
             cursor = conn.cursor()
-            cursor.execute(f"SELECT COUNT(*) as cnt FROM {HIGH_LEVEL_NODE_TABLE}")
-            count = cursor.fetchone()["cnt"]
+            repository = get_high_level_node_repository()
+            count = repository.count(cursor)
             
             if count == 0:
                 # 数据库为空，初始化默认列表
                 default_nodes = get_default_high_level_node_records()
-                cursor.executemany(
-                    f"""
-                    INSERT IGNORE INTO {HIGH_LEVEL_NODE_TABLE} (node_name, node_type, description) 
-                    VALUES (%s, %s, %s)
-                    """,
-                    [
-                        (node["node_name"], node.get("node_type", "generic"), node.get("description"))
-                        for node in default_nodes
-                    ]
-                )
+                repository.add_many(cursor, default_nodes)
                 conn.commit()
+                get_reference_data_cache().invalidate()
                 logger.info(f"初始化了 {len(default_nodes)} 个默认高级节点到数据库")
                 return {node["node_name"] for node in default_nodes}
             else:
@@ -317,6 +298,7 @@ def init_default_high_level_nodes():
 @app.on_event("startup")
 async def startup_event():
     """应用启动时初始化数据库和AI服务"""
+    init_storage(create_backend(DB_CONFIG))
     init_database()
     
     # 初始化AI服务
@@ -325,6 +307,13 @@ async def startup_event():
     kimi_api_key = os.getenv("MOONSHOT_API_KEY")
     init_ai_services(word2vec_path, kimi_api_key)
     
+    # 构建实体向量索引（之后随图谱变更增量维护）
+    try:
+        from embedding_index import get_entity_embedding_index
+        await run_in_threadpool(get_entity_embedding_index().rebuild, await get_graph_snapshot())
+    except Exception as e:
+        logger.warning(f"实体向量索引构建失败，将在首次查询时重试: {e}")
+    
     # 初始化图像分析服务
     from image_service import init_image_services
     from knowledge_updater import init_knowledge_updater
@@ -343,68 +332,416 @@ async def root():
     return {"message": "松材线虫病知识图谱系统API", "version": "1.0.0"}
 
 
+def _load_graph_data():
+    """
+    从数据库加载构建图谱快照所需的数据
+
+    Returns:
+        (三元组列表, 高级节点集合)
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+
+        # 查询所有三元组
+        triples = get_triple_store().fetch_all(cursor)
+
+    # 从数据库加载高级节点（持久化存储）
+    high_level_nodes = load_high_level_nodes_from_db()
+
+    # 如果数据库中没有高级节点，初始化默认列表
+    if not high_level_nodes:
+        high_level_nodes = init_default_high_level_nodes()
+        # 只保留在图谱中实际存在的节点
+        nodes_set = {triple[1] for triple in triples} | {triple[3] for triple in triples}
+        high_level_nodes = high_level_nodes.intersection(nodes_set)
+    else:
+        logger.info(f"从数据库加载高级节点，共 {len(high_level_nodes)} 个")
+
+    return triples, high_level_nodes
+
+
+async def get_graph_snapshot():
+    """获取当前版本的图谱快照，需要重建时在数据库线程池中加载，不阻塞事件循环"""
+    cache = get_graph_snapshot_cache()
+    snapshot = cache.current()
+    if snapshot is None:
+        snapshot = await run_db(cache.get_snapshot, _load_graph_data)
+    return snapshot
+
+
 @app.get("/api/graph", response_model=GraphResponse)
-async def get_graph():
+async def get_graph(
+    if_none_match: Optional[str] = Header(default=None),
+    accept: Optional[str] = Header(default=None)
+):
     """
     获取完整知识图谱
     返回ECharts所需的nodes和links格式
-    
+
+    图谱数据来自进程内的版本化快照，只有写操作递增版本号后才会重建；
+    支持 ETag / If-None-Match 条件请求，未变化时返回 304
+
+    通过 Accept 请求头可选择紧凑二进制编码（字符串表 + 整数边数组）:
+    application/x-msgpack 或 application/vnd.kgraph.typed-array
+
     Args:
-        use_cache: 是否使用缓存的高级节点（默认True）
+        if_none_match: 客户端缓存的ETag
+        accept: 期望的响应编码
     """
+    from graph_codec import negotiate_graph_media_type, encode_graph, is_graph_encoded, ETAG_VARIANTS
+
+    cache = get_graph_snapshot_cache()
+    media_type = negotiate_graph_media_type(accept)
+    variant = ETAG_VARIANTS[media_type]
+    headers = {"Cache-Control": "no-cache", "Vary": "Accept"}
+
+    if cache.etag_matches(if_none_match, variant):
+        headers["ETag"] = cache.etag_for(cache.version, variant)
+        return Response(status_code=304, headers=headers)
+
     try:
-        with get_db() as conn:
-            cursor = conn.cursor()
+        snapshot = await get_graph_snapshot()
+        headers["ETag"] = cache.etag_for(snapshot.version, variant)
+        if is_graph_encoded(snapshot, media_type):
+            body = encode_graph(snapshot, media_type)
+        else:
+            # 每个版本首次请求时序列化（大图谱需要数百毫秒），放到线程池中执行，避免阻塞事件循环
+            body = await run_in_threadpool(encode_graph, snapshot, media_type)
+        return Response(
+            content=body,
+            media_type=media_type,
+            headers=headers
+        )
 
-            # 查询所有三元组
-            cursor.execute("SELECT * FROM knowledge_triples")
-            triples = cursor.fetchall()
+    except Exception as e:
+        logger.error(f"获取图谱失败: {e}")
+        raise HTTPException(status_code=500, detail=f"获取图谱失败: {str(e)}")
+
+
+GRAPH_STREAM_CHUNK_LINES = 500
 
-            # 构建节点和边
-            nodes_set = set()
-            links = []
 
-            for triple in triples:
-                head = triple["head_entity"]
-                relation = triple["relation"]
-                tail = triple["tail_entity"]
+def _iter_graph_ndjson(high_level_nodes: set, version: int):
+    """
+    逐行读取三元组（MySQL 使用服务端非缓冲游标），按块产出NDJSON
+
+    每行一个JSON对象: meta / node / link / end，
+    节点在首次出现时输出，内存只随去重集合增长，与边数无关
+    """
+    def dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
 
-                nodes_set.add(head)
-                nodes_set.add(tail)
+    seen_nodes = set()
+    node_count = 0
+    link_count = 0
+    buffer = [dumps({"type": "meta", "version": version})]
 
-                links.append({
+    with get_db() as conn:
+        for row in get_triple_store().iter_named(conn):
+            head = row["head_entity"]
+            tail = row["tail_entity"]
+            for node in (head, tail):
+                if node not in seen_nodes:
+                    seen_nodes.add(node)
+                    node_count += 1
+                    buffer.append(dumps({
+                        "type": "node",
+                        "data": {
+                            "name": node,
+                            "id": node,
+                            "category": 1 if node in high_level_nodes else 0
+                        }
+                    }))
+
+            link_count += 1
+            buffer.append(dumps({
+                "type": "link",
+                "data": {
                     "source": head,
                     "target": tail,
-                    "value": relation,
-                    "id": triple["id"]
-                })
-
-            # 从数据库加载高级节点（持久化存储）
-            high_level_nodes = load_high_level_nodes_from_db()
-            
-            # 如果数据库中没有高级节点，初始化默认列表
-            if not high_level_nodes:
-                high_level_nodes = init_default_high_level_nodes()
-                # 只保留在图谱中实际存在的节点
-                high_level_nodes = high_level_nodes.intersection(nodes_set)
-            else:
-                logger.info(f"从数据库加载高级节点，共 {len(high_level_nodes)} 个")
-
-            # 转换节点格式，添加类别信息
-            nodes = []
-            for node in nodes_set:
-                node_data = {
-                    "name": node,
-                    "id": node,
-                    "category": 1 if node in high_level_nodes else 0  # 1=高级节点，0=普通节点
+                    "value": row["relation"],
+                    "id": row["id"]
                 }
-                nodes.append(node_data)
+            }))
+
+            if len(buffer) >= GRAPH_STREAM_CHUNK_LINES:
+                yield ("\n".join(buffer) + "\n").encode("utf-8")
+                buffer = []
+
+    buffer.append(dumps({"type": "end", "node_count": node_count, "link_count": link_count}))
+    yield ("\n".join(buffer) + "\n").encode("utf-8")
+    logger.info(f"流式导出图谱完成: {node_count} 个节点, {link_count} 条边")
 
-            return GraphResponse(nodes=nodes, links=links)
+
+@app.get("/api/graph/stream")
+async def stream_graph():
+    """
+    以NDJSON流式导出完整知识图谱
+    适用于超大图谱，服务端内存占用不随边数增长
+
+    Returns:
+        application/x-ndjson 分块响应，每行一个 meta/node/link/end 对象
+    """
+    try:
+        high_level_nodes = await run_db(load_high_level_nodes_from_db)
+        if not high_level_nodes:
+            high_level_nodes = await run_db(init_default_high_level_nodes)
+        version = get_graph_snapshot_cache().version
+
+        return StreamingResponse(
+            _iter_graph_ndjson(high_level_nodes, version),
+            media_type="application/x-ndjson"
+        )
 
     except Exception as e:
-        logger.error(f"获取图谱失败: {e}")
-        raise HTTPException(status_code=500, detail=f"获取图谱失败: {str(e)}")
+        logger.error(f"流式导出图谱失败: {e}")
+        raise HTTPException(status_code=500, detail=f"流式导出图谱失败: {str(e)}")
+
+
+@app.get("/api/graph/neighborhood")
+async def get_graph_neighborhood(
+    seeds: str = Query(..., description="逗号分隔的种子实体名称"),
+    depth: int = Query(default=1, ge=1, le=4, description="最大跳数"),
+    max_fanout: int = Query(default=50, ge=1, le=1000, description="每个实体最多展开的邻居数"),
+    max_nodes: int = Query(default=500, ge=1, le=10000, description="返回的最大节点数"),
+    relations: Optional[str] = Query(default=None, description="逗号分隔的关系过滤（可选）"),
+    direction: str = Query(default="both", description="扩展方向: out/in/both")
+):
+    """
+    获取种子实体的k跳邻域子图
+    基于内存邻接索引查询，供前端按需增量展开图谱
+
+    Returns:
+        与 /api/graph 相同格式的 nodes 和 links，节点额外包含 depth 和 degree
+    """
+    seed_names = [name.strip() for name in seeds.split(",") if name.strip()]
+    if not seed_names:
+        raise HTTPException(status_code=400, detail="种子实体不能为空")
+    if direction not in ("out", "in", "both"):
+        raise HTTPException(status_code=400, detail="direction 必须为 out、in 或 both")
+    relation_filter = None
+    if relations:
+        relation_filter = {name.strip() for name in relations.split(",") if name.strip()}
+
+    try:
+        from graph_index import get_adjacency_index
+
+        snapshot = await get_graph_snapshot()
+
+        def query():
+            return get_adjacency_index(snapshot).neighborhood(
+                seed_names,
+                depth=depth,
+                max_fanout=max_fanout,
+                max_nodes=max_nodes,
+                relations=relation_filter,
+                direction=direction
+            )
+
+        # 每个版本首次查询时构建邻接索引（O(E)），与邻域扩展一起放到线程池中执行，避免阻塞事件循环
+        subgraph = await run_in_threadpool(query)
+
+        if not subgraph["nodes"]:
+            raise HTTPException(status_code=404, detail=f"种子实体不存在于图谱中: {', '.join(seed_names)}")
+
+        return {
+            "seeds": seed_names,
+            "version": snapshot.version,
+            **subgraph
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"获取邻域子图失败: {e}")
+        raise HTTPException(status_code=500, detail=f"获取邻域子图失败: {str(e)}")
+
+
+@app.get("/api/graph/lod")
+async def get_graph_lod(
+    expand: Optional[str] = Query(default=None, description="逗号分隔的需要展开的簇（高级节点名称）")
+):
+    """
+    获取细节层次(LOD)聚合图谱
+    普通节点归入距离最近的高级节点簇，未展开的簇以超级节点（category=2）表示，
+    簇间的边聚合为一条带计数的边；通过 expand 逐个展开簇查看成员
+
+    Returns:
+        nodes: 超级节点（含 member_count、internal_edges）及已展开簇的成员节点（含 cluster）
+        links: 成员间的原始边，以及 aggregated=True 的聚合边（value 为边数，relations 为各关系边数）
+    """
+    expand_clusters = []
+    if expand:
+        expand_clusters = [name.strip() for name in expand.split(",") if name.strip()]
+
+    try:
+        from graph_lod import get_cluster_index
+
+        snapshot = await get_graph_snapshot()
+
+        def build_view():
+            index = get_cluster_index(snapshot)
+            if expand_clusters:
+                return index.view(expand_clusters)
+            # 首屏视图每个版本只计算一次
+            return snapshot.derived("lod_view", lambda _: index.view())
+
+        # 簇划分（多源BFS）和视图聚合为CPU密集型任务，放到线程池中执行，避免阻塞事件循环
+        view = await run_in_threadpool(build_view)
+
+        return {"version": snapshot.version, **view}
+
+    except Exception as e:
+        logger.error(f"获取LOD图谱失败: {e}")
+        raise HTTPException(status_code=500, detail=f"获取LOD图谱失败: {str(e)}")
+
+
+@app.get("/api/graph/layout")
+async def get_graph_layout(if_none_match: Optional[str] = Header(default=None)):
+    """
+    获取服务端预计算的图谱布局坐标
+    按图谱版本缓存，前端使用这些坐标以 layout: 'none' 直接渲染，无需在浏览器中运行力导向布局；
+    图谱小幅变更后以上一版本布局热启动，已有节点位置基本保持稳定
+
+    Args:
+        if_none_match: 客户端缓存的ETag
+
+    Returns:
+        version: 布局对应的图谱版本号
+        nodes: [{id, x, y}] 节点坐标
+        iterations / warm_start / elapsed_ms: 布局计算信息
+    """
+    from graph_layout import get_graph_layout_engine
+
+    cache = get_graph_snapshot_cache()
+    headers = {"Cache-Control": "no-cache"}
+
+    if cache.etag_matches(if_none_match, "layout"):
+        headers["ETag"] = cache.etag_for(cache.version, "layout")
+        return Response(status_code=304, headers=headers)
+
+    try:
+        snapshot = await get_graph_snapshot()
+
+        def encode_layout(_):
+            layout = get_graph_layout_engine().get_layout(snapshot)
+            return json.dumps(layout.to_response(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+        # 布局计算和序列化为CPU密集型任务，放到线程池中执行，避免阻塞事件循环；每个版本只计算一次
+        body = await run_in_threadpool(snapshot.derived, "layout_json", encode_layout)
+        headers["ETag"] = cache.etag_for(snapshot.version, "layout")
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    except Exception as e:
+        logger.error(f"获取图谱布局失败: {e}")
+        raise HTTPException(status_code=500, detail=f"获取图谱布局失败: {str(e)}")
+
+
+GRAPH_CHANGES_HEARTBEAT_SECONDS = 15
+
+
+@app.get("/api/graph/changes")
+async def get_graph_changes(since: int = Query(..., ge=0, description="客户端当前持有的图谱版本号")):
+    """
+    获取指定版本之后的图谱变更（增量同步）
+
+    Returns:
+        epoch: 服务进程标识，与客户端记录不一致时需全量重载
+        version: 当前版本号
+        reset: 为True时变更已超出日志保留范围，需重新拉取 /api/graph
+        changes: 按 seq 排序的变更列表
+    """
+    cache = get_graph_snapshot_cache()
+    version, changes = cache.changes_since(since)
+    return {
+        "epoch": cache.epoch,
+        "version": version,
+        "reset": changes is None,
+        "changes": changes or []
+    }
+
+
+def _format_sse(event: str, data: dict, event_id: Optional[str] = None) -> str:
+    """格式化一条SSE消息"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+@app.get("/api/graph/changes/stream")
+async def stream_graph_changes(
+    since: Optional[int] = Query(default=None, ge=0, description="从该版本之后开始推送（可选）"),
+    epoch: Optional[str] = Query(default=None, description="since 所属的服务进程标识（可选）"),
+    last_event_id: Optional[str] = Header(default=None)
+):
+    """
+    通过 Server-Sent Events 推送图谱变更
+
+    事件类型:
+        hello    - 连接建立，携带 epoch 和当前版本号
+        mutation - 一批已提交的变更（id 为 "epoch:版本号"，断线重连时浏览器自动携带 Last-Event-ID）
+        reset    - 变更无法增量同步（版本超出日志范围或来自其他进程），客户端需重新拉取 /api/graph
+    """
+    cache = get_graph_snapshot_cache()
+    reset = False
+    if last_event_id:
+        # 重连时 Last-Event-ID 比 URL 中的 since 更新；epoch 不同说明服务已重启，版本号不可比较
+        event_epoch, _, event_version = last_event_id.rpartition(":")
+        if event_epoch == cache.epoch and event_version.isdigit():
+            since = int(event_version)
+        else:
+            reset = True
+    elif since is not None and epoch is not None and epoch != cache.epoch:
+        reset = True
+
+    # 先订阅再读取积压变更，避免两者之间的变更丢失
+    queue = cache.subscribe()
+    if reset:
+        version, backlog = cache.version, None
+    else:
+        version, backlog = cache.changes_since(since if since is not None else cache.version)
+
+    async def event_stream():
+        last_version = since if since is not None else version
+        try:
+            yield _format_sse("hello", {"epoch": cache.epoch, "version": version})
+            if backlog is None:
+                yield _format_sse("reset", {"version": version}, f"{cache.epoch}:{version}")
+                last_version = version
+            elif backlog:
+                yield _format_sse("mutation", {"version": version, "changes": backlog}, f"{cache.epoch}:{version}")
+                last_version = version
+
+            while True:
+                try:
+                    changes = await asyncio.wait_for(queue.get(), timeout=GRAPH_CHANGES_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+
+                if changes is None:
+                    yield _format_sse("reset", {"version": cache.version})
+                    break
+
+                # 跳过已包含在积压变更中的部分
+                changes = [change for change in changes if change["version"] > last_version]
+                if not changes:
+                    continue
+                last_version = changes[-1]["version"]
+                yield _format_sse(
+                    "mutation", {"version": last_version, "changes": changes}, f"{cache.epoch}:{last_version}"
+                )
+        finally:
+            cache.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @app.delete("/api/node/delete")
@@ -413,29 +750,28 @@ async def delete_node(node: Node):
     删除节点及其相关的所有边
     """
     try:
-        with get_db() as conn:
+        def delete(conn):
             cursor = conn.cursor()
             
-            # 删除包含该节点的所有三元组
-            cursor.execute("""
-                DELETE FROM knowledge_triples 
-                WHERE head_entity = %s OR tail_entity = %s
-            """, (node.name, node.name))
+            # 删除包含该节点的所有三元组，记录被删除的边用于变更日志
+            edge_ids = get_triple_store().delete_entity(cursor, node.name)
+            deleted_count = len(edge_ids)
             
-            deleted_count = cursor.rowcount
+            # 如果删除的节点是高级节点，也从高级节点表中删除（与三元组在同一事务中提交）
+            if get_high_level_node_repository().remove(cursor, node.name):
+                logger.info(f"已从高级节点表中删除: {node.name}")
             conn.commit()
             
             logger.info(f"删除节点 {node.name}, 删除了 {deleted_count} 条记录")
             
-            # 如果删除的节点是高级节点，也从高级节点表中删除
-            try:
-                cursor.execute(f"DELETE FROM {HIGH_LEVEL_NODE_TABLE} WHERE node_name = %s", (node.name,))
-                conn.commit()
-                logger.info(f"已从高级节点表中删除: {node.name}")
-            except Exception as e:
-                logger.warning(f"从高级节点表删除失败: {e}")
+            record_graph_mutations(
+                [{"op": "delete_node", "name": node.name, "edge_ids": edge_ids}],
+                f"删除节点 {node.name}"
+            )
             
             return {"message": f"成功删除节点 {node.name}", "deleted_count": deleted_count}
+
+        return await run_with_connection(delete)
             
     except Exception as e:
         logger.error(f"删除节点失败: {e}")
@@ -448,42 +784,29 @@ async def update_node(update: UpdateNode):
     更新节点名称
     """
     try:
-        with get_db() as conn:
+        def rename(conn):
             cursor = conn.cursor()
             
-            # 更新头实体
-            cursor.execute("""
-                UPDATE knowledge_triples 
-                SET head_entity = %s 
-                WHERE head_entity = %s
-            """, (update.new_name, update.old_name))
-            
-            # 更新尾实体
-            cursor.execute("""
-                UPDATE knowledge_triples 
-                SET tail_entity = %s 
-                WHERE tail_entity = %s
-            """, (update.new_name, update.old_name))
+            # 更新头实体和尾实体
+            updated_count, merged_ids = get_triple_store().rename_entity(cursor, update.old_name, update.new_name)
             
-            updated_count = cursor.rowcount
+            # 如果旧节点是高级节点，更新高级节点表中的名称（与三元组在同一事务中提交）
+            if get_high_level_node_repository().rename(cursor, update.old_name, update.new_name) > 0:
+                logger.info(f"已更新高级节点表中的节点名称: {update.old_name} -> {update.new_name}")
             conn.commit()
             
             logger.info(f"更新节点 {update.old_name} -> {update.new_name}")
             
-            # 如果旧节点是高级节点，更新高级节点表中的名称
-            try:
-                cursor.execute(f"""
-                    UPDATE {HIGH_LEVEL_NODE_TABLE} 
-                    SET node_name = %s 
-                    WHERE node_name = %s
-                """, (update.new_name, update.old_name))
-                conn.commit()
-                if cursor.rowcount > 0:
-                    logger.info(f"已更新高级节点表中的节点名称: {update.old_name} -> {update.new_name}")
-            except Exception as e:
-                logger.warning(f"更新高级节点表失败: {e}")
+            # 合并到已有实体时，重复的边已被删除
+            record_graph_mutations(
+                [{"op": "delete_edge", "edge_id": edge_id} for edge_id in merged_ids]
+                + [{"op": "rename_node", "old_name": update.old_name, "new_name": update.new_name}],
+                f"更新节点 {update.old_name} -> {update.new_name}"
+            )
             
-            return {"message": f"成功更新节点", "updated_count": updated_count}
+            return {"message": f"成功更新节点", "updated_count": updated_count, "merged_count": len(merged_ids)}
+
+        return await run_with_connection(rename)
             
     except Exception as e:
         logger.error(f"更新节点失败: {e}")
@@ -496,18 +819,19 @@ async def delete_edge(edge_id: int):
     删除指定的边(三元组)
     """
     try:
-        with get_db() as conn:
+        def delete(conn):
             cursor = conn.cursor()
             
-            cursor.execute("DELETE FROM knowledge_triples WHERE id = %s", (edge_id,))
-            
-            if cursor.rowcount == 0:
+            if get_triple_store().delete_triple(cursor, edge_id) == 0:
                 raise HTTPException(status_code=404, detail="边不存在")
             
             conn.commit()
+            record_graph_mutations([{"op": "delete_edge", "edge_id": edge_id}], f"删除边 {edge_id}")
             
             logger.info(f"删除边 ID: {edge_id}")
             return {"message": f"成功删除边"}
+
+        return await run_with_connection(delete)
             
     except HTTPException:
         raise
@@ -525,47 +849,146 @@ async def update_edge(triple: Triple):
         if triple.id is None:
             raise HTTPException(status_code=400, detail="需要提供边的ID")
         
-        with get_db() as conn:
+        def update(conn):
             cursor = conn.cursor()
             
-            cursor.execute("""
-                UPDATE knowledge_triples 
-                SET head_entity = %s, relation = %s, tail_entity = %s
-                WHERE id = %s
-            """, (triple.head_entity, triple.relation, triple.tail_entity, triple.id))
+            updated = get_triple_store().update_triple(
+                cursor, triple.id, triple.head_entity, triple.relation, triple.tail_entity
+            )
             
-            if cursor.rowcount == 0:
+            if updated == 0:
                 raise HTTPException(status_code=404, detail="边不存在")
             
             conn.commit()
+            record_graph_mutations(
+                [{
+                    "op": "update_edge",
+                    "edge": {
+                        "id": triple.id,
+                        "source": triple.head_entity,
+                        "target": triple.tail_entity,
+                        "value": triple.relation
+                    }
+                }],
+                f"更新边 {triple.id}"
+            )
             
             logger.info(f"更新边 ID: {triple.id}")
             return {"message": "成功更新边"}
+
+        return await run_with_connection(update)
             
     except HTTPException:
         raise
+    except INTEGRITY_ERRORS:
+        raise HTTPException(status_code=409, detail="相同的三元组已存在")
     except Exception as e:
         logger.error(f"更新边失败: {e}")
         raise HTTPException(status_code=500, detail=f"更新边失败: {str(e)}")
 
 
+@app.post("/api/graph/batch")
+async def batch_edit_graph(request: BatchEditRequest):
+    """
+    批量编辑节点和边（重命名、合并、删除节点，更新、删除边）
+    所有操作在一个事务中按顺序执行，相邻的同类操作合并为集合SQL
+    
+    Returns:
+        applied: 是否已提交；results: 每个操作的结果（status 为 ok / not_found / conflict / invalid）；
+        summary: 各状态的数量
+    """
+    try:
+        if not request.operations:
+            raise HTTPException(status_code=400, detail="操作列表不能为空")
+        if len(request.operations) > MAX_BATCH_OPERATIONS:
+            raise HTTPException(status_code=400, detail=f"单次最多 {MAX_BATCH_OPERATIONS} 项操作")
+        
+        operations = [operation.model_dump() for operation in request.operations]
+        
+        def apply(conn):
+            editor = BatchEditor(conn)
+            result = editor.apply(operations, request.atomic)
+            if editor.changes:
+                record_graph_mutations(editor.changes, f"批量编辑 {len(operations)} 项操作")
+            return result
+
+        return await run_with_connection(apply)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"批量编辑失败: {e}")
+        raise HTTPException(status_code=500, detail=f"批量编辑失败: {str(e)}")
+
+
 @app.get("/api/relations")
 async def get_relations():
     """
     获取所有有效关系列表
     """
     try:
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT relation_name FROM valid_relations")
-            relations = [row["relation_name"] for row in cursor.fetchall()]
-            return {"relations": relations}
+        relations = await run_db(get_reference_data_cache().valid_relations)
+        return {"relations": relations}
             
     except Exception as e:
         logger.error(f"获取关系列表失败: {e}")
         raise HTTPException(status_code=500, detail=f"获取关系列表失败: {str(e)}")
 
 
+@app.get("/api/entities/autocomplete")
+async def autocomplete_entities(
+    q: str = Query(..., description="输入的实体名称片段"),
+    limit: int = Query(default=10, ge=1, le=100, description="返回数量"),
+    fuzzy: bool = Query(default=True, description="匹配不足时是否补充模糊匹配")
+):
+    """
+    实体名称自动补全
+    基于内存中的前缀有序表和字符 n-gram 倒排索引，随图谱变更增量更新
+
+    Returns:
+        results: [{name, match(exact/prefix/substring/fuzzy), score, degree, high_level}]
+    """
+    query = q.strip()
+    if not query:
+        raise HTTPException(status_code=400, detail="查询内容不能为空")
+
+    try:
+        from entity_search import get_entity_name_index
+
+        index = get_entity_name_index()
+        snapshot = None if index.ready else await get_graph_snapshot()
+
+        def lookup():
+            # 重建索引为 O(V)，且重建期间持有索引锁、查询会等待，都放到线程池中执行，避免阻塞事件循环
+            if snapshot is not None:
+                index.rebuild(snapshot)
+            start = time.perf_counter()
+            return index.search(query, limit=limit, fuzzy=fuzzy), (time.perf_counter() - start) * 1000
+
+        results, elapsed_ms = await run_in_threadpool(lookup)
+
+        return {
+            "query": query,
+            "results": results,
+            "version": index.version,
+            "elapsed_ms": round(elapsed_ms, 3)
+        }
+
+    except Exception as e:
+        logger.error(f"实体补全失败: {e}")
+        raise HTTPException(status_code=500, detail=f"实体补全失败: {str(e)}")
+
+
+@app.get("/api/word2vec/status")
+async def get_word2vec_status():
+    """
+    Word2Vec 模型状态：各模型的加载耗时、是否内存映射、是否有ANN索引，
+    以及服务进程的内存占用（私有 / 文件映射）
+    """
+    from ai_service import get_word2vec_service
+    return get_word2vec_service().status()
+
+
 @app.get("/api/node/similar/{entity_name}")
 async def get_similar_entities(entity_name: str, topn: int = 10):
     """
@@ -579,6 +1002,7 @@ async def get_similar_entities(entity_name: str, topn: int = 10):
         相似实体列表，每个包含：名称、相似度、是否在图谱中
     """
     from ai_service import get_word2vec_service
+    from embedding_index import get_entity_embedding_index
     
     entity_name = entity_name.strip()
     
@@ -586,67 +1010,53 @@ async def get_similar_entities(entity_name: str, topn: int = 10):
         raise HTTPException(status_code=400, detail="实体名称不能为空")
     
     try:
-        with get_db() as conn:
-            cursor = conn.cursor()
-            
+        def query(conn):
             # 检查实体是否已存在
-            cursor.execute("""
-                SELECT COUNT(*) as cnt FROM knowledge_triples 
-                WHERE head_entity = %s OR tail_entity = %s
-            """, (entity_name, entity_name))
-            
-            if cursor.fetchone()["cnt"] > 0:
+            if get_triple_store().entity_exists(conn.cursor(), entity_name):
                 raise HTTPException(status_code=400, detail=f"实体 '{entity_name}' 已存在于图谱中")
-            
-            # 从数据库获取所有已存在的实体
-            cursor.execute("""
-                SELECT DISTINCT head_entity as entity FROM knowledge_triples
-                UNION
-                SELECT DISTINCT tail_entity as entity FROM knowledge_triples
-            """)
-            
-            existing_entities = [row["entity"] for row in cursor.fetchall()]
-            
-            if not existing_entities:
-                raise HTTPException(status_code=404, detail="图谱中暂无实体，无法计算相似度")
-            
-            logger.info(f"从数据库获取了 {len(existing_entities)} 个已有实体")
-            
-            # 使用Word2Vec计算输入词与所有实体的相似度
+        
+        await run_with_connection(query)
+        
+        # 实体向量索引随图谱变更增量维护，只在尚未构建或需要全量重载时重建
+        index = get_entity_embedding_index()
+        if not index.ready:
+            await run_in_threadpool(index.rebuild, await get_graph_snapshot())
+        
+        if not len(index):
+            raise HTTPException(status_code=404, detail="图谱中暂无实体，无法计算相似度")
+        
+        # 查询词在所有模型中都无法得到向量时，calculate_similarity_with_candidates 返回Mock相似度
+        model_name, result = await run_in_threadpool(index.most_similar, entity_name, topn)
+        if model_name is None:
             word2vec = get_word2vec_service()
-            similar_words = word2vec.calculate_similarity_with_candidates(entity_name, existing_entities)
-            
-            if not similar_words:
-                raise HTTPException(status_code=404, detail="未能计算相似度")
-            
-            # 只取前topn个（已经按相似度排序）
-            similar_words = similar_words[:topn]
-            
-            # 构建返回结果（这些都是图谱内的实体）
-            result = []
-            for word, similarity in similar_words:
-                entity_data = {
-                    "entity": word,
-                    "similarity": float(similarity),
-                    "in_graph": True  # 都是从数据库查出来的，必然在图谱中
-                }
-                result.append(entity_data)
-            
-            if not result:
-                raise HTTPException(status_code=404, detail="未找到相似实体")
-            
-            logger.info(f"计算完成，返回 {len(result)} 个相似实体（相似度范围: {result[0]['similarity']:.4f} ~ {result[-1]['similarity']:.4f}）")
-            
-            return {
-                "input": entity_name,
-                "similar_entities": result,
-                "stats": {
-                    "total_entities_in_graph": len(existing_entities),
-                    "calculated_count": len(existing_entities),
-                    "returned_count": len(result)
-                }
+            similar_words = await run_in_threadpool(
+                word2vec.calculate_similarity_with_candidates, entity_name, index.entity_names(), topn
+            )
+            result = [
+                {"entity": word, "similarity": float(similarity), "vector": "mock"}
+                for word, similarity in similar_words
+            ]
+        
+        # 这些都是图谱内的实体
+        for entity_data in result:
+            entity_data["in_graph"] = True
+        
+        if not result:
+            raise HTTPException(status_code=404, detail="未找到相似实体")
+        
+        logger.info(f"计算完成，返回 {len(result)} 个相似实体（相似度范围: {result[0]['similarity']:.4f} ~ {result[-1]['similarity']:.4f}）")
+        
+        return {
+            "input": entity_name,
+            "similar_entities": result,
+            "model": model_name or "mock",
+            "stats": {
+                "total_entities_in_graph": len(index),
+                "calculated_count": len(index),
+                "returned_count": len(result)
             }
-            
+        }
+        
     except HTTPException:
         raise
     except Exception as e:
@@ -687,32 +1097,19 @@ async def generate_candidate_triples(data: GenerateTriples):
         raise HTTPException(status_code=400, detail="实体名称不能为空")
     
     try:
-        with get_db() as conn:
+        def query(conn):
             cursor = conn.cursor()
             
-            # 检查实体A是否已存在
-            cursor.execute("""
-                SELECT COUNT(*) as cnt FROM knowledge_triples 
-                WHERE head_entity = %s OR tail_entity = %s
-            """, (entity_a, entity_a))
+            store = get_triple_store()
             
-            if cursor.fetchone()["cnt"] > 0:
+            # 检查实体A是否已存在
+            if store.entity_exists(cursor, entity_a):
                 raise HTTPException(status_code=400, detail=f"实体 '{entity_a}' 已存在于图谱中")
             
             logger.info(f"步骤1: 用户选择相似词 {entity_a} -> {entity_b}")
             
             # 步骤2: 查询与B相关的**所有**实体（不限制数量）
-            cursor.execute("""
-                SELECT DISTINCT 
-                    CASE 
-                        WHEN head_entity = %s THEN tail_entity 
-                        ELSE head_entity 
-                    END as related_entity
-                FROM knowledge_triples 
-                WHERE head_entity = %s OR tail_entity = %s
-            """, (entity_b, entity_b, entity_b))
-            
-            related_entities = [row["related_entity"] for row in cursor.fetchall()]
+            related_entities = store.related_entities(cursor, entity_b)
             
             if not related_entities:
                 raise HTTPException(
@@ -723,32 +1120,38 @@ async def generate_candidate_triples(data: GenerateTriples):
             logger.info(f"步骤2完成: 找到 {len(related_entities)} 个关联实体")
             
             # 步骤3: 获取有效关系列表
-            cursor.execute("SELECT relation_name FROM valid_relations")
-            valid_relations = [row["relation_name"] for row in cursor.fetchall()]
-            
-            if not valid_relations:
-                raise HTTPException(status_code=500, detail="系统中没有配置有效关系")
-            
-            # 步骤4: 使用AI为每个(A, C)对推理关系
-            kimi = get_kimi_service()
-            candidate_triples = []
-            
+            valid_relations = get_reference_data_cache().valid_relations(cursor)
+            return related_entities, valid_relations
+        
+        related_entities, valid_relations = await run_with_connection(query)
+        
+        if not valid_relations:
+            raise HTTPException(status_code=500, detail="系统中没有配置有效关系")
+        
+        # 步骤4: 使用AI为每个(A, C)对推理关系（同步HTTP调用，在线程池中执行且不占用数据库连接）
+        kimi = get_kimi_service()
+        
+        def infer_all():
+            candidates = []
             for entity_c in related_entities:
                 inferred_relation = kimi.infer_relation(entity_a, entity_c, valid_relations)
-                candidate_triples.append({
+                candidates.append({
                     "head_entity": entity_a,
                     "relation": inferred_relation,
                     "tail_entity": entity_c
                 })
                 logger.info(f"生成候选: {entity_a} --[{inferred_relation}]--> {entity_c}")
-            
-            return {
-                "input_entity": entity_a,
-                "similar_entity": entity_b,
-                "candidate_triples": candidate_triples,
-                "total_candidates": len(candidate_triples)
-            }
-            
+            return candidates
+        
+        candidate_triples = await run_in_threadpool(infer_all)
+        
+        return {
+            "input_entity": entity_a,
+            "similar_entity": entity_b,
+            "candidate_triples": candidate_triples,
+            "total_candidates": len(candidate_triples)
+        }
+        
     except HTTPException:
         raise
     except Exception as e:
@@ -773,26 +1176,33 @@ async def add_node_with_selected_triple(data: SelectedTriple):
         raise HTTPException(status_code=400, detail="参数不完整")
     
     try:
-        with get_db() as conn:
+        def insert(conn):
             cursor = conn.cursor()
             
-            # 再次检查实体A是否已存在
-            cursor.execute("""
-                SELECT COUNT(*) as cnt FROM knowledge_triples 
-                WHERE head_entity = %s OR tail_entity = %s
-            """, (entity_a, entity_a))
+            store = get_triple_store()
             
-            if cursor.fetchone()["cnt"] > 0:
+            # 再次检查实体A是否已存在
+            if store.entity_exists(cursor, entity_a):
                 raise HTTPException(status_code=400, detail=f"实体 '{entity_a}' 已存在于图谱中")
             
             # 插入选择的三元组
-            cursor.execute("""
-                INSERT INTO knowledge_triples (head_entity, relation, tail_entity)
-                VALUES (%s, %s, %s)
-            """, (triple["head_entity"], triple["relation"], triple["tail_entity"]))
+            triple_id = store.insert_triple(
+                cursor, triple["head_entity"], triple["relation"], triple["tail_entity"]
+            )
             
             conn.commit()
-            triple_id = cursor.lastrowid
+            record_graph_mutations(
+                [{
+                    "op": "add_edge",
+                    "edge": {
+                        "id": triple_id,
+                        "source": triple["head_entity"],
+                        "target": triple["tail_entity"],
+                        "value": triple["relation"]
+                    }
+                }],
+                f"新增边 {triple_id}"
+            )
             
             logger.info(f"成功添加三元组: {triple['head_entity']} --[{triple['relation']}]--> {triple['tail_entity']}")
             
@@ -809,6 +1219,8 @@ async def add_node_with_selected_triple(data: SelectedTriple):
                     "similar_entity": entity_b
                 }
             }
+
+        return await run_with_connection(insert)
             
     except HTTPException:
         raise
@@ -817,6 +1229,53 @@ async def add_node_with_selected_triple(data: SelectedTriple):
         raise HTTPException(status_code=500, detail=f"智能添加节点失败: {str(e)}")
 
 
+@app.post("/api/triples/import")
+async def import_triples_file(
+    file: UploadFile = File(...),
+    file_format: Optional[str] = Form(None),
+    batch_size: int = Form(DEFAULT_IMPORT_BATCH_SIZE)
+):
+    """
+    批量导入三元组（CSV / JSONL）
+
+    关系必须属于有效关系列表，与已有三元组重复的行被跳过；
+    每批一个事务提交，中途失败时已提交的批次保留
+    
+    Args:
+        file: 导入文件
+        file_format: csv / jsonl，默认根据文件扩展名判断
+        batch_size: 每批（每个事务）的三元组数
+    
+    Returns:
+        导入统计（读取、新增、重复、无效关系、格式错误行数及吞吐量）
+    """
+    try:
+        try:
+            file_format = file_format or detect_format(file.filename)
+            rows = iter_triples(open_text(file.file), file_format)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if batch_size <= 0:
+            raise HTTPException(status_code=400, detail="batch_size 必须为正整数")
+        
+        try:
+            stats = await run_with_connection(import_triples, rows, batch_size)
+        except Exception:
+            # 中断前已提交的批次同样需要使图谱缓存失效
+            bump_graph_version("批量导入三元组中断")
+            raise
+        if stats.inserted:
+            bump_graph_version(f"批量导入 {stats.inserted} 条三元组")
+        
+        return {"message": f"成功导入 {stats.inserted} 条三元组", "stats": stats.to_dict()}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"批量导入三元组失败: {e}")
+        raise HTTPException(status_code=500, detail=f"批量导入三元组失败: {str(e)}")
+
+
 # ==================== 图像分析API ====================
 @app.post("/api/image/analyze")
 async def analyze_image(
@@ -945,7 +1404,7 @@ async def analyze_image(
         logger.info(f"过滤后实体数量: {len(detected_entities)}")
         
         response_data = {
-            "analysis_id": f"img_analysis_{int(time.time())}",
+            "analysis_id": new_analysis_id(),
             "image_info": analysis_result["image_info"],
             "detected_entities": detected_entities,
             "recommendations": [],
@@ -1004,7 +1463,7 @@ async def analyze_image(
         
         # 记录分析结果到历史表
         try:
-            with get_db() as conn:
+            def save_history(conn):
                 cursor = conn.cursor()
                 
                 # 准备历史记录数据
@@ -1029,14 +1488,18 @@ async def analyze_image(
                     risk_level = "低风险"
                 
                 # 插入历史记录
-                cursor.execute("""
-                    INSERT INTO image_analysis_history 
-                    (analysis_id, timestamp, entity_count, detected_types, confidence, risk_level)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """, (analysis_id, timestamp, entity_count, json.dumps(detected_types), avg_confidence, risk_level))
+                get_analysis_history_repository().add(
+                    cursor, analysis_id, timestamp, entity_count, detected_types, avg_confidence, risk_level
+                )
+                
+                # 保存完整结果（压缩），查看历史结果时无需重新分析
+                payload, codec = compress_result(response_data)
+                get_analysis_result_repository().add(cursor, analysis_id, payload, codec)
                 
                 conn.commit()
                 logger.info(f"分析历史记录已保存: {analysis_id}")
+
+            await run_with_connection(save_history)
         except Exception as e:
             logger.error(f"保存分析历史记录失败: {e}")
         
@@ -1087,21 +1550,15 @@ async def validate_entity_combinations(request: EntityValidationRequest):
                 }
         elif request.validation_type == "relationship_check":
             # 简单的关系检查
-            with get_db() as conn:
+            def query(conn):
                 cursor = conn.cursor()
                 
                 entity_names = [entity.get("matched_kb_entity") or entity["name"] for entity in request.entities]
                 
-                relationships = []
-                for i, entity_a in enumerate(entity_names):
-                    for entity_b in entity_names[i+1:]:
-                        cursor.execute("""
-                            SELECT head_entity, relation, tail_entity FROM knowledge_triples 
-                            WHERE (head_entity = %s AND tail_entity = %s) 
-                               OR (head_entity = %s AND tail_entity = %s)
-                        """, (entity_a, entity_b, entity_b, entity_a))
-                        
-                        relationships.extend(cursor.fetchall())
+                relationships = [
+                    {key: row[key] for key in ("head_entity", "relation", "tail_entity")}
+                    for row in find_relationships_among(cursor, entity_names)
+                ]
                 
                 return {
                     "validation_type": request.validation_type,
@@ -1110,6 +1567,8 @@ async def validate_entity_combinations(request: EntityValidationRequest):
                     "relationship_count": len(relationships),
                     "is_valid": len(relationships) > 0
                 }
+
+            return await run_with_connection(query)
         else:
             raise HTTPException(status_code=400, detail="不支持的验证类型")
             
@@ -1205,29 +1664,25 @@ async def add_high_level_node(
         raise HTTPException(status_code=400, detail="节点名称不能为空")
     
     try:
-        with get_db() as conn:
+        def mark(conn):
             cursor = conn.cursor()
             
             # 检查节点是否存在于知识图谱中
-            cursor.execute("""
-                SELECT COUNT(*) as cnt FROM knowledge_triples 
-                WHERE head_entity = %s OR tail_entity = %s
-            """, (node_name, node_name))
-            
-            if cursor.fetchone()["cnt"] == 0:
+            if not get_triple_store().entity_exists(cursor, node_name):
                 raise HTTPException(status_code=404, detail=f"节点 '{node_name}' 不存在于知识图谱中")
             
             # 检查是否已经是高级节点
-            cursor.execute(f"SELECT COUNT(*) as cnt FROM {HIGH_LEVEL_NODE_TABLE} WHERE node_name = %s", (node_name,))
-            if cursor.fetchone()["cnt"] > 0:
+            repository = get_high_level_node_repository()
+            if repository.exists(cursor, node_name):
                 raise HTTPException(status_code=400, detail=f"节点 '{node_name}' 已经是高级节点")
             
             # 添加到高级节点表
-            cursor.execute(
-                f"INSERT INTO {HIGH_LEVEL_NODE_TABLE} (node_name, node_type) VALUES (%s, %s)",
-                (node_name, "generic")
-            )
+            repository.add(cursor, node_name, "generic")
             conn.commit()
+            record_graph_mutations(
+                [{"op": "set_high_level", "name": node_name, "high_level": True}],
+                f"添加高级节点 {node_name}"
+            )
             
             logger.info(f"成功添加高级节点: {node_name}")
             
@@ -1235,6 +1690,8 @@ async def add_high_level_node(
                 "message": f"成功将节点 '{node_name}' 标记为高级节点",
                 "node_name": node_name
             }
+
+        return await run_with_connection(mark)
     except HTTPException:
         raise
     except Exception as e:
@@ -1267,17 +1724,21 @@ async def remove_high_level_node(
         raise HTTPException(status_code=400, detail="节点名称不能为空")
     
     try:
-        with get_db() as conn:
+        def unmark(conn):
             cursor = conn.cursor()
             
             # 检查是否是高级节点
-            cursor.execute(f"SELECT COUNT(*) as cnt FROM {HIGH_LEVEL_NODE_TABLE} WHERE node_name = %s", (node_name,))
-            if cursor.fetchone()["cnt"] == 0:
+            repository = get_high_level_node_repository()
+            if not repository.exists(cursor, node_name):
                 raise HTTPException(status_code=404, detail=f"节点 '{node_name}' 不是高级节点")
             
             # 从高级节点表删除
-            cursor.execute(f"DELETE FROM {HIGH_LEVEL_NODE_TABLE} WHERE node_name = %s", (node_name,))
+            repository.remove(cursor, node_name)
             conn.commit()
+            record_graph_mutations(
+                [{"op": "set_high_level", "name": node_name, "high_level": False}],
+                f"移除高级节点 {node_name}"
+            )
             
             logger.info(f"成功移除高级节点标记: {node_name}")
             
@@ -1285,6 +1746,8 @@ async def remove_high_level_node(
                 "message": f"成功移除节点 '{node_name}' 的高级节点标记",
                 "node_name": node_name
             }
+
+        return await run_with_connection(unmark)
     except HTTPException:
         raise
     except Exception as e:
@@ -1292,59 +1755,131 @@ async def remove_high_level_node(
         raise HTTPException(status_code=500, detail=f"移除高级节点失败: {str(e)}")
 
 
+@app.get("/api/image/analysis/{analysis_id}")
+async def get_analysis_result(analysis_id: str, accept_encoding: Optional[str] = Header(default=None)):
+    """
+    获取已保存的完整图像分析结果（与分析时的响应相同，不重新计算）
+    
+    客户端接受结果的压缩格式（gzip / zstd）时直接返回压缩数据
+    
+    Args:
+        analysis_id: 分析ID
+    """
+    try:
+        def query(conn):
+            return get_analysis_result_repository().get(conn.cursor(), analysis_id)
+
+        stored = await run_with_connection(query)
+        if stored is None:
+            raise HTTPException(status_code=404, detail=f"分析结果 '{analysis_id}' 不存在")
+
+        payload, codec = stored
+        headers = {"Vary": "Accept-Encoding"}
+        accepted = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+        if codec in accepted:
+            headers["Content-Encoding"] = codec
+            return Response(content=payload, media_type="application/json", headers=headers)
+        return Response(content=decompress_result(payload, codec), media_type="application/json", headers=headers)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"获取分析结果失败: {e}")
+        raise HTTPException(status_code=500, detail=f"获取分析结果失败: {str(e)}")
+
+
+MAX_HISTORY_PAGE_SIZE = 500
+
+
+def _parse_time_bound(value: Optional[str], name: str) -> Optional[str]:
+    """解析 YYYY-mm-dd 或 YYYY-mm-dd HH:MM:SS 格式的时间参数，统一为数据库中的时间格式"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.strip()).strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"无效的时间参数 {name}: {value}")
+
+
 @app.get("/api/image/analysis-history")
-async def get_analysis_history(limit: int = 10):
+async def get_analysis_history(
+    limit: int = Query(10, ge=1, le=MAX_HISTORY_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    risk_level: Optional[str] = None,
+    detected_type: Optional[str] = None
+):
     """
-    获取图像分析历史
+    获取图像分析历史（按时间倒序，键集分页）
     
     Args:
-        limit: 返回记录数量限制
+        limit: 每页记录数
+        cursor: 上一页返回的 next_cursor，为空时返回第一页
+        risk_level: 只返回该风险等级的记录
+        detected_type: 只返回检测到该类型的记录
     
     Returns:
-        分析历史列表
+        分析历史列表及下一页游标（没有更多记录时为null）
     """
     try:
-        with get_db() as conn:
-            cursor = conn.cursor()
-            
-            # 查询最新的分析历史记录
-            cursor.execute("""
-                SELECT 
-                    analysis_id as id,
-                    timestamp,
-                    entity_count,
-                    detected_types,
-                    confidence,
-                    risk_level
-                FROM image_analysis_history 
-                ORDER BY timestamp DESC 
-                LIMIT %s
-            """, (limit,))
-            
-            history_records = []
-            for record in cursor.fetchall():
-                # 解析JSON字段
-                detected_types = json.loads(record["detected_types"]) if isinstance(record["detected_types"], str) else record["detected_types"]
-                
-                history_records.append({
-                    "id": record["id"],
-                    "timestamp": record["timestamp"].strftime('%Y-%m-%d %H:%M:%S') if hasattr(record["timestamp"], 'strftime') else record["timestamp"],
-                    "entity_count": record["entity_count"],
-                    "detected_types": detected_types,
-                    "confidence": round(float(record["confidence"]), 1),
-                    "risk_level": record["risk_level"]
-                })
+        try:
+            after = decode_page_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        def query(conn):
+            history_records, next_after = get_analysis_history_repository().list_page(
+                conn.cursor(), limit, after, risk_level, detected_type
+            )
             
             return {
                 "history": history_records,
-                "total_count": len(history_records)
+                "total_count": len(history_records),
+                "next_cursor": encode_page_cursor(next_after)
             }
+
+        return await run_with_connection(query)
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"获取分析历史失败: {e}")
         raise HTTPException(status_code=500, detail=f"获取分析历史失败: {str(e)}")
 
 
+@app.get("/api/image/analysis-trends")
+async def get_analysis_trends(
+    granularity: str = "day",
+    start: Optional[str] = None,
+    end: Optional[str] = None
+):
+    """
+    获取图像分析趋势（只读取小时/天汇总表，不扫描分析历史）
+    
+    Args:
+        granularity: hour 或 day
+        start: 起始时间（含），YYYY-mm-dd 或 YYYY-mm-dd HH:MM:SS
+        end: 结束时间（不含）
+    
+    Returns:
+        按时间正序的各时间桶分析次数、平均置信度、平均实体数和风险等级分布
+    """
+    if granularity not in ROLLUP_GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity 只能是 {' / '.join(ROLLUP_GRANULARITIES)}")
+    start = _parse_time_bound(start, "start")
+    end = _parse_time_bound(end, "end")
+
+    try:
+        def query(conn):
+            buckets = get_analysis_history_repository().trends(conn.cursor(), granularity, start, end)
+            return {"granularity": granularity, "buckets": buckets}
+
+        return await run_with_connection(query)
+            
+    except Exception as e:
+        logger.error(f"获取分析趋势失败: {e}")
+        raise HTTPException(status_code=500, detail=f"获取分析趋势失败: {str(e)}")
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
 
@@ -0,0 +1,173 @@
+"""
+Word2Vec 模型的存储格式与加载
+word2vec 格式（.bin / .txt）每次启动都要完整解析，数 GB 的通用模型需要几分钟，
+且整个模型都占用进程的私有内存。转换为 gensim 原生格式后，
+词向量单独保存为 .npy 并以只读内存映射（mmap='r'）方式加载：
+启动几乎不需要时间，向量按需从操作系统页缓存读取，重启后仍可复用页缓存
+
+转换（离线执行一次）:
+    python model_store.py ./models/word2vec.bin
+    生成 ./models/word2vec.bin.kv 和 ./models/word2vec.bin.kv.vectors.npy，
+    之后加载 ./models/word2vec.bin 时自动改用原生格式（源文件更新后需重新转换）
+"""
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+NATIVE_SUFFIX = ".kv"
+WORD2VEC_SUFFIXES = (".bin", ".txt")
+
+
+def native_path(model_path: Union[str, Path]) -> Path:
+    """word2vec 格式模型对应的原生格式文件"""
+    return Path(str(model_path) + NATIVE_SUFFIX)
+
+
+def _native_is_current(model_path: str) -> bool:
+    """原生格式文件存在且不早于源文件"""
+    converted = native_path(model_path)
+    return converted.exists() and converted.stat().st_mtime >= os.stat(model_path).st_mtime
+
+
+def load_keyed_vectors(model_path: str, binary: Optional[bool] = None):
+    """
+    加载 gensim KeyedVectors
+
+    - 存在已转换的原生格式文件时以内存映射方式加载
+    - .bin / .txt 按 word2vec 格式解析（binary 为 None 时根据扩展名判断）
+    - 其他扩展名视为 gensim 原生格式，以内存映射方式加载
+
+    Args:
+        model_path: 模型文件路径
+        binary: word2vec 格式是否为二进制
+
+    Returns:
+        KeyedVectors
+    """
+    from gensim.models import KeyedVectors
+
+    if not model_path.endswith(WORD2VEC_SUFFIXES):
+        return KeyedVectors.load(model_path, mmap='r')
+    if _native_is_current(model_path):
+        return KeyedVectors.load(str(native_path(model_path)), mmap='r')
+    if binary is None:
+        binary = model_path.endswith('.bin')
+    return KeyedVectors.load_word2vec_format(model_path, binary=binary)
+
+
+def is_memory_mapped(model) -> bool:
+    """模型的词向量是否为内存映射"""
+    import numpy as np
+    # 服务模型（serving_model.CompactKeyedVectors）的向量存放在 codes 中
+    vectors = getattr(model, "codes", None)
+    if vectors is None:
+        vectors = model.vectors
+    while vectors is not None:
+        if isinstance(vectors, np.memmap):
+            return True
+        vectors = getattr(vectors, "base", None)
+    return False
+
+
+def process_memory() -> Dict[str, float]:
+    """
+    当前进程的内存占用（MB），读取 /proc/self/status，非 Linux 平台返回空字典
+
+    Returns:
+        {rss_mb: 常驻内存, private_mb: 私有匿名内存, shared_file_mb: 文件映射（可与其他进程共享的页缓存）}
+    """
+    fields = {"VmRSS": "rss_mb", "RssAnon": "private_mb", "RssFile": "shared_file_mb"}
+    result = {}
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in fields:
+                    result[fields[key]] = round(int(value.split()[0]) / 1024, 1)
+    except (OSError, ValueError):
+        pass
+    return result
+
+
+def load_with_stats(model_path: str, binary: Optional[bool] = None):
+    """
+    加载模型并记录耗时和内存变化，模型文件旁有编译好的服务模型时优先使用
+
+    Returns:
+        (KeyedVectors 或 CompactKeyedVectors, 统计信息)
+    """
+    from serving_model import load_serving_model
+
+    before = process_memory()
+    started = time.perf_counter()
+    model = load_serving_model(model_path)
+    serving = model is not None
+    if model is None:
+        model = load_keyed_vectors(model_path, binary)
+    seconds = time.perf_counter() - started
+    after = process_memory()
+
+    stats: Dict[str, Any] = {
+        "path": model_path,
+        "vocab_size": len(model.key_to_index),
+        "dim": int(model.vector_size),
+        "memory_mapped": is_memory_mapped(model),
+        # 服务模型的量化类型，完整模型为None
+        "serving": model.dtype if serving else None,
+        "load_seconds": round(seconds, 3)
+    }
+    if after:
+        stats["rss_delta_mb"] = round(after["rss_mb"] - before.get("rss_mb", 0), 1)
+        stats["private_delta_mb"] = round(after.get("private_mb", 0) - before.get("private_mb", 0), 1)
+    logger.info(
+        f"模型加载完成: {model_path}, 词汇量 {stats['vocab_size']}, "
+        f"{'内存映射' if stats['memory_mapped'] else '完整解析'}"
+        f"{', 服务模型 ' + stats['serving'] if serving else ''}, 耗时 {seconds:.2f}s, "
+        f"RSS 增加 {stats.get('rss_delta_mb', '?')} MB（私有 {stats.get('private_delta_mb', '?')} MB）"
+    )
+    return model, stats
+
+
+def convert_to_native(model_path: str, binary: Optional[bool] = None) -> Path:
+    """
+    将 word2vec 格式模型转换为原生格式（词向量单独保存为 .npy 以便内存映射）
+
+    Returns:
+        原生格式文件路径
+    """
+    from gensim.models import KeyedVectors
+
+    if binary is None:
+        binary = model_path.endswith('.bin')
+    started = time.perf_counter()
+    model = KeyedVectors.load_word2vec_format(model_path, binary=binary)
+    logger.info(f"解析完成: {model_path}, 词汇量 {len(model.key_to_index)}, 耗时 {time.perf_counter() - started:.1f}s")
+
+    target = native_path(model_path)
+    # 写到临时文件名再改名，转换中断时不会留下被当作有效的半成品
+    temporary = Path(str(target) + ".tmp")
+    model.save(str(temporary), separately=["vectors"])
+    os.replace(str(temporary) + ".vectors.npy", str(target) + ".vectors.npy")
+    os.replace(temporary, target)
+    logger.info(f"已保存原生格式: {target}")
+    return target
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Word2Vec 模型转换为可内存映射的 gensim 原生格式')
+    parser.add_argument('model_path', type=str, help='word2vec 格式模型文件（.bin / .txt）')
+    parser.add_argument('--text', action='store_true', help='按文本格式解析（默认根据扩展名判断）')
+    args = parser.parse_args()
+
+    converted_path = convert_to_native(args.model_path, binary=False if args.text else None)
+    _, load_stats = load_with_stats(args.model_path)
+    print(json.dumps({"native_path": str(converted_path), **load_stats}, ensure_ascii=False, indent=2))
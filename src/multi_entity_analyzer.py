@@ -6,7 +6,10 @@ import logging
 from typing import Dict, List, Optional, Any, Tuple
 import itertools
 from contextlib import contextmanager
-import pymysql
+from graph_index import find_relationships_among
+from storage import get_storage, run_with_connection
+from db_manager import run_db
+from reference_data import get_reference_data_cache
 
 logger = logging.getLogger(__name__)
 
@@ -60,12 +63,9 @@ class MultiEntityAnalyzer:
     
     @contextmanager
     def get_db(self):
-        """数据库连接上下文管理器"""
-        conn = pymysql.connect(**self.db_config)
-        try:
+        """数据库连接上下文管理器（从存储后端借用）"""
+        with get_storage().connection() as conn:
             yield conn
-        finally:
-            conn.close()
     
     async def analyze_entity_relationships(self, detected_entities: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
@@ -128,9 +128,7 @@ class MultiEntityAnalyzer:
     
     async def _query_existing_relationships(self, detected_entities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """查询已知关系"""
-        relationships = []
-        
-        with self.get_db() as conn:
+        def query(conn):
             cursor = conn.cursor()
             
             # 获取实体名称列表
@@ -139,27 +137,19 @@ class MultiEntityAnalyzer:
                 name = entity.get("matched_kb_entity") or entity["name"]
                 entity_names.append(name)
             
-            # 查询实体间的直接关系
-            for i, entity_a in enumerate(entity_names):
-                for entity_b in entity_names[i+1:]:
-                    # 查询双向关系
-                    cursor.execute("""
-                        SELECT head_entity, relation, tail_entity, 'existing' as source
-                        FROM knowledge_triples 
-                        WHERE (head_entity = %s AND tail_entity = %s) 
-                           OR (head_entity = %s AND tail_entity = %s)
-                    """, (entity_a, entity_b, entity_b, entity_a))
-                    
-                    for row in cursor.fetchall():
-                        relationships.append({
-                            "head_entity": row["head_entity"],
-                            "relation": row["relation"],
-                            "tail_entity": row["tail_entity"],
-                            "source": row["source"],
-                            "confidence": 1.0  # 已存在关系置信度为1
-                        })
-        
-        return relationships
+            # 一次取回实体间的所有直接关系（双向）
+            return [
+                {
+                    "head_entity": row["head_entity"],
+                    "relation": row["relation"],
+                    "tail_entity": row["tail_entity"],
+                    "source": "existing",
+                    "confidence": 1.0  # 已存在关系置信度为1
+                }
+                for row in find_relationships_among(cursor, entity_names)
+            ]
+        
+        return await run_with_connection(query)
     
     async def _infer_potential_relationships(self, detected_entities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """推理潜在关系"""
@@ -168,10 +158,7 @@ class MultiEntityAnalyzer:
         potential_relationships = []
         
         # 获取有效关系列表
-        with self.get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT relation_name FROM valid_relations")
-            valid_relations = [row["relation_name"] for row in cursor.fetchall()]
+        valid_relations = await run_db(get_reference_data_cache().valid_relations)
         
         if len(valid_relations) == 0:
             logger.warning("没有找到有效关系列表")
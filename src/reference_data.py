@@ -0,0 +1,161 @@
+"""
+参考数据缓存
+有效关系（valid_relations）和高级节点（graph_high_level_nodes）两张小表的进程内缓存：
+本进程的写入通过图谱变更事件直接更新缓存（写穿），其他进程/工具的写入
+通过定期比较表指纹（行数、最大ID、最后更新时间）发现，热路径不再查询数据库
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from graph_cache import get_graph_snapshot_cache
+from repositories import get_valid_relation_repository, get_high_level_node_repository
+from storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+# 两次表指纹检查之间的最小间隔（秒）
+CHECK_INTERVAL = float(os.getenv("REFERENCE_CACHE_CHECK_INTERVAL", "5"))
+
+
+class _CachedTable:
+    """单张参考数据表的缓存项"""
+
+    def __init__(self, name: str, load: Callable[[Any], Any], fingerprint: Callable[[Any], Tuple]):
+        self.name = name
+        self.load = load
+        self.fingerprint = fingerprint
+        self.value: Any = None
+        self.table_fingerprint: Optional[Tuple] = None
+        self.checked_at = 0.0
+        # 每次写穿/失效递增，加载期间发生变更时不覆盖为旧数据
+        self.generation = 0
+
+
+class ReferenceDataCache:
+    """有效关系和高级节点的进程内缓存"""
+
+    def __init__(self, check_interval: float = CHECK_INTERVAL):
+        """
+        Args:
+            check_interval: 两次表指纹检查之间的最小间隔（秒），0 表示每次访问都检查
+        """
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._relations = _CachedTable(
+            "valid_relations",
+            lambda cursor: tuple(get_valid_relation_repository().list_names(cursor)),
+            lambda cursor: get_valid_relation_repository().fingerprint(cursor)
+        )
+        self._high_level = _CachedTable(
+            "high_level_nodes",
+            lambda cursor: frozenset(get_high_level_node_repository().list_names(cursor)),
+            lambda cursor: get_high_level_node_repository().fingerprint(cursor)
+        )
+
+    def valid_relations(self, cursor=None) -> List[str]:
+        """
+        所有有效关系名称
+
+        Args:
+            cursor: 调用方的游标；为None且需要检查/加载时从存储后端借用连接
+
+        Returns:
+            有效关系名称列表（副本）
+        """
+        return list(self._get(self._relations, cursor))
+
+    def high_level_nodes(self, cursor=None) -> Set[str]:
+        """
+        所有高级节点名称
+
+        Args:
+            cursor: 同 valid_relations
+
+        Returns:
+            高级节点名称集合（副本）
+        """
+        return set(self._get(self._high_level, cursor))
+
+    def invalidate(self):
+        """丢弃两张表的缓存，下次访问时重新加载（用于无法描述具体变更的写入）"""
+        with self._lock:
+            for table in (self._relations, self._high_level):
+                table.value = None
+                table.generation += 1
+
+    def on_changes(self, changes: List[Dict[str, Any]]):
+        """图谱变更监听者：把本进程已提交的高级节点变更直接应用到缓存"""
+        with self._lock:
+            table = self._high_level
+            if table.value is None:
+                return
+            nodes = set(table.value)
+            for change in changes:
+                op = change["op"]
+                if op == "set_high_level":
+                    if change.get("high_level"):
+                        nodes.add(change["name"])
+                    else:
+                        nodes.discard(change["name"])
+                elif op == "rename_node":
+                    if change["old_name"] in nodes:
+                        nodes.discard(change["old_name"])
+                        nodes.add(change["new_name"])
+                elif op == "delete_node":
+                    nodes.discard(change["name"])
+                elif op == "reload":
+                    table.value = None
+                    table.generation += 1
+                    return
+            if nodes == table.value:
+                # 边的增删改等不涉及高级节点的变更
+                return
+            table.value = frozenset(nodes)
+            table.generation += 1
+            # 不重置检查时间：表指纹已随写入变化，到期检查时重新加载一次以对齐
+
+    def _get(self, table: _CachedTable, cursor):
+        now = time.monotonic()
+        with self._lock:
+            value = table.value
+            if value is not None and now - table.checked_at < self.check_interval:
+                return value
+            generation = table.generation
+
+        if cursor is not None:
+            return self._refresh(table, cursor, generation, now)
+        with get_storage().connection() as conn:
+            return self._refresh(table, conn.cursor(), generation, now)
+
+    def _refresh(self, table: _CachedTable, cursor, generation: int, now: float):
+        """比较表指纹，表已变化或尚未加载时重新加载"""
+        fingerprint = table.fingerprint(cursor)
+        with self._lock:
+            if table.value is not None and fingerprint == table.table_fingerprint:
+                table.checked_at = now
+                return table.value
+
+        value = table.load(cursor)
+        with self._lock:
+            if table.generation == generation:
+                table.value = value
+                table.table_fingerprint = fingerprint
+                table.checked_at = now
+                logger.info(f"参考数据已加载: {table.name}, {len(value)} 项")
+            elif table.value is not None:
+                # 加载期间有写穿更新，以已更新的缓存为准
+                return table.value
+        return value
+
+
+# 全局缓存实例
+reference_data_cache = ReferenceDataCache()
+get_graph_snapshot_cache().add_listener(reference_data_cache.on_changes)
+
+
+def get_reference_data_cache() -> ReferenceDataCache:
+    """获取参考数据缓存实例"""
+    return reference_data_cache
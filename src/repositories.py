@@ -0,0 +1,477 @@
+"""
+有效关系、高级节点、图像分析历史及分析结果的仓储
+与 triple_store.TripleStore 相同，方法接收调用方的游标且不提交，
+SQL 保持可移植，由存储后端（storage.py）提供方言差异
+"""
+import base64
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+VALID_RELATION_TABLE = "valid_relations"
+HIGH_LEVEL_NODE_TABLE = "graph_high_level_nodes"
+ANALYSIS_HISTORY_TABLE = "image_analysis_history"
+ANALYSIS_ROLLUP_TABLE = "image_analysis_rollups"
+ANALYSIS_RESULT_TABLE = "image_analysis_results"
+ENTITY_FEATURE_TABLE = "entity_features"
+
+# 汇总粒度及汇总表的键列、累加列
+ROLLUP_GRANULARITIES = ("hour", "day")
+ROLLUP_KEY_COLUMNS = ("granularity", "bucket_start", "risk_level")
+ROLLUP_VALUE_COLUMNS = ("analysis_count", "entity_count_sum", "confidence_sum")
+
+# IN 列表查询的分块大小
+LOOKUP_CHUNK_SIZE = 1000
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class ValidRelationRepository:
+    """有效关系（允许使用的关系名称）"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def list_names(self, cursor) -> List[str]:
+        """所有有效关系名称"""
+        cursor.execute(f"SELECT relation_name FROM {VALID_RELATION_TABLE}")
+        return [row["relation_name"] for row in cursor.fetchall()]
+
+    def fingerprint(self, cursor) -> tuple:
+        """表指纹（行数、最大ID），用于廉价地判断缓存是否过期"""
+        cursor.execute(f"SELECT COUNT(*) AS cnt, MAX(id) AS max_id FROM {VALID_RELATION_TABLE}")
+        row = cursor.fetchone()
+        return row["cnt"], row["max_id"]
+
+    def add(self, cursor, names: Iterable[str]) -> int:
+        """添加有效关系（已存在的忽略），返回新增条数"""
+        cursor.executemany(
+            f"{self.backend.insert_ignore} INTO {VALID_RELATION_TABLE} (relation_name) VALUES (%s)",
+            [(name,) for name in dict.fromkeys(names)]
+        )
+        return cursor.rowcount
+
+
+class HighLevelNodeRepository:
+    """高级节点"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def list_names(self, cursor) -> Set[str]:
+        """所有高级节点名称"""
+        cursor.execute(f"SELECT node_name FROM {HIGH_LEVEL_NODE_TABLE}")
+        return {row["node_name"] for row in cursor.fetchall()}
+
+    def fingerprint(self, cursor) -> tuple:
+        """表指纹（行数、最大ID、最后更新时间），用于廉价地判断缓存是否过期"""
+        cursor.execute(
+            f"SELECT COUNT(*) AS cnt, MAX(id) AS max_id, MAX(updated_at) AS updated FROM {HIGH_LEVEL_NODE_TABLE}"
+        )
+        row = cursor.fetchone()
+        return row["cnt"], row["max_id"], str(row["updated"])
+
+    def list_all(self, cursor) -> List[Dict[str, Any]]:
+        """所有高级节点的完整记录 {node_name, node_type, description}"""
+        cursor.execute(f"SELECT node_name, node_type, description FROM {HIGH_LEVEL_NODE_TABLE} ORDER BY id")
+        return list(cursor.fetchall())
+
+    def count(self, cursor) -> int:
+        """高级节点数量"""
+        cursor.execute(f"SELECT COUNT(*) as cnt FROM {HIGH_LEVEL_NODE_TABLE}")
+        return cursor.fetchone()["cnt"]
+
+    def exists(self, cursor, name: str) -> bool:
+        """是否为高级节点"""
+        cursor.execute(f"SELECT COUNT(*) as cnt FROM {HIGH_LEVEL_NODE_TABLE} WHERE node_name = %s", (name,))
+        return cursor.fetchone()["cnt"] > 0
+
+    def add(self, cursor, name: str, node_type: str = "generic", description: Optional[str] = None):
+        """添加一个高级节点（已存在时抛出唯一键冲突）"""
+        cursor.execute(
+            f"INSERT INTO {HIGH_LEVEL_NODE_TABLE} (node_name, node_type, description) VALUES (%s, %s, %s)",
+            (name, node_type, description)
+        )
+
+    def add_many(self, cursor, records: Sequence[Dict[str, Any]]) -> int:
+        """
+        批量添加高级节点（已存在的忽略）
+
+        Args:
+            records: [{node_name, node_type(可选), description(可选)}]
+        """
+        if not records:
+            return 0
+        cursor.executemany(
+            f"""
+            {self.backend.insert_ignore} INTO {HIGH_LEVEL_NODE_TABLE} (node_name, node_type, description)
+            VALUES (%s, %s, %s)
+            """,
+            [
+                (record["node_name"], record.get("node_type", "generic"), record.get("description"))
+                for record in records
+            ]
+        )
+        return cursor.rowcount
+
+    def remove(self, cursor, name: str) -> int:
+        """移除高级节点标记，返回受影响行数"""
+        cursor.execute(f"DELETE FROM {HIGH_LEVEL_NODE_TABLE} WHERE node_name = %s", (name,))
+        return cursor.rowcount
+
+    def remove_all(self, cursor) -> int:
+        """清空高级节点"""
+        cursor.execute(f"DELETE FROM {HIGH_LEVEL_NODE_TABLE}")
+        return cursor.rowcount
+
+    def remove_many(self, cursor, names: Iterable[str]) -> int:
+        """批量移除高级节点标记，返回受影响行数"""
+        names = list(dict.fromkeys(names))
+        if not names:
+            return 0
+        placeholders = ", ".join(["%s"] * len(names))
+        cursor.execute(f"DELETE FROM {HIGH_LEVEL_NODE_TABLE} WHERE node_name IN ({placeholders})", names)
+        return cursor.rowcount
+
+    def rename(self, cursor, old_name: str, new_name: str) -> int:
+        """
+        重命名高级节点，返回受影响行数
+
+        新名称已是高级节点时（实体合并）直接移除旧名称
+        """
+        if self.exists(cursor, new_name):
+            return self.remove(cursor, old_name)
+        cursor.execute(
+            f"UPDATE {HIGH_LEVEL_NODE_TABLE} SET node_name = %s, updated_at = CURRENT_TIMESTAMP WHERE node_name = %s",
+            (new_name, old_name)
+        )
+        return cursor.rowcount
+
+
+class AnalysisHistoryRepository:
+    """图像分析历史"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def add(self, cursor, analysis_id: str, timestamp: str, entity_count: int,
+            detected_types: List[str], confidence: float, risk_level: str):
+        """写入一条分析记录，并在同一事务中累加到小时/天汇总"""
+        cursor.execute(f"""
+            INSERT INTO {ANALYSIS_HISTORY_TABLE}
+            (analysis_id, timestamp, entity_count, detected_types, confidence, risk_level)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, (analysis_id, timestamp, entity_count, json.dumps(detected_types), confidence, risk_level))
+        self._add_to_rollups(cursor, [{
+            "timestamp": timestamp, "entity_count": entity_count,
+            "confidence": confidence, "risk_level": risk_level
+        }])
+
+    def add_many(self, cursor, records: Sequence[Dict[str, Any]]) -> int:
+        """
+        批量写入分析记录（analysis_id 已存在的忽略），新写入的记录累加到汇总
+
+        Args:
+            records: [{analysis_id, timestamp, entity_count, detected_types(列表), confidence, risk_level}]
+        """
+        if not records:
+            return 0
+        existing = set()
+        analysis_ids = list(dict.fromkeys(record["analysis_id"] for record in records))
+        for offset in range(0, len(analysis_ids), LOOKUP_CHUNK_SIZE):
+            chunk = analysis_ids[offset:offset + LOOKUP_CHUNK_SIZE]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(
+                f"SELECT analysis_id FROM {ANALYSIS_HISTORY_TABLE} WHERE analysis_id IN ({placeholders})", chunk
+            )
+            existing.update(row["analysis_id"] for row in cursor.fetchall())
+        new_records = []
+        for record in records:
+            if record["analysis_id"] not in existing:
+                existing.add(record["analysis_id"])
+                new_records.append(record)
+        if not new_records:
+            return 0
+        records = new_records
+
+        cursor.executemany(
+            f"""
+            INSERT INTO {ANALYSIS_HISTORY_TABLE}
+            (analysis_id, timestamp, entity_count, detected_types, confidence, risk_level)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            """,
+            [
+                (
+                    record["analysis_id"], record["timestamp"], record["entity_count"],
+                    json.dumps(record["detected_types"]), record["confidence"], record["risk_level"]
+                )
+                for record in records
+            ]
+        )
+        self._add_to_rollups(cursor, records)
+        return len(records)
+
+    def _add_to_rollups(self, cursor, records: Iterable[Dict[str, Any]]):
+        rollups = aggregate_rollups(records)
+        cursor.executemany(
+            self.backend.upsert_add(ANALYSIS_ROLLUP_TABLE, ROLLUP_KEY_COLUMNS, ROLLUP_VALUE_COLUMNS),
+            [(*key, *values) for key, values in rollups.items()]
+        )
+
+    def list_all(self, cursor) -> List[Dict[str, Any]]:
+        """全部分析记录（按写入顺序），detected_types 已解析为列表"""
+        cursor.execute(f"""
+            SELECT analysis_id, timestamp, entity_count, detected_types, confidence, risk_level
+            FROM {ANALYSIS_HISTORY_TABLE}
+            ORDER BY id
+        """)
+        records = []
+        for record in cursor.fetchall():
+            record = dict(record)
+            if isinstance(record["detected_types"], str):
+                record["detected_types"] = json.loads(record["detected_types"])
+            records.append(record)
+        return records
+
+    def list_page(self, cursor, limit: int, after: Optional[Tuple[str, int]] = None,
+                  risk_level: Optional[str] = None,
+                  detected_type: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[Tuple[str, int]]]:
+        """
+        按 (timestamp, id) 倒序的键集分页
+
+        Args:
+            limit: 每页记录数
+            after: 上一页最后一条记录的 (timestamp, id)，None 表示第一页
+            risk_level: 只返回该风险等级的记录
+            detected_type: 只返回检测类型中包含该类型的记录
+
+        Returns:
+            (记录列表, 下一页的起点)；没有更多记录时起点为None。
+            记录的 detected_types 已解析为列表，timestamp 为字符串
+        """
+        conditions = []
+        params: List[Any] = []
+        if after is not None:
+            conditions.append("(timestamp < %s OR (timestamp = %s AND id < %s))")
+            params.extend([after[0], after[0], after[1]])
+        if risk_level:
+            conditions.append("risk_level = %s")
+            params.append(risk_level)
+        if detected_type:
+            conditions.append(self.backend.json_array_contains("detected_types"))
+            params.append(detected_type)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        cursor.execute(f"""
+            SELECT id AS row_id, analysis_id, timestamp, entity_count, detected_types, confidence, risk_level
+            FROM {ANALYSIS_HISTORY_TABLE}
+            {where}
+            ORDER BY timestamp DESC, id DESC
+            LIMIT %s
+        """, (*params, limit + 1))
+        rows = cursor.fetchall()
+
+        records = []
+        for record in rows[:limit]:
+            detected_types = record["detected_types"]
+            if isinstance(detected_types, str):
+                detected_types = json.loads(detected_types)
+            records.append({
+                "id": record["analysis_id"],
+                "timestamp": format_timestamp(record["timestamp"]),
+                "entity_count": record["entity_count"],
+                "detected_types": detected_types,
+                "confidence": round(float(record["confidence"]), 1),
+                "risk_level": record["risk_level"]
+            })
+
+        next_after = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_after = (format_timestamp(last["timestamp"]), last["row_id"])
+        return records, next_after
+
+    def trends(self, cursor, granularity: str, start: Optional[str] = None,
+               end: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        按小时/天的分析趋势，只读取汇总表
+
+        Args:
+            granularity: hour / day
+            start: 起始时间（含），None 表示不限
+            end: 结束时间（不含），None 表示不限
+
+        Returns:
+            按时间正序的 [{bucket_start, analysis_count, avg_confidence, avg_entity_count, risk_levels}]
+        """
+        conditions = ["granularity = %s"]
+        params: List[Any] = [granularity]
+        if start:
+            conditions.append("bucket_start >= %s")
+            params.append(start)
+        if end:
+            conditions.append("bucket_start < %s")
+            params.append(end)
+        cursor.execute(f"""
+            SELECT bucket_start, risk_level, analysis_count, entity_count_sum, confidence_sum
+            FROM {ANALYSIS_ROLLUP_TABLE}
+            WHERE {' AND '.join(conditions)}
+            ORDER BY bucket_start
+        """, params)
+
+        buckets: Dict[str, Dict[str, Any]] = {}
+        for row in cursor.fetchall():
+            bucket_start = format_timestamp(row["bucket_start"])
+            bucket = buckets.get(bucket_start)
+            if bucket is None:
+                bucket = buckets[bucket_start] = {
+                    "bucket_start": bucket_start, "analysis_count": 0,
+                    "entity_count_sum": 0, "confidence_sum": 0.0, "risk_levels": {}
+                }
+            bucket["analysis_count"] += row["analysis_count"]
+            bucket["entity_count_sum"] += row["entity_count_sum"]
+            bucket["confidence_sum"] += float(row["confidence_sum"])
+            bucket["risk_levels"][row["risk_level"]] = row["analysis_count"]
+
+        results = []
+        for bucket in buckets.values():
+            count = bucket["analysis_count"]
+            results.append({
+                "bucket_start": bucket["bucket_start"],
+                "analysis_count": count,
+                "avg_confidence": round(bucket["confidence_sum"] / count, 3) if count else 0.0,
+                "avg_entity_count": round(bucket["entity_count_sum"] / count, 2) if count else 0.0,
+                "risk_levels": bucket["risk_levels"]
+            })
+        return results
+
+
+class AnalysisResultRepository:
+    """图像分析完整结果（压缩后的响应JSON，编解码见 analysis_results.py）"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def add(self, cursor, analysis_id: str, payload: bytes, codec: str):
+        """写入一条压缩后的分析结果"""
+        cursor.execute(
+            f"INSERT INTO {ANALYSIS_RESULT_TABLE} (analysis_id, codec, payload) VALUES (%s, %s, %s)",
+            (analysis_id, codec, payload)
+        )
+
+    def get(self, cursor, analysis_id: str) -> Optional[Tuple[bytes, str]]:
+        """
+        读取分析结果
+
+        Returns:
+            (压缩数据, 压缩格式)，不存在时返回None
+        """
+        cursor.execute(
+            f"SELECT codec, payload FROM {ANALYSIS_RESULT_TABLE} WHERE analysis_id = %s", (analysis_id,)
+        )
+        row = cursor.fetchone()
+        return (bytes(row["payload"]), row["codec"]) if row else None
+
+
+def format_timestamp(value) -> str:
+    """DATETIME（MySQL 返回 datetime，SQLite 返回字符串）统一格式化为 YYYY-mm-dd HH:MM:SS"""
+    return value.strftime(TIMESTAMP_FORMAT) if hasattr(value, "strftime") else str(value)
+
+
+def rollup_buckets(timestamp) -> Dict[str, str]:
+    """分析时间所属的小时桶和天桶的起点"""
+    text = format_timestamp(timestamp)
+    return {"hour": f"{text[:13]}:00:00", "day": f"{text[:10]} 00:00:00"}
+
+
+def aggregate_rollups(records: Iterable[Dict[str, Any]]) -> Dict[Tuple[str, str, str], List]:
+    """
+    将分析记录汇总为 {(粒度, 桶起点, 风险等级): [分析次数, 实体数之和, 置信度之和]}
+
+    Args:
+        records: 至少包含 timestamp, entity_count, confidence, risk_level 的记录
+    """
+    rollups: Dict[Tuple[str, str, str], List] = {}
+    for record in records:
+        for granularity, bucket_start in rollup_buckets(record["timestamp"]).items():
+            values = rollups.setdefault((granularity, bucket_start, record["risk_level"]), [0, 0, 0.0])
+            values[0] += 1
+            values[1] += int(record["entity_count"])
+            values[2] += float(record["confidence"])
+    return rollups
+
+
+def encode_page_cursor(after: Optional[Tuple[str, int]]) -> Optional[str]:
+    """把分页起点编码为不透明的游标字符串"""
+    if after is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(list(after)).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_page_cursor(token: Optional[str]) -> Optional[Tuple[str, int]]:
+    """
+    解析分页游标
+
+    Raises:
+        ValueError: 游标格式无效
+    """
+    if not token:
+        return None
+    try:
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        return str(timestamp), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"无效的分页游标: {token}") from e
+
+
+# 全局仓储实例
+valid_relation_repository = None
+high_level_node_repository = None
+analysis_history_repository = None
+analysis_result_repository = None
+
+
+def init_repositories(backend):
+    """
+    初始化仓储
+
+    Args:
+        backend: 存储后端
+    """
+    global valid_relation_repository, high_level_node_repository, analysis_history_repository, \
+        analysis_result_repository
+
+    valid_relation_repository = ValidRelationRepository(backend)
+    high_level_node_repository = HighLevelNodeRepository(backend)
+    analysis_history_repository = AnalysisHistoryRepository(backend)
+    analysis_result_repository = AnalysisResultRepository(backend)
+    logger.info("仓储初始化完成")
+
+
+def get_valid_relation_repository() -> ValidRelationRepository:
+    """获取有效关系仓储"""
+    if valid_relation_repository is None:
+        raise RuntimeError("仓储未初始化")
+    return valid_relation_repository
+
+
+def get_high_level_node_repository() -> HighLevelNodeRepository:
+    """获取高级节点仓储"""
+    if high_level_node_repository is None:
+        raise RuntimeError("仓储未初始化")
+    return high_level_node_repository
+
+
+def get_analysis_history_repository() -> AnalysisHistoryRepository:
+    """获取图像分析历史仓储"""
+    if analysis_history_repository is None:
+        raise RuntimeError("仓储未初始化")
+    return analysis_history_repository
+
+
+def get_analysis_result_repository() -> AnalysisResultRepository:
+    """获取图像分析结果仓储"""
+    if analysis_result_repository is None:
+        raise RuntimeError("仓储未初始化")
+    return analysis_result_repository
@@ -0,0 +1,434 @@
+"""
+数据库结构版本迁移
+MySQL 按版本号顺序执行迁移，已执行的版本记录在 schema_migrations 表中；
+SQLite 没有历史库需要升级，版本记录在 PRAGMA user_version 中；
+结构已是最新版本时启动过程不执行任何DDL
+"""
+import logging
+import time
+from typing import Callable, List, NamedTuple
+
+import pymysql
+
+from triple_store import ENTITY_TABLE, RELATION_TABLE, TRIPLE_TABLE, NAMED_TRIPLE_VIEW, ensure_schema
+from repositories import (
+    VALID_RELATION_TABLE,
+    HIGH_LEVEL_NODE_TABLE,
+    ANALYSIS_HISTORY_TABLE,
+    ANALYSIS_ROLLUP_TABLE,
+    ANALYSIS_RESULT_TABLE,
+    ENTITY_FEATURE_TABLE,
+    ROLLUP_KEY_COLUMNS,
+    ROLLUP_VALUE_COLUMNS,
+    aggregate_rollups
+)
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION_TABLE = "schema_migrations"
+# 多个服务进程同时启动时串行执行迁移
+MIGRATION_LOCK_NAME = "kg_schema_migrations"
+MIGRATION_LOCK_TIMEOUT = 60
+
+# MySQL错误码: 表不存在
+ER_NO_SUCH_TABLE = 1146
+
+
+class Migration(NamedTuple):
+    """一个结构迁移版本；MySQL的DDL会隐式提交，因此每个迁移都必须可重复执行"""
+    version: int
+    description: str
+    apply: Callable
+
+
+def _has_index(cursor, table: str, index: str) -> bool:
+    cursor.execute("""
+        SELECT COUNT(*) as cnt FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    """, (table, index))
+    return cursor.fetchone()["cnt"] > 0
+
+
+def _create_base_tables(cursor):
+    """有效关系表、高级节点表和图像分析历史表"""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {VALID_RELATION_TABLE} (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            relation_name VARCHAR(100) UNIQUE NOT NULL
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {HIGH_LEVEL_NODE_TABLE} (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            node_name VARCHAR(255) UNIQUE NOT NULL,
+            node_type ENUM('core', 'generic') DEFAULT 'generic',
+            description VARCHAR(512) DEFAULT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            INDEX idx_node_name (node_name)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ANALYSIS_HISTORY_TABLE} (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            analysis_id VARCHAR(100) NOT NULL UNIQUE,
+            timestamp DATETIME NOT NULL,
+            entity_count INT NOT NULL,
+            detected_types JSON NOT NULL,
+            confidence FLOAT NOT NULL,
+            risk_level VARCHAR(20) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_timestamp (timestamp),
+            INDEX idx_analysis_id (analysis_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+
+
+def _add_triple_indexes(cursor):
+    """
+    三元组去重后添加唯一约束和复合索引
+
+    uk_triple (head, relation, tail): 三元组存在性检查、按头实体+关系查询
+    idx_tail_head (tail, head): 按尾实体查询、实体对之间的反向查询
+    idx_relation (relation): 按关系过滤
+    原单列索引是新索引的最左前缀，随后删除
+    """
+    cursor.execute(f"""
+        DELETE t FROM {TRIPLE_TABLE} t
+        JOIN (
+            SELECT head_id, relation_id, tail_id, MIN(id) AS keep_id
+            FROM {TRIPLE_TABLE}
+            GROUP BY head_id, relation_id, tail_id
+            HAVING COUNT(*) > 1
+        ) d ON t.head_id = d.head_id AND t.relation_id = d.relation_id
+           AND t.tail_id = d.tail_id AND t.id <> d.keep_id
+    """)
+    if cursor.rowcount:
+        logger.info(f"已删除 {cursor.rowcount} 条重复三元组")
+
+    changes = []
+    if not _has_index(cursor, TRIPLE_TABLE, "uk_triple"):
+        changes.append("ADD UNIQUE KEY uk_triple (head_id, relation_id, tail_id)")
+    if not _has_index(cursor, TRIPLE_TABLE, "idx_tail_head"):
+        changes.append("ADD INDEX idx_tail_head (tail_id, head_id)")
+    if not _has_index(cursor, TRIPLE_TABLE, "idx_relation"):
+        changes.append("ADD INDEX idx_relation (relation_id)")
+    for index in ("idx_head_id", "idx_tail_id"):
+        if _has_index(cursor, TRIPLE_TABLE, index):
+            changes.append(f"DROP INDEX {index}")
+    if changes:
+        cursor.execute(f"ALTER TABLE {TRIPLE_TABLE} " + ", ".join(changes))
+
+
+def _backfill_analysis_rollups(cursor):
+    """根据已有的分析历史重建小时/天汇总（先清空，可重复执行）"""
+    cursor.execute(f"DELETE FROM {ANALYSIS_ROLLUP_TABLE}")
+    cursor.execute(f"SELECT timestamp, entity_count, confidence, risk_level FROM {ANALYSIS_HISTORY_TABLE}")
+    rollups = aggregate_rollups(cursor.fetchall())
+    columns = ROLLUP_KEY_COLUMNS + ROLLUP_VALUE_COLUMNS
+    cursor.executemany(
+        f"INSERT INTO {ANALYSIS_ROLLUP_TABLE} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+        [(*key, *values) for key, values in rollups.items()]
+    )
+    if rollups:
+        logger.info(f"已生成 {len(rollups)} 条分析历史汇总")
+
+
+def _add_analysis_rollups(cursor):
+    """
+    分析历史汇总表及分页/过滤索引
+
+    汇总表按 (粒度, 桶起点, 风险等级) 保存分析次数、实体数之和、置信度之和，
+    写入分析记录时在同一事务中累加；idx_risk_timestamp 用于按风险等级过滤的分页
+    """
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ANALYSIS_ROLLUP_TABLE} (
+            granularity VARCHAR(8) NOT NULL,
+            bucket_start DATETIME NOT NULL,
+            risk_level VARCHAR(20) NOT NULL,
+            analysis_count INT NOT NULL DEFAULT 0,
+            entity_count_sum BIGINT NOT NULL DEFAULT 0,
+            confidence_sum DOUBLE NOT NULL DEFAULT 0,
+            PRIMARY KEY (granularity, bucket_start, risk_level)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+    if not _has_index(cursor, ANALYSIS_HISTORY_TABLE, "idx_risk_timestamp"):
+        cursor.execute(f"ALTER TABLE {ANALYSIS_HISTORY_TABLE} ADD INDEX idx_risk_timestamp (risk_level, timestamp)")
+    _backfill_analysis_rollups(cursor)
+
+
+def _add_analysis_results(cursor):
+    """图像分析完整结果表（压缩后的响应JSON，与历史表分开存放，历史分页不读取大字段）"""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ANALYSIS_RESULT_TABLE} (
+            analysis_id VARCHAR(100) PRIMARY KEY,
+            codec VARCHAR(8) NOT NULL,
+            payload MEDIUMBLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+
+
+def _add_entity_features(cursor):
+    """实体特征表（知识更新器写入的实体特征，按实体名称查询）"""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ENTITY_FEATURE_TABLE} (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            entity_name VARCHAR(255) NOT NULL,
+            feature_type VARCHAR(100) NOT NULL,
+            feature_value TEXT,
+            confidence FLOAT DEFAULT 1.0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_entity_name (entity_name)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "实体/关系字典表、三元组表及名称视图（含旧版字符串三元组表迁移）", ensure_schema),
+    Migration(2, "有效关系表、高级节点表、图像分析历史表", _create_base_tables),
+    Migration(3, "三元组去重，添加唯一约束及复合索引", _add_triple_indexes),
+    Migration(4, "图像分析历史小时/天汇总表及风险等级分页索引", _add_analysis_rollups),
+    Migration(5, "图像分析完整结果表", _add_analysis_results),
+    Migration(6, "实体特征表", _add_entity_features),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def current_version(cursor) -> int:
+    """
+    读取已执行的最高迁移版本
+
+    Returns:
+        版本号，尚未执行过任何迁移时为0
+    """
+    try:
+        cursor.execute(f"SELECT MAX(version) AS version FROM {SCHEMA_VERSION_TABLE}")
+    except pymysql.err.ProgrammingError as e:
+        if e.args[0] == ER_NO_SUCH_TABLE:
+            return 0
+        raise
+    row = cursor.fetchone()
+    return row["version"] or 0
+
+
+def run_migrations(conn) -> int:
+    """
+    执行所有未执行的迁移
+
+    Args:
+        conn: 数据库连接（DictCursor）
+
+    Returns:
+        执行后的结构版本号
+    """
+    cursor = conn.cursor()
+    version = current_version(cursor)
+    if version >= LATEST_VERSION:
+        logger.info(f"数据库结构已是最新版本 {version}")
+        return version
+
+    cursor.execute("SELECT GET_LOCK(%s, %s) AS locked", (MIGRATION_LOCK_NAME, MIGRATION_LOCK_TIMEOUT))
+    if not cursor.fetchone()["locked"]:
+        raise RuntimeError("等待数据库迁移锁超时")
+    try:
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} (
+                version INT PRIMARY KEY,
+                description VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+        # 获取锁期间其他进程可能已完成迁移
+        version = current_version(cursor)
+
+        for migration in MIGRATIONS:
+            if migration.version <= version:
+                continue
+            start = time.time()
+            logger.info(f"执行数据库迁移 {migration.version}: {migration.description}")
+            migration.apply(cursor)
+            cursor.execute(
+                f"INSERT INTO {SCHEMA_VERSION_TABLE} (version, description) VALUES (%s, %s)",
+                (migration.version, migration.description)
+            )
+            conn.commit()
+            version = migration.version
+            logger.info(f"数据库迁移 {migration.version} 完成，耗时 {(time.time() - start) * 1000:.1f}ms")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK_NAME,))
+
+    return version
+
+
+# ==================== SQLite ====================
+
+def _create_sqlite_schema(cursor):
+    """与 MySQL 迁移3之后等价的完整结构"""
+    for table in (ENTITY_TABLE, RELATION_TABLE):
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE
+            )
+        """)
+
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TRIPLE_TABLE} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            head_id INTEGER NOT NULL REFERENCES {ENTITY_TABLE}(id),
+            relation_id INTEGER NOT NULL REFERENCES {RELATION_TABLE}(id),
+            tail_id INTEGER NOT NULL REFERENCES {ENTITY_TABLE}(id)
+        )
+    """)
+    cursor.execute(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS uk_triple ON {TRIPLE_TABLE} (head_id, relation_id, tail_id)"
+    )
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_tail_head ON {TRIPLE_TABLE} (tail_id, head_id)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_relation ON {TRIPLE_TABLE} (relation_id)")
+
+    cursor.execute(f"""
+        CREATE VIEW IF NOT EXISTS {NAMED_TRIPLE_VIEW} AS
+        SELECT t.id, h.name AS head_entity, r.name AS relation, e.name AS tail_entity
+        FROM {TRIPLE_TABLE} t
+        JOIN {ENTITY_TABLE} h ON h.id = t.head_id
+        JOIN {RELATION_TABLE} r ON r.id = t.relation_id
+        JOIN {ENTITY_TABLE} e ON e.id = t.tail_id
+    """)
+
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {VALID_RELATION_TABLE} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            relation_name TEXT NOT NULL UNIQUE
+        )
+    """)
+
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {HIGH_LEVEL_NODE_TABLE} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            node_name TEXT NOT NULL UNIQUE,
+            node_type TEXT DEFAULT 'generic' CHECK (node_type IN ('core', 'generic')),
+            description TEXT DEFAULT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ANALYSIS_HISTORY_TABLE} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            analysis_id TEXT NOT NULL UNIQUE,
+            timestamp TEXT NOT NULL,
+            entity_count INTEGER NOT NULL,
+            detected_types TEXT NOT NULL,
+            confidence REAL NOT NULL,
+            risk_level TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_timestamp ON {ANALYSIS_HISTORY_TABLE} (timestamp)")
+
+
+def _add_sqlite_analysis_rollups(cursor):
+    """分析历史汇总表及分页/过滤索引（与 MySQL 迁移 4 对应）"""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ANALYSIS_ROLLUP_TABLE} (
+            granularity TEXT NOT NULL,
+            bucket_start TEXT NOT NULL,
+            risk_level TEXT NOT NULL,
+            analysis_count INTEGER NOT NULL DEFAULT 0,
+            entity_count_sum INTEGER NOT NULL DEFAULT 0,
+            confidence_sum REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (granularity, bucket_start, risk_level)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_risk_timestamp ON {ANALYSIS_HISTORY_TABLE} (risk_level, timestamp)"
+    )
+    _backfill_analysis_rollups(cursor)
+
+
+def _add_sqlite_analysis_results(cursor):
+    """图像分析完整结果表（与 MySQL 迁移 5 对应）"""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ANALYSIS_RESULT_TABLE} (
+            analysis_id TEXT PRIMARY KEY,
+            codec TEXT NOT NULL,
+            payload BLOB NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def _add_sqlite_entity_features(cursor):
+    """实体特征表（与 MySQL 迁移 6 对应）"""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ENTITY_FEATURE_TABLE} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity_name TEXT NOT NULL,
+            feature_type TEXT NOT NULL,
+            feature_value TEXT,
+            confidence REAL DEFAULT 1.0,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_entity_name ON {ENTITY_FEATURE_TABLE} (entity_name)")
+
+
+SQLITE_MIGRATIONS: List[Migration] = [
+    Migration(1, "完整结构（字典表、三元组表及索引、名称视图、有效关系、高级节点、图像分析历史）", _create_sqlite_schema),
+    Migration(2, "图像分析历史小时/天汇总表及风险等级分页索引", _add_sqlite_analysis_rollups),
+    Migration(3, "图像分析完整结果表", _add_sqlite_analysis_results),
+    Migration(4, "实体特征表", _add_sqlite_entity_features),
+]
+
+SQLITE_LATEST_VERSION = SQLITE_MIGRATIONS[-1].version
+
+
+def run_sqlite_migrations(conn) -> int:
+    """
+    执行所有未执行的 SQLite 迁移
+
+    SQLite 的DDL可以在事务中执行，每个迁移与版本号更新一起提交；
+    写事务本身互斥，多进程同时启动时无需额外加锁
+
+    Args:
+        conn: storage.SQLiteConnection
+
+    Returns:
+        执行后的结构版本号
+    """
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA user_version")
+    version = cursor.fetchone()["user_version"]
+    if version >= SQLITE_LATEST_VERSION:
+        logger.info(f"数据库结构已是最新版本 {version}")
+        return version
+
+    try:
+        # 立即获取写锁，避免并发启动时两个进程读到相同的旧版本
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("PRAGMA user_version")
+        version = cursor.fetchone()["user_version"]
+        for migration in SQLITE_MIGRATIONS:
+            if migration.version <= version:
+                continue
+            start = time.time()
+            logger.info(f"执行数据库迁移 {migration.version}: {migration.description}")
+            migration.apply(cursor)
+            # PRAGMA 不支持参数占位符，版本号来自代码常量
+            cursor.execute(f"PRAGMA user_version = {int(migration.version)}")
+            version = migration.version
+            logger.info(f"数据库迁移 {migration.version} 完成，耗时 {(time.time() - start) * 1000:.1f}ms")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return version
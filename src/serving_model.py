@@ -0,0 +1,431 @@
+"""
+Word2Vec 服务模型编译
+相似度服务只需要图谱实体、实体分词后的词语及它们周围的近邻词，
+完整词汇表（尤其是数百万词的通用模型）和 float32 精度大多用不到。
+编译步骤：
+
+1. 裁剪词汇表：相关词集合（图谱实体 + jieba 分词结果 + 自定义词表）
+   加上它们在完整模型中的 N 个近邻，再加上词频最高的若干词
+2. 量化：向量先 L2 归一化，再存为 float16，或 int8 + 每个向量一个缩放系数
+3. 服务时直接在紧凑表示上计算余弦相似度（归一化后内积即余弦，无需再算范数）
+
+编译结果保存在模型文件旁的 <模型路径>.serving/ 目录，加载时以内存映射方式打开，
+存在且与源模型匹配时 Word2VecService 自动使用（WORD2VEC_USE_SERVING_MODEL=0 关闭）
+
+目录结构:
+    meta.json       量化类型、词数、源模型指纹、编译参数
+    vocab.txt       词表（每行一个词，顺序与向量行号一致）
+    codes.npy       float16 / int8 (n, dim)    归一化后的量化向量
+    scales.npy      float32 (n,)               int8 的每向量缩放系数（float16 时全为1）
+"""
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    import jieba
+except ImportError:  # jieba为可选依赖，未安装时相关词集合不包含实体分词结果
+    jieba = None
+
+SERVING_FORMAT = "word2vec-serving"
+SERVING_VERSION = 1
+SERVING_SUFFIX = ".serving"
+META_FILE = "meta.json"
+VOCAB_FILE = "vocab.txt"
+
+DTYPE_FLOAT16 = "float16"
+DTYPE_INT8 = "int8"
+DTYPES = (DTYPE_INT8, DTYPE_FLOAT16)
+INT8_MAX = 127
+
+DEFAULT_TOP_FREQUENT = 50_000
+DEFAULT_NEIGHBOURS = 20
+# 评分时每批反量化的行数（批内转换为 float32 后用 BLAS 计算）
+SCORE_CHUNK_SIZE = 4096
+# 编译时批量计算近邻的查询数 / 词表分块行数
+NEIGHBOUR_QUERY_BATCH = 1024
+NEIGHBOUR_VOCAB_CHUNK = 16_384
+
+USE_SERVING_MODEL = os.getenv("WORD2VEC_USE_SERVING_MODEL", "1") != "0"
+
+
+def serving_path(model_path: Union[str, Path]) -> Path:
+    """模型对应的服务模型目录"""
+    return Path(str(model_path) + SERVING_SUFFIX)
+
+
+def source_fingerprint(model_path: Union[str, Path]) -> Dict[str, int]:
+    """源模型文件指纹（不需要加载模型即可比较）"""
+    stat = os.stat(model_path)
+    return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def quantize(vectors: np.ndarray, dtype: str = DTYPE_INT8):
+    """
+    归一化并量化向量
+
+    Args:
+        vectors: (n, dim) 原始向量
+        dtype: int8（每向量缩放系数 = 最大绝对值 / 127）或 float16
+
+    Returns:
+        (codes, scales)
+    """
+    normalized = _normalize(vectors)
+    if dtype == DTYPE_FLOAT16:
+        return normalized.astype(np.float16), np.ones(len(normalized), dtype=np.float32)
+    if dtype != DTYPE_INT8:
+        raise ValueError(f"不支持的量化类型: {dtype}")
+    scales = np.abs(normalized).max(axis=1) / INT8_MAX
+    scales[scales == 0] = 1.0
+    codes = np.rint(normalized / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def score_codes(codes: np.ndarray, scales: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """
+    单位查询向量与量化向量（quantize 的结果）的余弦相似度，分批反量化后用 BLAS 计算
+
+    Args:
+        codes: float16 / int8 (n, dim)
+        scales: float32 (n,)
+        query: 归一化的 float32 查询向量
+
+    Returns:
+        float32 (n,)
+    """
+    out = np.empty(len(codes), dtype=np.float32)
+    buffer = np.empty((min(SCORE_CHUNK_SIZE, len(codes)), codes.shape[1]), dtype=np.float32)
+    for start in range(0, len(codes), SCORE_CHUNK_SIZE):
+        chunk = buffer[:min(SCORE_CHUNK_SIZE, len(codes) - start)]
+        np.copyto(chunk, codes[start:start + len(chunk)], casting="unsafe")
+        np.dot(chunk, query, out=out[start:start + len(chunk)])
+    if codes.dtype == np.int8:
+        out *= scales
+    return out
+
+
+class _DequantizedRows:
+    """按行反量化的只读视图，兼容 model.vectors[i] / model.vectors[[i, j]] 的用法"""
+
+    def __init__(self, model: "CompactKeyedVectors"):
+        self._model = model
+
+    def __len__(self) -> int:
+        return len(self._model.codes)
+
+    @property
+    def shape(self):
+        return self._model.codes.shape
+
+    def __getitem__(self, rows):
+        codes = np.asarray(self._model.codes[rows], dtype=np.float32)
+        scales = self._model.scales[rows]
+        return codes * (scales[..., None] if np.ndim(scales) else scales)
+
+
+class CompactKeyedVectors:
+    """
+    裁剪、量化后的词向量（接口与 Word2VecService 用到的 gensim KeyedVectors 部分一致）
+
+    向量均已归一化，get_vector / vectors 返回单位向量
+    """
+
+    def __init__(self, index_to_key: List[str], codes: np.ndarray, scales: np.ndarray,
+                 meta: Optional[Dict[str, Any]] = None):
+        self.index_to_key = index_to_key
+        self.key_to_index = {word: i for i, word in enumerate(index_to_key)}
+        self.codes = codes
+        self.scales = scales
+        self.meta = meta or {}
+        self.dtype = str(codes.dtype)
+        self.vector_size = codes.shape[1]
+        self.vectors = _DequantizedRows(self)
+
+    def __len__(self) -> int:
+        return len(self.index_to_key)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.key_to_index
+
+    @property
+    def nbytes(self) -> int:
+        """向量占用的字节数"""
+        return int(self.codes.nbytes + self.scales.nbytes)
+
+    def get_vector(self, word: str) -> np.ndarray:
+        """
+        词的（归一化）向量
+
+        Raises:
+            KeyError: 词不在词汇表中
+        """
+        return self.vectors[self.key_to_index[word]]
+
+    def similarity(self, word1: str, word2: str) -> float:
+        """
+        两个词的余弦相似度（向量均已归一化，即反量化后的内积）
+
+        Raises:
+            KeyError: 词不在词汇表中
+        """
+        return float(np.dot(self.get_vector(word1), self.get_vector(word2)))
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """
+        查询向量与所有词的余弦相似度，直接在量化表示上分批计算
+
+        Args:
+            query: 查询向量（不要求归一化）
+
+        Returns:
+            float32 (n,)
+        """
+        return score_codes(self.codes, self.scales, _normalize(query))
+
+    def most_similar(self, word: str, topn: int = 10) -> List[tuple]:
+        """
+        与 gensim most_similar(word, topn) 相同形式的结果（排除词本身）
+
+        Raises:
+            KeyError: 词不在词汇表中
+        """
+        row = self.key_to_index[word]
+        scores = self.scores(self.vectors[row])
+        scores[row] = -np.inf
+        count = min(topn, len(scores) - 1)
+        if count <= 0:
+            return []
+        top = np.argpartition(-scores, count - 1)[:count]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.index_to_key[i], float(scores[i])) for i in top]
+
+    # ---------- 存取 ----------
+
+    def save(self, directory: Union[str, Path]):
+        """保存到服务模型目录（meta.json 最后写入）"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        with open(directory / VOCAB_FILE, "w", encoding="utf-8") as f:
+            f.writelines(word + "\n" for word in self.index_to_key)
+        np.save(directory / "codes.npy", self.codes)
+        np.save(directory / "scales.npy", self.scales)
+        with open(directory / META_FILE, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, directory: Union[str, Path]) -> "CompactKeyedVectors":
+        """加载服务模型，向量以内存映射方式打开"""
+        directory = Path(directory)
+        with open(directory / META_FILE, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != SERVING_FORMAT or meta.get("version") != SERVING_VERSION:
+            raise ValueError(f"不支持的服务模型格式: {meta.get('format')} v{meta.get('version')}")
+        with open(directory / VOCAB_FILE, encoding="utf-8") as f:
+            index_to_key = f.read().split("\n")[:-1]
+        return cls(
+            index_to_key,
+            np.load(directory / "codes.npy", mmap_mode="r"),
+            np.load(directory / "scales.npy"),
+            meta
+        )
+
+
+def load_serving_model(model_path: str) -> Optional[CompactKeyedVectors]:
+    """
+    加载模型文件旁的服务模型；不存在、已关闭或与源模型不匹配时返回None
+    """
+    directory = serving_path(model_path)
+    if not USE_SERVING_MODEL or not (directory / META_FILE).exists():
+        return None
+    try:
+        model = CompactKeyedVectors.load(directory)
+        if model.meta.get("source") != source_fingerprint(model_path):
+            logger.warning(f"服务模型与源模型不匹配（模型已更新？），请重新编译: {directory}")
+            return None
+        return model
+    except Exception as e:
+        logger.warning(f"服务模型加载失败，使用完整模型: {e}")
+        return None
+
+
+# ---------- 编译 ----------
+
+def relevant_words(model, entity_names: Iterable[str], extra_words: Iterable[str] = ()) -> Set[str]:
+    """
+    相关词集合：在词汇表中的实体名、实体分词后的词语和额外词表
+
+    Args:
+        model: 完整模型（KeyedVectors）
+        entity_names: 图谱实体名
+        extra_words: 额外需要保留的词
+
+    Returns:
+        在词汇表中的相关词
+    """
+    key_to_index = model.key_to_index
+    words = set()
+    for name in entity_names:
+        words.add(name)
+        if jieba is not None:
+            words.update(jieba.lcut(name))
+    words.update(extra_words)
+    return {word for word in words if word in key_to_index}
+
+
+def nearest_neighbours(model, words: Iterable[str], k: int) -> Set[int]:
+    """
+    各词在完整模型中的 k 个近邻（精确计算，查询和词表都分批处理）
+
+    Returns:
+        近邻词的行号集合
+    """
+    rows = np.fromiter((model.key_to_index[word] for word in words), dtype=np.int64)
+    if k <= 0 or not len(rows):
+        return set()
+    vectors = model.vectors
+    neighbours: Set[int] = set()
+    for query_start in range(0, len(rows), NEIGHBOUR_QUERY_BATCH):
+        queries = _normalize(vectors[rows[query_start:query_start + NEIGHBOUR_QUERY_BATCH]])
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(vectors), NEIGHBOUR_VOCAB_CHUNK):
+            scores = queries @ _normalize(vectors[start:start + NEIGHBOUR_VOCAB_CHUNK]).T
+            count = min(k + 1, scores.shape[1])
+            top = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+            best_rows = np.concatenate([best_rows, top + start], axis=1)
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            keep = np.argpartition(-best_scores, min(k + 1, best_scores.shape[1]) - 1, axis=1)[:, :k + 1]
+            best_rows = np.take_along_axis(best_rows, keep, axis=1)
+            best_scores = np.take_along_axis(best_scores, keep, axis=1)
+        neighbours.update(best_rows.ravel().tolist())
+        logger.info(f"已计算近邻 {min(query_start + NEIGHBOUR_QUERY_BATCH, len(rows))}/{len(rows)}")
+    return neighbours
+
+
+def compile_serving_model(model, relevant: Set[str], top_frequent: int = DEFAULT_TOP_FREQUENT,
+                          neighbours: int = DEFAULT_NEIGHBOURS,
+                          dtype: str = DTYPE_INT8) -> CompactKeyedVectors:
+    """
+    裁剪词汇表并量化
+
+    Args:
+        model: 完整模型（KeyedVectors，词表按词频降序）
+        relevant: 相关词集合（须在词汇表中）
+        top_frequent: 额外保留的高频词数
+        neighbours: 每个相关词保留的近邻数
+        dtype: int8 / float16
+
+    Returns:
+        服务模型（保持原词表中的相对顺序）
+    """
+    started = time.time()
+    keep = {model.key_to_index[word] for word in relevant}
+    keep.update(nearest_neighbours(model, relevant, neighbours))
+    keep.update(range(min(top_frequent, len(model.index_to_key))))
+    rows = np.array(sorted(keep), dtype=np.int64)
+
+    codes, scales = quantize(model.vectors[rows], dtype)
+    meta = {
+        "format": SERVING_FORMAT,
+        "version": SERVING_VERSION,
+        "dtype": dtype,
+        "count": int(len(rows)),
+        "source_count": len(model.index_to_key),
+        "dim": int(model.vector_size),
+        "relevant": len(relevant),
+        "neighbours": neighbours,
+        "top_frequent": top_frequent,
+        "compile_seconds": round(time.time() - started, 1)
+    }
+    return CompactKeyedVectors([model.index_to_key[i] for i in rows], codes, scales, meta)
+
+
+def _benchmark(model, compact: CompactKeyedVectors, words: List[str], k: int = 10) -> Dict[str, Any]:
+    """完整模型（float32 暴力计算）与服务模型的评分延迟及 top-k 重合率"""
+    norms = np.linalg.norm(model.vectors, axis=1)
+    norms[norms == 0] = 1.0
+    full_seconds = 0.0
+    compact_seconds = 0.0
+    overlap = 0
+    for word in words:
+        started = time.perf_counter()
+        full_scores = (model.vectors @ _normalize(model.vectors[model.key_to_index[word]])) / norms
+        full_seconds += time.perf_counter() - started
+        started = time.perf_counter()
+        compact_result = compact.most_similar(word, k)
+        compact_seconds += time.perf_counter() - started
+
+        full_scores[model.key_to_index[word]] = -np.inf
+        full_top = {model.index_to_key[i] for i in np.argpartition(-full_scores, k - 1)[:k]}
+        overlap += len(full_top & {w for w, _ in compact_result})
+    return {
+        "queries": len(words),
+        "full_ms": round(full_seconds * 1000 / max(len(words), 1), 3),
+        "compact_ms": round(compact_seconds * 1000 / max(len(words), 1), 3),
+        f"top{k}_overlap": round(overlap / max(len(words) * k, 1), 4)
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from model_store import load_keyed_vectors
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='编译裁剪、量化后的 Word2Vec 服务模型')
+    parser.add_argument('model_path', type=str, help='完整模型文件路径（结果保存在 <模型路径>.serving/）')
+    parser.add_argument('--dtype', type=str, default=DTYPE_INT8, choices=DTYPES, help='量化类型')
+    parser.add_argument('--top-frequent', type=int, default=DEFAULT_TOP_FREQUENT, help='保留的高频词数')
+    parser.add_argument('--neighbours', type=int, default=DEFAULT_NEIGHBOURS, help='每个相关词保留的近邻数')
+    parser.add_argument('--words', type=str, default=None, help='额外相关词表文件（每行一个词）')
+    parser.add_argument('--no-graph', action='store_true', help='不从数据库读取图谱实体')
+    args = parser.parse_args()
+
+    entities: List[str] = []
+    if not args.no_graph:
+        from init_db import DB_CONFIG
+        from storage import init_storage, create_backend
+        from triple_store import get_triple_store
+
+        backend = init_storage(create_backend(DB_CONFIG))
+        backend.migrate()
+        with backend.connection() as conn:
+            entities = get_triple_store().list_entity_names(conn.cursor())
+        backend.close()
+    extra: List[str] = []
+    if args.words:
+        with open(args.words, encoding="utf-8") as f:
+            extra = [line.strip() for line in f if line.strip()]
+
+    full_model = load_keyed_vectors(args.model_path)
+    relevant_set = relevant_words(full_model, entities, extra)
+    serving_model = compile_serving_model(
+        full_model, relevant_set, top_frequent=args.top_frequent, neighbours=args.neighbours, dtype=args.dtype
+    )
+    serving_model.meta["source"] = source_fingerprint(args.model_path)
+    serving_model.save(serving_path(args.model_path))
+
+    sample = sorted(relevant_set)[:200] or full_model.index_to_key[:200]
+    report = {
+        **serving_model.meta,
+        "full_mb": round(full_model.vectors.nbytes / 1024 / 1024, 1),
+        "compact_mb": round(serving_model.nbytes / 1024 / 1024, 1),
+        "benchmark": _benchmark(full_model, serving_model, sample)
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
@@ -0,0 +1,346 @@
+"""
+存储后端
+仓储层（triple_store.py / repositories.py）只编写可移植的SQL（%s 占位符、字典行），
+后端负责提供连接、结构迁移以及少量方言差异：
+- MySQLBackend: 共享的 pymysql 连接池
+- SQLiteBackend: 嵌入式 SQLite（WAL 模式），无需外部服务，适用于离线部署、基准测试
+"""
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import pymysql
+
+from db_manager import init_db_pool, init_db_executor, run_db
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SQLITE_PATH = "knowledge_graph.db"
+
+# 各后端的唯一键冲突异常，用于 except 子句
+INTEGRITY_ERRORS = (pymysql.err.IntegrityError, sqlite3.IntegrityError)
+
+
+class StorageBackend:
+    """存储后端基类"""
+
+    name = ""
+    # 忽略唯一键冲突的插入语句前缀
+    insert_ignore = "INSERT IGNORE"
+
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+
+    def connection(self):
+        """借用连接的上下文管理器，退出时归还（未提交的事务会被回滚）"""
+        raise NotImplementedError
+
+    def streaming_cursor(self, conn):
+        """逐行读取、不缓冲整个结果集的游标"""
+        return conn.cursor()
+
+    def upsert_add(self, table: str, key_columns: Sequence[str], value_columns: Sequence[str]) -> str:
+        """按唯一键插入一行，已存在时把各数值列累加到原有值上的语句"""
+        columns = [*key_columns, *value_columns]
+        updates = ", ".join(f"{column} = {column} + VALUES({column})" for column in value_columns)
+        return (
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+            f"ON DUPLICATE KEY UPDATE {updates}"
+        )
+
+    def json_array_contains(self, column: str) -> str:
+        """JSON数组列包含指定字符串的条件表达式（一个 %s 占位符）"""
+        return f"JSON_CONTAINS({column}, JSON_QUOTE(%s))"
+
+    def migrate(self) -> int:
+        """执行结构迁移，返回结构版本号"""
+        raise NotImplementedError
+
+    def close(self):
+        """关闭后端持有的连接"""
+
+
+class MySQLBackend(StorageBackend):
+    """MySQL 后端（共享 pymysql 连接池）"""
+
+    name = "mysql"
+
+    def __init__(self, db_config: Dict[str, Any], **pool_options):
+        """
+        Args:
+            db_config: 数据库配置
+            **pool_options: ConnectionPool 的其他参数
+        """
+        self.db_config = db_config
+        self.pool = init_db_pool(db_config, **pool_options)
+        super().__init__(self.pool.max_size)
+
+    def connection(self):
+        return self.pool.connection()
+
+    def streaming_cursor(self, conn):
+        return conn.cursor(pymysql.cursors.SSDictCursor)
+
+    def migrate(self) -> int:
+        from schema_migrations import run_migrations
+
+        with self.connection() as conn:
+            return run_migrations(conn)
+
+    def close(self):
+        self.pool.close()
+
+
+class SQLiteCursor:
+    """按 pymysql DictCursor 的用法包装 sqlite3 游标：%s 占位符，行为字典"""
+
+    def __init__(self, connection: "SQLiteConnection"):
+        self.connection = connection
+        self._cursor = connection.raw.cursor()
+
+    @staticmethod
+    def _translate(sql: str) -> str:
+        return sql.replace("%s", "?")
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self) -> Optional[int]:
+        return self._cursor.lastrowid
+
+    def execute(self, sql: str, params=()) -> int:
+        self._cursor.execute(self._translate(sql), tuple(params or ()))
+        return self._cursor.rowcount
+
+    def executemany(self, sql: str, seq_of_params) -> int:
+        self._cursor.executemany(self._translate(sql), seq_of_params)
+        return self._cursor.rowcount
+
+    def fetchone(self) -> Optional[Dict[str, Any]]:
+        return self._cursor.fetchone()
+
+    def fetchall(self) -> List[Dict[str, Any]]:
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size: int) -> List[Dict[str, Any]]:
+        return self._cursor.fetchmany(size)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _dict_row(cursor, row) -> Dict[str, Any]:
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class SQLiteConnection:
+    """按 pymysql 连接的用法包装 sqlite3 连接，并支持提交后回调"""
+
+    def __init__(self, path: str, busy_timeout: float):
+        self.raw = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+        self.raw.row_factory = _dict_row
+        self.raw.execute("PRAGMA journal_mode=WAL")
+        self.raw.execute("PRAGMA synchronous=NORMAL")
+        self._after_commit: List[Callable[[], None]] = []
+
+    def begin(self):
+        """显式开始事务（与 pymysql Connection.begin 一致，未提交的事务先提交）"""
+        if self.raw.in_transaction:
+            self.commit()
+        self.raw.execute("BEGIN")
+
+    def cursor(self, *args) -> SQLiteCursor:
+        # 忽略 pymysql 游标类型参数
+        return SQLiteCursor(self)
+
+    @property
+    def in_transaction(self) -> bool:
+        return self.raw.in_transaction
+
+    def defer_after_commit(self):
+        """与 db_manager.TransactionConnection 一致；写入语句已开启事务，after_commit 自动推迟"""
+
+    def after_commit(self, callback: Callable[[], None]):
+        """当前事务提交后执行回调；不在事务中时立即执行"""
+        if self.raw.in_transaction:
+            self._after_commit.append(callback)
+        else:
+            callback()
+
+    def commit(self):
+        self.raw.commit()
+        callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            callback()
+
+    def rollback(self):
+        self.raw.rollback()
+        self._after_commit = []
+
+    def close(self):
+        self.raw.close()
+
+
+class SQLiteBackend(StorageBackend):
+    """嵌入式 SQLite 后端（WAL 模式：读不阻塞写，同一时刻一个写事务）"""
+
+    name = "sqlite"
+    insert_ignore = "INSERT OR IGNORE"
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH, max_size: int = 4, busy_timeout: float = 10.0):
+        """
+        Args:
+            path: 数据库文件路径
+            max_size: 最大连接数
+            busy_timeout: 等待写锁的最长时间（秒）
+        """
+        super().__init__(max_size)
+        self.path = str(path)
+        self.busy_timeout = busy_timeout
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._idle: List[SQLiteConnection] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._closed = False
+
+    def _acquire(self) -> SQLiteConnection:
+        if not self._slots.acquire(timeout=self.busy_timeout):
+            raise TimeoutError(f"获取SQLite连接超时（连接数上限 {self.max_connections}）")
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        try:
+            return SQLiteConnection(self.path, self.busy_timeout)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, conn: SQLiteConnection, discard: bool = False):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            discard = True
+        with self._lock:
+            if discard or self._closed:
+                conn.close()
+            else:
+                self._idle.append(conn)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        discard = False
+        try:
+            yield conn
+        except sqlite3.DatabaseError as e:
+            discard = not isinstance(e, sqlite3.IntegrityError)
+            raise
+        finally:
+            self._release(conn, discard)
+
+    def upsert_add(self, table: str, key_columns: Sequence[str], value_columns: Sequence[str]) -> str:
+        columns = [*key_columns, *value_columns]
+        updates = ", ".join(f"{column} = {column} + excluded.{column}" for column in value_columns)
+        return (
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+            f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {updates}"
+        )
+
+    def json_array_contains(self, column: str) -> str:
+        return f"EXISTS (SELECT 1 FROM json_each({column}) WHERE json_each.value = %s)"
+
+    def migrate(self) -> int:
+        from schema_migrations import run_sqlite_migrations
+
+        with self.connection() as conn:
+            return run_sqlite_migrations(conn)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+def create_backend(db_config: Dict[str, Any]) -> StorageBackend:
+    """
+    根据环境变量创建存储后端
+
+    STORAGE_BACKEND=mysql（默认）或 sqlite；SQLITE_PATH 指定 SQLite 数据库文件；
+    DB_POOL_SIZE 指定连接数上限
+
+    Args:
+        db_config: MySQL 数据库配置
+    """
+    backend = os.getenv("STORAGE_BACKEND", "mysql").lower()
+    pool_size = os.getenv("DB_POOL_SIZE")
+    if backend == "sqlite":
+        options = {"max_size": int(pool_size)} if pool_size else {}
+        return SQLiteBackend(os.getenv("SQLITE_PATH", DEFAULT_SQLITE_PATH), **options)
+    if backend == "mysql":
+        return MySQLBackend(db_config, max_size=int(pool_size or 10))
+    raise ValueError(f"不支持的存储后端: {backend}")
+
+
+# 全局存储后端实例
+storage_backend = None
+
+
+def init_storage(backend: StorageBackend) -> StorageBackend:
+    """
+    初始化存储后端及依赖它的仓储和数据库线程池
+
+    Args:
+        backend: 存储后端
+    """
+    global storage_backend
+
+    from triple_store import init_triple_store
+    from repositories import init_repositories
+
+    if storage_backend is not None and storage_backend is not backend:
+        storage_backend.close()
+    storage_backend = backend
+    init_db_executor(backend.max_connections)
+    init_triple_store(backend)
+    init_repositories(backend)
+    logger.info(f"存储后端初始化完成: {backend.name}")
+    return backend
+
+
+def get_storage() -> StorageBackend:
+    """获取全局存储后端实例"""
+    if storage_backend is None:
+        raise RuntimeError("存储后端未初始化")
+    return storage_backend
+
+
+async def run_with_connection(func, *args, **kwargs):
+    """
+    借用存储后端的连接，在数据库线程池中执行 func(conn, *args, **kwargs)
+
+    func 内不能再等待其他协程；需要提交时由 func 自行调用 conn.commit()
+    """
+    def call():
+        with get_storage().connection() as conn:
+            return func(conn, *args, **kwargs)
+    return await run_db(call)
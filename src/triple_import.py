@@ -0,0 +1,244 @@
+"""
+三元组批量导入
+从 CSV / JSONL 流式读取三元组，在内存中校验关系、去重后按大批量多行插入，
+每批一个事务提交；可作为命令行工具运行，也由 /api/triples/import 接口调用
+
+CSV: 首行为表头，包含 head_entity, relation, tail_entity 列（也接受 head / tail）；
+     没有表头时按前三列依次解析
+JSONL: 每行一个 {"head_entity": ..., "relation": ..., "tail_entity": ...} 对象
+"""
+import csv
+import io
+import json
+import logging
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from triple_store import get_triple_store
+from repositories import get_valid_relation_repository
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+# 两次进度日志之间的最小间隔（秒）
+PROGRESS_INTERVAL = 2.0
+
+HEAD_COLUMNS = ("head_entity", "head")
+RELATION_COLUMNS = ("relation",)
+TAIL_COLUMNS = ("tail_entity", "tail")
+
+NamedTriple = Tuple[str, str, str]
+
+
+@dataclass
+class ImportStats:
+    """导入统计"""
+    read: int = 0               # 读取的行数
+    inserted: int = 0           # 新插入的三元组
+    duplicates: int = 0         # 与已有三元组或文件内重复
+    invalid_relation: int = 0   # 关系不在 valid_relations 中
+    malformed: int = 0          # 字段缺失或无法解析
+    batches: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        """每秒读取行数"""
+        return self.read / self.elapsed if self.elapsed > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = asdict(self)
+        result["elapsed"] = round(self.elapsed, 2)
+        result["rows_per_second"] = round(self.rate, 1)
+        return result
+
+
+def _pick(row: Dict[str, Any], columns: Tuple[str, ...]) -> Optional[str]:
+    for column in columns:
+        value = row.get(column)
+        if value is not None:
+            return str(value).strip()
+    return None
+
+
+def _from_mapping(row: Dict[str, Any]) -> Optional[NamedTriple]:
+    triple = (_pick(row, HEAD_COLUMNS), _pick(row, RELATION_COLUMNS), _pick(row, TAIL_COLUMNS))
+    return triple if all(triple) else None
+
+
+def iter_csv(stream: TextIO) -> Iterator[Optional[NamedTriple]]:
+    """逐行解析CSV，无法解析的行产出 None"""
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = [column.strip().lower() for column in header]
+    if any(column in columns for column in HEAD_COLUMNS):
+        for values in reader:
+            yield _from_mapping(dict(zip(columns, values)))
+        return
+
+    # 没有表头，首行也是数据
+    yield _from_values(header)
+    for values in reader:
+        yield _from_values(values)
+
+
+def _from_values(values: List[str]) -> Optional[NamedTriple]:
+    if len(values) < 3:
+        return None
+    triple = tuple(value.strip() for value in values[:3])
+    return triple if all(triple) else None
+
+
+def iter_jsonl(stream: TextIO) -> Iterator[Optional[NamedTriple]]:
+    """逐行解析JSONL，跳过空行，无法解析的行产出 None"""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            yield None
+            continue
+        yield _from_mapping(row) if isinstance(row, dict) else None
+
+
+def detect_format(filename: str) -> str:
+    """根据文件扩展名判断格式"""
+    lowered = (filename or "").lower()
+    if lowered.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    if lowered.endswith(".csv"):
+        return "csv"
+    raise ValueError(f"无法根据文件名判断导入格式: {filename}")
+
+
+def iter_triples(stream: TextIO, file_format: str) -> Iterator[Optional[NamedTriple]]:
+    """按格式逐行解析三元组"""
+    if file_format == "csv":
+        return iter_csv(stream)
+    if file_format == "jsonl":
+        return iter_jsonl(stream)
+    raise ValueError(f"不支持的导入格式: {file_format}")
+
+
+def open_text(binary: io.BufferedIOBase) -> TextIO:
+    """将二进制流包装为文本流（兼容带BOM的UTF-8）"""
+    return io.TextIOWrapper(binary, encoding="utf-8-sig", newline="")
+
+
+def import_triples(conn, rows: Iterable[Optional[NamedTriple]], batch_size: int = DEFAULT_BATCH_SIZE,
+                   on_progress: Optional[Callable[[ImportStats], None]] = None) -> ImportStats:
+    """
+    批量导入三元组
+
+    有效关系和已有三元组（ID形式）在开始时一次性读入内存，之后每行只做集合查找；
+    每批先写入新出现的实体/关系名，再以多行插入写入三元组并提交。
+    已提交的批次在后续出错时不会回滚
+
+    Args:
+        conn: 数据库连接，导入期间独占
+        rows: 名称形式的三元组，None 表示无法解析的行
+        batch_size: 每批（每个事务）的三元组数
+        on_progress: 每批提交后的回调
+
+    Returns:
+        导入统计
+    """
+    store = get_triple_store()
+    cursor = conn.cursor()
+    start = time.time()
+    stats = ImportStats()
+
+    valid_relations = set(get_valid_relation_repository().list_names(cursor))
+    existing = store.triple_keys(cursor)
+    seen = set()
+    batch: List[NamedTriple] = []
+    last_report = start
+
+    def flush():
+        nonlocal last_report
+        if not batch:
+            return
+        keys = []
+        for key in store.intern_triples(cursor, batch):
+            if key in existing:
+                stats.duplicates += 1
+            else:
+                existing.add(key)
+                keys.append(key)
+        # 唯一约束兜底：导入期间其他请求写入的相同三元组被忽略
+        inserted = store.insert_triple_keys(cursor, keys, ignore_duplicates=True)
+        conn.commit()
+        stats.inserted += inserted
+        stats.duplicates += len(keys) - inserted
+        stats.batches += 1
+        batch.clear()
+
+        now = time.time()
+        stats.elapsed = now - start
+        if on_progress is not None:
+            on_progress(stats)
+        if now - last_report >= PROGRESS_INTERVAL:
+            last_report = now
+            logger.info(
+                f"导入进度: 已读取 {stats.read} 行, 新增 {stats.inserted} 条, "
+                f"{stats.rate:.0f} 行/秒"
+            )
+
+    try:
+        for triple in rows:
+            stats.read += 1
+            if triple is None:
+                stats.malformed += 1
+                continue
+            if triple[1] not in valid_relations:
+                stats.invalid_relation += 1
+                continue
+            # 文件内重复在写入字典表之前就地过滤
+            if triple in seen:
+                stats.duplicates += 1
+                continue
+            seen.add(triple)
+            batch.append(triple)
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    except Exception:
+        conn.rollback()
+        raise
+
+    stats.elapsed = time.time() - start
+    logger.info(
+        f"导入完成: 读取 {stats.read} 行, 新增 {stats.inserted} 条, 重复 {stats.duplicates} 条, "
+        f"无效关系 {stats.invalid_relation} 条, 格式错误 {stats.malformed} 条, "
+        f"耗时 {stats.elapsed:.1f}s ({stats.rate:.0f} 行/秒)"
+    )
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from init_db import DB_CONFIG
+    from storage import init_storage, create_backend
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='批量导入三元组（CSV / JSONL）')
+    parser.add_argument('path', type=str, help='导入文件路径')
+    parser.add_argument('--format', type=str, default=None, choices=['csv', 'jsonl'],
+                        help='文件格式，默认根据扩展名判断')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='每批（每个事务）的三元组数')
+    args = parser.parse_args()
+
+    backend = init_storage(create_backend(DB_CONFIG))
+    backend.migrate()
+    with open(args.path, encoding="utf-8-sig", newline="") as stream, backend.connection() as conn:
+        result = import_triples(conn, iter_triples(stream, args.format or detect_format(args.path)), args.batch_size)
+    backend.close()
+    print(json.dumps(result.to_dict(), ensure_ascii=False, indent=2))
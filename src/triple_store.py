@@ -0,0 +1,655 @@
+"""
+三元组存储
+实体名和关系名分别保存在 entities / relations 字典表中，knowledge_triples 只存整数ID；
+本模块集中管理三元组相关的SQL，并在进程内缓存名称与ID的双向映射，
+各接口对外仍然使用名称。SQL 保持可移植，由存储后端（storage.py）提供连接和方言差异；
+ensure_schema 等建表函数为 MySQL 结构迁移使用
+"""
+import functools
+import logging
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+ENTITY_TABLE = "entities"
+RELATION_TABLE = "relations"
+TRIPLE_TABLE = "knowledge_triples"
+# 以名称展示三元组的视图，供流式导出等只读场景使用
+NAMED_TRIPLE_VIEW = "knowledge_triples_named"
+
+# 批量解析ID时单条SQL的最大参数个数
+ID_BATCH_SIZE = 1000
+
+# (id, head_entity, relation, tail_entity)
+TripleRow = Tuple[int, str, str, str]
+# (head_id, relation_id, tail_id)
+TripleKey = Tuple[int, int, int]
+
+
+def _has_column(cursor, table: str, column: str) -> bool:
+    cursor.execute("""
+        SELECT COUNT(*) as cnt FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    return cursor.fetchone()["cnt"] > 0
+
+
+def ensure_schema(cursor):
+    """
+    创建字典表、三元组表和名称视图；若存在旧版（字符串列）三元组表则就地迁移
+
+    字典表名称列使用 utf8mb4_bin 排序规则，保证名称与ID一一对应；
+    字典表只增不删，已缓存的映射永远有效
+
+    Args:
+        cursor: 数据库游标
+    """
+    for table, length in ((ENTITY_TABLE, 255), (RELATION_TABLE, 100)):
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                name VARCHAR({length}) NOT NULL COLLATE utf8mb4_bin,
+                UNIQUE KEY uk_name (name)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TRIPLE_TABLE} (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            head_id INT NOT NULL,
+            relation_id INT NOT NULL,
+            tail_id INT NOT NULL,
+            INDEX idx_head_id (head_id),
+            INDEX idx_tail_id (tail_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+
+    if _has_column(cursor, TRIPLE_TABLE, "head_entity"):
+        _migrate_legacy_triples(cursor)
+
+    cursor.execute(f"""
+        CREATE OR REPLACE VIEW {NAMED_TRIPLE_VIEW} AS
+        SELECT t.id, h.name AS head_entity, r.name AS relation, e.name AS tail_entity
+        FROM {TRIPLE_TABLE} t
+        JOIN {ENTITY_TABLE} h ON h.id = t.head_id
+        JOIN {RELATION_TABLE} r ON r.id = t.relation_id
+        JOIN {ENTITY_TABLE} e ON e.id = t.tail_id
+    """)
+
+
+def _migrate_legacy_triples(cursor):
+    """
+    将旧版 knowledge_triples(head_entity, relation, tail_entity) 转换为整数ID形式
+
+    保留原有三元组ID；每一步都可重复执行，中途失败后重启服务即可继续
+    """
+    logger.info("检测到旧版三元组表，开始迁移为实体/关系字典表 + 整数ID")
+
+    cursor.execute(f"""
+        INSERT IGNORE INTO {ENTITY_TABLE} (name)
+        SELECT head_entity COLLATE utf8mb4_bin FROM {TRIPLE_TABLE}
+        UNION
+        SELECT tail_entity COLLATE utf8mb4_bin FROM {TRIPLE_TABLE}
+    """)
+    cursor.execute(f"""
+        INSERT IGNORE INTO {RELATION_TABLE} (name)
+        SELECT DISTINCT relation COLLATE utf8mb4_bin FROM {TRIPLE_TABLE}
+    """)
+
+    if not _has_column(cursor, TRIPLE_TABLE, "head_id"):
+        cursor.execute(f"""
+            ALTER TABLE {TRIPLE_TABLE}
+                ADD COLUMN head_id INT NULL,
+                ADD COLUMN relation_id INT NULL,
+                ADD COLUMN tail_id INT NULL
+        """)
+
+    cursor.execute(f"""
+        UPDATE {TRIPLE_TABLE} t
+        JOIN {ENTITY_TABLE} h ON h.name = t.head_entity COLLATE utf8mb4_bin
+        JOIN {RELATION_TABLE} r ON r.name = t.relation COLLATE utf8mb4_bin
+        JOIN {ENTITY_TABLE} e ON e.name = t.tail_entity COLLATE utf8mb4_bin
+        SET t.head_id = h.id, t.relation_id = r.id, t.tail_id = e.id
+    """)
+    migrated = cursor.rowcount
+
+    # 删除字符串列时其上的索引随之删除
+    cursor.execute(f"""
+        ALTER TABLE {TRIPLE_TABLE}
+            DROP COLUMN head_entity,
+            DROP COLUMN relation,
+            DROP COLUMN tail_entity,
+            MODIFY head_id INT NOT NULL,
+            MODIFY relation_id INT NOT NULL,
+            MODIFY tail_id INT NOT NULL,
+            ADD INDEX idx_head_id (head_id),
+            ADD INDEX idx_tail_id (tail_id)
+    """)
+    logger.info(f"三元组表迁移完成，转换 {migrated} 条记录")
+
+
+class NameDictionary:
+    """名称 <-> 整数ID 映射缓存（对应一张只增不删的字典表）"""
+
+    def __init__(self, table: str, backend):
+        """
+        Args:
+            table: 字典表名
+            backend: 存储后端
+        """
+        self.table = table
+        self.backend = backend
+        self._ids: Dict[str, int] = {}
+        self._names: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def remember(self, rows: Iterable[Dict[str, Any]]):
+        """缓存 {id, name} 行"""
+        with self._lock:
+            for row in rows:
+                self._ids[row["name"]] = row["id"]
+                self._names[row["id"]] = row["name"]
+
+    def _remember_read(self, cursor, rows: List[Dict[str, Any]]):
+        """
+        缓存通过调用方游标读到的行
+
+        调用方事务写入过新名称时，读到的行可能尚未提交，
+        推迟到事务提交后再缓存，回滚时丢弃
+        """
+        cursor.connection.after_commit(functools.partial(self.remember, rows))
+
+    def _select(self, cursor, column: str, values: List[Any]) -> List[Dict[str, Any]]:
+        rows = []
+        for start in range(0, len(values), ID_BATCH_SIZE):
+            batch = values[start:start + ID_BATCH_SIZE]
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(f"SELECT id, name FROM {self.table} WHERE {column} IN ({placeholders})", batch)
+            rows.extend(cursor.fetchall())
+        self._remember_read(cursor, rows)
+        return rows
+
+    def all(self, cursor) -> List[Dict[str, Any]]:
+        """字典表全部 {id, name} 行"""
+        cursor.execute(f"SELECT id, name FROM {self.table} ORDER BY id")
+        rows = cursor.fetchall()
+        self._remember_read(cursor, rows)
+        return rows
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def lookup(self, cursor, name: str) -> Optional[int]:
+        """
+        查询名称对应的ID
+
+        Returns:
+            ID，名称不存在时为None
+        """
+        value = self._ids.get(name)
+        if value is not None:
+            return value
+        cursor.execute(f"SELECT id, name FROM {self.table} WHERE name = %s", (name,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        self._remember_read(cursor, [row])
+        return row["id"]
+
+    def lookup_many(self, cursor, names: Iterable[str]) -> Dict[str, int]:
+        """批量查询名称对应的ID，不存在的名称不出现在结果中"""
+        names = list(dict.fromkeys(names))
+        found = {name: self._ids[name] for name in names if name in self._ids}
+        missing = [name for name in names if name not in found]
+        for row in self._select(cursor, "name", missing):
+            found[row["name"]] = row["id"]
+        return found
+
+    def intern(self, cursor, names: Iterable[str]) -> Dict[str, int]:
+        """
+        获取名称对应的ID，不存在时写入字典表
+
+        新名称在调用方事务内写入（不另开连接，不占用额外的连接池名额），
+        事务提交后才进入缓存，回滚时丢弃，因此缓存中不会出现指向不存在记录的ID
+
+        Args:
+            cursor: 调用方游标
+
+        Returns:
+            名称 -> ID
+        """
+        names = list(dict.fromkeys(names))
+        missing = [name for name in names if name not in self._ids]
+        if not missing:
+            return {name: self._ids[name] for name in names}
+
+        insert = f"{self.backend.insert_ignore} INTO {self.table} (name) VALUES (%s)"
+        cursor.executemany(insert, [(name,) for name in missing])
+        cursor.connection.defer_after_commit()
+        return self.lookup_many(cursor, names)
+
+    def names(self, cursor, ids: Iterable[int]) -> Dict[int, str]:
+        """批量将ID解析为名称"""
+        ids = list(dict.fromkeys(ids))
+        found = {value: self._names[value] for value in ids if value in self._names}
+        missing = [value for value in ids if value not in found]
+        for row in self._select(cursor, "id", missing):
+            found[row["id"]] = row["name"]
+        return found
+
+
+class TripleStore:
+    """以名称为接口、整数ID为存储的三元组访问层"""
+
+    def __init__(self, backend):
+        """
+        Args:
+            backend: 存储后端
+        """
+        self.backend = backend
+        self.entities = NameDictionary(ENTITY_TABLE, backend)
+        self.relations = NameDictionary(RELATION_TABLE, backend)
+
+    # ---------- 读取 ----------
+
+    def _to_named(self, cursor, rows: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """将 id/head_id/relation_id/tail_id 行转换为名称形式"""
+        entity_names = self.entities.names(cursor, [value for row in rows for value in (row["head_id"], row["tail_id"])])
+        relation_names = self.relations.names(cursor, [row["relation_id"] for row in rows])
+        return [
+            {
+                "id": row["id"],
+                "head_entity": entity_names[row["head_id"]],
+                "relation": relation_names[row["relation_id"]],
+                "tail_entity": entity_names[row["tail_id"]]
+            }
+            for row in rows
+        ]
+
+    def fetch_all(self, cursor) -> List[TripleRow]:
+        """读取全部三元组"""
+        cursor.execute(f"SELECT id, head_id, relation_id, tail_id FROM {TRIPLE_TABLE}")
+        return [
+            (row["id"], row["head_entity"], row["relation"], row["tail_entity"])
+            for row in self._to_named(cursor, cursor.fetchall())
+        ]
+
+    def entity_exists(self, cursor, name: str) -> bool:
+        """实体是否出现在任一三元组中"""
+        entity_id = self.entities.lookup(cursor, name)
+        if entity_id is None:
+            return False
+        cursor.execute(f"""
+            SELECT EXISTS(SELECT 1 FROM {TRIPLE_TABLE} WHERE head_id = %s)
+                OR EXISTS(SELECT 1 FROM {TRIPLE_TABLE} WHERE tail_id = %s) as found
+        """, (entity_id, entity_id))
+        return bool(cursor.fetchone()["found"])
+
+    def list_entity_names(self, cursor) -> List[str]:
+        """图谱中出现的所有实体名称（不含已无三元组引用的字典项）"""
+        cursor.execute(f"""
+            SELECT e.id, e.name FROM {ENTITY_TABLE} e
+            WHERE EXISTS(SELECT 1 FROM {TRIPLE_TABLE} t WHERE t.head_id = e.id)
+               OR EXISTS(SELECT 1 FROM {TRIPLE_TABLE} t WHERE t.tail_id = e.id)
+        """)
+        rows = cursor.fetchall()
+        self.entities._remember_read(cursor, rows)
+        return [row["name"] for row in rows]
+
+    def related_entities(self, cursor, name: str) -> List[str]:
+        """与实体直接相连的所有实体（不区分方向）"""
+        entity_id = self.entities.lookup(cursor, name)
+        if entity_id is None:
+            return []
+        cursor.execute(f"""
+            SELECT DISTINCT
+                CASE WHEN head_id = %s THEN tail_id ELSE head_id END as related_id
+            FROM {TRIPLE_TABLE}
+            WHERE head_id = %s OR tail_id = %s
+        """, (entity_id, entity_id, entity_id))
+        related_ids = [row["related_id"] for row in cursor.fetchall()]
+        names = self.entities.names(cursor, related_ids)
+        return [names[value] for value in related_ids]
+
+    def find_between(self, cursor, entity_a: str, entity_b: str) -> List[Dict[str, Any]]:
+        """两个实体之间（任一方向）的所有三元组"""
+        ids = self.entities.lookup_many(cursor, (entity_a, entity_b))
+        if entity_a not in ids or entity_b not in ids:
+            return []
+        a, b = ids[entity_a], ids[entity_b]
+        cursor.execute(f"""
+            SELECT id, head_id, relation_id, tail_id FROM {TRIPLE_TABLE}
+            WHERE (head_id = %s AND tail_id = %s)
+               OR (head_id = %s AND tail_id = %s)
+        """, (a, b, b, a))
+        return self._to_named(cursor, cursor.fetchall())
+
+    def find_among(self, cursor, names: Iterable[str]) -> List[Dict[str, Any]]:
+        """
+        头尾实体都属于给定集合的所有三元组（一次查询，按ID排序）
+
+        用于一次取回一组实体两两之间的边，代替逐对调用 find_between
+        """
+        ids = list(self.entities.lookup_many(cursor, names).values())
+        if not ids:
+            return []
+        rows = []
+        # 头实体分批，尾实体始终是完整集合，保证每条边只出现一次
+        placeholders_all = ", ".join(["%s"] * len(ids))
+        batch_size = max(1, ID_BATCH_SIZE - len(ids))
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(f"""
+                SELECT id, head_id, relation_id, tail_id FROM {TRIPLE_TABLE}
+                WHERE head_id IN ({placeholders}) AND tail_id IN ({placeholders_all})
+            """, (*batch, *ids))
+            rows.extend(cursor.fetchall())
+        rows.sort(key=lambda row: row["id"])
+        return self._to_named(cursor, rows)
+
+    def find_by_head(self, cursor, head_entity: str, relations: Sequence[str]) -> List[Dict[str, Any]]:
+        """以指定实体为头实体、关系属于给定集合的三元组"""
+        head_id = self.entities.lookup(cursor, head_entity)
+        relation_ids = list(self.relations.lookup_many(cursor, relations).values())
+        if head_id is None or not relation_ids:
+            return []
+        placeholders = ", ".join(["%s"] * len(relation_ids))
+        cursor.execute(f"""
+            SELECT id, head_id, relation_id, tail_id FROM {TRIPLE_TABLE}
+            WHERE head_id = %s AND relation_id IN ({placeholders})
+        """, (head_id, *relation_ids))
+        return self._to_named(cursor, cursor.fetchall())
+
+    def iter_named(self, conn, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """
+        逐行读取全部三元组（名称形式），不把整个结果集读入内存
+
+        Args:
+            conn: 数据库连接，迭代期间不能用于其他查询
+            batch_size: 每次从服务端读取的行数
+        """
+        cursor = self.backend.streaming_cursor(conn)
+        try:
+            cursor.execute(
+                f"SELECT id, head_entity, relation, tail_entity FROM {NAMED_TRIPLE_VIEW}"
+            )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
+    def iter_key_batches(self, conn, batch_size: int = 10000) -> Iterator[List[Dict[str, Any]]]:
+        """
+        按ID顺序分批读取全部三元组的ID形式 {id, head_id, relation_id, tail_id}
+
+        Args:
+            conn: 数据库连接，迭代期间不能用于其他查询
+            batch_size: 每批行数
+        """
+        cursor = self.backend.streaming_cursor(conn)
+        try:
+            cursor.execute(f"SELECT id, head_id, relation_id, tail_id FROM {TRIPLE_TABLE} ORDER BY id")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+    def count(self, cursor) -> int:
+        """三元组数量"""
+        cursor.execute(f"SELECT COUNT(*) as cnt FROM {TRIPLE_TABLE}")
+        return cursor.fetchone()["cnt"]
+
+    def triple_exists(self, cursor, head_entity: str, relation: str, tail_entity: str) -> bool:
+        """指定三元组是否已存在"""
+        ids = self.entities.lookup_many(cursor, (head_entity, tail_entity))
+        relation_id = self.relations.lookup(cursor, relation)
+        if head_entity not in ids or tail_entity not in ids or relation_id is None:
+            return False
+        cursor.execute(f"""
+            SELECT EXISTS(
+                SELECT 1 FROM {TRIPLE_TABLE}
+                WHERE head_id = %s AND relation_id = %s AND tail_id = %s
+            ) as found
+        """, (ids[head_entity], relation_id, ids[tail_entity]))
+        return bool(cursor.fetchone()["found"])
+
+    # ---------- 写入 ----------
+
+    def _intern_triple(self, cursor, head_entity: str, relation: str, tail_entity: str) -> Tuple[int, int, int]:
+        entity_ids = self.entities.intern(cursor, (head_entity, tail_entity))
+        relation_id = self.relations.intern(cursor, (relation,))[relation]
+        return entity_ids[head_entity], relation_id, entity_ids[tail_entity]
+
+    def insert_triple(self, cursor, head_entity: str, relation: str, tail_entity: str) -> int:
+        """
+        插入一条三元组（不提交）
+
+        Returns:
+            新三元组ID
+        """
+        cursor.execute(
+            f"INSERT INTO {TRIPLE_TABLE} (head_id, relation_id, tail_id) VALUES (%s, %s, %s)",
+            self._intern_triple(cursor, head_entity, relation, tail_entity)
+        )
+        return cursor.lastrowid
+
+    def intern_triples(self, cursor, triples: Sequence[Tuple[str, str, str]]) -> List[TripleKey]:
+        """批量将名称形式的三元组转换为ID形式，不存在的名称写入字典表"""
+        entity_ids = self.entities.intern(cursor, (name for head, _, tail in triples for name in (head, tail)))
+        relation_ids = self.relations.intern(cursor, (relation for _, relation, _ in triples))
+        return [(entity_ids[head], relation_ids[relation], entity_ids[tail]) for head, relation, tail in triples]
+
+    def triple_keys(self, cursor) -> Set[TripleKey]:
+        """所有三元组的ID形式，用于批量写入前在内存中去重"""
+        cursor.execute(f"SELECT head_id, relation_id, tail_id FROM {TRIPLE_TABLE}")
+        return {(row["head_id"], row["relation_id"], row["tail_id"]) for row in cursor.fetchall()}
+
+    def insert_triple_keys(self, cursor, keys: Sequence[TripleKey], ignore_duplicates: bool = False) -> int:
+        """
+        批量插入ID形式的三元组（不提交）
+
+        Args:
+            ignore_duplicates: 为True时跳过与已有三元组重复的行（唯一约束），而不是抛出异常
+
+        Returns:
+            实际插入条数
+        """
+        if not keys:
+            return 0
+        insert = self.backend.insert_ignore if ignore_duplicates else "INSERT"
+        cursor.executemany(
+            f"{insert} INTO {TRIPLE_TABLE} (head_id, relation_id, tail_id) VALUES (%s, %s, %s)",
+            keys
+        )
+        return cursor.rowcount
+
+    def restore_triples(self, cursor, rows: Sequence[Tuple[int, int, int, int]]) -> int:
+        """
+        按原ID批量写入 (id, head_id, relation_id, tail_id)（不提交），用于从快照恢复
+
+        Returns:
+            插入条数
+        """
+        if not rows:
+            return 0
+        cursor.executemany(
+            f"INSERT INTO {TRIPLE_TABLE} (id, head_id, relation_id, tail_id) VALUES (%s, %s, %s, %s)",
+            rows
+        )
+        return len(rows)
+
+    def insert_triples(self, cursor, triples: Sequence[Tuple[str, str, str]]) -> int:
+        """
+        批量插入三元组（不提交）
+
+        Returns:
+            插入条数
+        """
+        self.insert_triple_keys(cursor, self.intern_triples(cursor, triples))
+        return len(triples)
+
+    def update_triple(self, cursor, triple_id: int, head_entity: str, relation: str, tail_entity: str) -> int:
+        """更新三元组（不提交），返回受影响行数"""
+        cursor.execute(
+            f"UPDATE {TRIPLE_TABLE} SET head_id = %s, relation_id = %s, tail_id = %s WHERE id = %s",
+            (*self._intern_triple(cursor, head_entity, relation, tail_entity), triple_id)
+        )
+        return cursor.rowcount
+
+    def delete_triple(self, cursor, triple_id: int) -> int:
+        """删除三元组（不提交），返回受影响行数"""
+        cursor.execute(f"DELETE FROM {TRIPLE_TABLE} WHERE id = %s", (triple_id,))
+        return cursor.rowcount
+
+    def delete_triples(self, cursor, triple_ids: Iterable[int]) -> List[int]:
+        """
+        批量删除三元组（不提交）
+
+        Returns:
+            实际删除的三元组ID列表（不存在的ID被忽略）
+        """
+        triple_ids = list(dict.fromkeys(triple_ids))
+        deleted = []
+        for start in range(0, len(triple_ids), ID_BATCH_SIZE):
+            batch = triple_ids[start:start + ID_BATCH_SIZE]
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(f"SELECT id FROM {TRIPLE_TABLE} WHERE id IN ({placeholders})", batch)
+            found = [row["id"] for row in cursor.fetchall()]
+            if found:
+                placeholders = ", ".join(["%s"] * len(found))
+                cursor.execute(f"DELETE FROM {TRIPLE_TABLE} WHERE id IN ({placeholders})", found)
+                deleted.extend(found)
+        return deleted
+
+    def delete_entities(self, cursor, names: Iterable[str]) -> Dict[str, List[int]]:
+        """
+        批量删除包含这些实体的所有三元组（不提交）
+
+        Returns:
+            实体名称 -> 被删除的三元组ID列表（两端都被删除的边在两个实体下都会列出）
+        """
+        names = list(dict.fromkeys(names))
+        deleted: Dict[str, List[int]] = {name: [] for name in names}
+        entity_names = {entity_id: name for name, entity_id in self.entities.lookup_many(cursor, names).items()}
+        ids = list(entity_names)
+        # 每条SQL中实体ID出现两次
+        batch_size = ID_BATCH_SIZE // 2
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            placeholders = ", ".join(["%s"] * len(batch))
+            where = f"head_id IN ({placeholders}) OR tail_id IN ({placeholders})"
+            cursor.execute(f"SELECT id, head_id, tail_id FROM {TRIPLE_TABLE} WHERE {where}", (*batch, *batch))
+            for row in cursor.fetchall():
+                for entity_id in {row["head_id"], row["tail_id"]}:
+                    if entity_id in entity_names:
+                        deleted[entity_names[entity_id]].append(row["id"])
+            cursor.execute(f"DELETE FROM {TRIPLE_TABLE} WHERE {where}", (*batch, *batch))
+        return deleted
+
+    def delete_entity(self, cursor, name: str) -> List[int]:
+        """
+        删除包含该实体的所有三元组（不提交）
+
+        Returns:
+            被删除的三元组ID列表
+        """
+        entity_id = self.entities.lookup(cursor, name)
+        if entity_id is None:
+            return []
+        cursor.execute(
+            f"SELECT id FROM {TRIPLE_TABLE} WHERE head_id = %s OR tail_id = %s",
+            (entity_id, entity_id)
+        )
+        edge_ids = [row["id"] for row in cursor.fetchall()]
+        cursor.execute(
+            f"DELETE FROM {TRIPLE_TABLE} WHERE head_id = %s OR tail_id = %s",
+            (entity_id, entity_id)
+        )
+        return edge_ids
+
+    def rename_entity(self, cursor, old_name: str, new_name: str) -> Tuple[int, List[int]]:
+        """
+        重命名实体（不提交）
+
+        三元组改为引用新名称的ID，而不是修改字典项，
+        因此已缓存的映射不会失效；新名称已存在时自动合并，
+        合并后与已有三元组重复的边会被删除（三元组有唯一约束）
+
+        Returns:
+            (受影响的三元组数, 因合并而删除的三元组ID列表)
+        """
+        old_id = self.entities.lookup(cursor, old_name)
+        if old_id is None:
+            return 0, []
+        new_id = self.entities.intern(cursor, (new_name,))[new_name]
+        if new_id == old_id:
+            return 0, []
+
+        cursor.execute(
+            f"SELECT id, head_id, relation_id, tail_id FROM {TRIPLE_TABLE} WHERE head_id = %s OR tail_id = %s",
+            (old_id, old_id)
+        )
+        rows = cursor.fetchall()
+        moved_ids = {row["id"] for row in rows}
+        cursor.execute(
+            f"SELECT id, head_id, relation_id, tail_id FROM {TRIPLE_TABLE} WHERE head_id = %s OR tail_id = %s",
+            (new_id, new_id)
+        )
+        taken = {
+            (row["head_id"], row["relation_id"], row["tail_id"])
+            for row in cursor.fetchall() if row["id"] not in moved_ids
+        }
+
+        # 改名后与已有三元组（或彼此）重复的边只保留ID最小的一条
+        merged_ids = []
+        for row in sorted(rows, key=lambda row: row["id"]):
+            target = (
+                new_id if row["head_id"] == old_id else row["head_id"],
+                row["relation_id"],
+                new_id if row["tail_id"] == old_id else row["tail_id"]
+            )
+            if target in taken:
+                merged_ids.append(row["id"])
+            else:
+                taken.add(target)
+        for start in range(0, len(merged_ids), ID_BATCH_SIZE):
+            batch = merged_ids[start:start + ID_BATCH_SIZE]
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(f"DELETE FROM {TRIPLE_TABLE} WHERE id IN ({placeholders})", batch)
+
+        cursor.execute(f"UPDATE {TRIPLE_TABLE} SET head_id = %s WHERE head_id = %s", (new_id, old_id))
+        updated = cursor.rowcount
+        cursor.execute(f"UPDATE {TRIPLE_TABLE} SET tail_id = %s WHERE tail_id = %s", (new_id, old_id))
+        return updated + cursor.rowcount, merged_ids
+
+
+# 全局三元组存储实例
+triple_store = None
+
+
+def init_triple_store(backend):
+    """
+    初始化三元组存储
+
+    Args:
+        backend: 存储后端
+    """
+    global triple_store
+
+    triple_store = TripleStore(backend)
+    logger.info("三元组存储初始化完成")
+
+
+def get_triple_store() -> TripleStore:
+    """获取三元组存储实例"""
+    if triple_store is None:
+        raise RuntimeError("三元组存储未初始化")
+    return triple_store
@@ -36,6 +36,46 @@ apiClient.interceptors.response.use(
   }
 )
 
+const TYPED_ARRAY_MEDIA_TYPE = 'application/vnd.kgraph.typed-array'
+
+const TYPED_ARRAY_CTORS = {
+  '|u1': Uint8Array,
+  '<u4': Uint32Array
+}
+
+/**
+ * 解码紧凑图谱（类型化数组布局）为 ECharts 所需的 nodes / links
+ * 布局: magic(4B) | header长度(uint32 LE) | header JSON | 4字节对齐的数组区
+ * @param {ArrayBuffer} buffer - 响应体
+ */
+export function decodeTypedArrayGraph(buffer) {
+  const view = new DataView(buffer)
+  const headerLength = view.getUint32(4, true)
+  const header = JSON.parse(new TextDecoder('utf-8').decode(new Uint8Array(buffer, 8, headerLength)))
+  const base = 8 + headerLength
+  const arrays = {}
+  for (const item of header.arrays) {
+    const Ctor = TYPED_ARRAY_CTORS[item.dtype]
+    arrays[item.name] = new Ctor(buffer, base + item.offset, item.length)
+  }
+
+  const { strings } = header
+  const nodes = new Array(header.node_count)
+  for (let i = 0; i < header.node_count; i++) {
+    nodes[i] = { name: strings[i], id: strings[i], category: arrays.node_category[i] }
+  }
+  const links = new Array(header.edge_count)
+  for (let i = 0; i < header.edge_count; i++) {
+    links[i] = {
+      source: strings[arrays.edge_source[i]],
+      target: strings[arrays.edge_target[i]],
+      value: strings[arrays.edge_relation[i]],
+      id: arrays.edge_id[i]
+    }
+  }
+  return { nodes, links, version: header.version }
+}
+
 export default {
   /**
    * 获取完整知识图谱
@@ -44,6 +84,94 @@ export default {
     return apiClient.get('/graph')
   },
 
+  /**
+   * 以紧凑二进制编码获取完整知识图谱（传输体积更小）
+   */
+  async getGraphCompact() {
+    const buffer = await apiClient.get('/graph', {
+      responseType: 'arraybuffer',
+      headers: { Accept: TYPED_ARRAY_MEDIA_TYPE }
+    })
+    return decodeTypedArrayGraph(buffer)
+  },
+
+  /**
+   * 获取按高级节点簇聚合的LOD图谱
+   * @param {string[]} expand - 需要展开的簇（高级节点名称）
+   */
+  getGraphLod(expand = []) {
+    const params = expand.length ? { expand: expand.join(',') } : {}
+    return apiClient.get('/graph/lod', { params })
+  },
+
+  /**
+   * 获取服务端预计算的图谱布局坐标
+   * 返回 { version, nodes: [{ id, x, y }] }
+   */
+  getGraphLayout() {
+    return apiClient.get('/graph/layout')
+  },
+
+  /**
+   * 获取种子实体的k跳邻域子图
+   * @param {string|string[]} seeds - 种子实体名称
+   * @param {Object} options - { depth, max_fanout, max_nodes, relations, direction }
+   */
+  getNeighborhood(seeds, options = {}) {
+    const params = { ...options, seeds: [].concat(seeds).join(',') }
+    if (Array.isArray(params.relations)) {
+      params.relations = params.relations.join(',')
+    }
+    return apiClient.get('/graph/neighborhood', { params })
+  },
+
+  /**
+   * 获取指定版本之后的图谱变更（增量同步）
+   * @param {number} since - 客户端当前持有的版本号
+   */
+  getGraphChanges(since) {
+    return apiClient.get('/graph/changes', { params: { since } })
+  },
+
+  /**
+   * 订阅图谱变更推送（Server-Sent Events）
+   * @param {Object} handlers - { onHello, onMutation, onReset }
+   * @param {number} since - 从该版本之后开始推送（可选）
+   * @param {string} epoch - since 所属的服务进程标识（hello / getGraphChanges 返回的 epoch，可选）
+   * @returns {EventSource} 调用 close() 取消订阅
+   */
+  subscribeGraphChanges(handlers = {}, since = null, epoch = null) {
+    const params = new URLSearchParams()
+    if (since !== null) {
+      params.set('since', since)
+      if (epoch !== null) {
+        params.set('epoch', epoch)
+      }
+    }
+    const query = params.toString() ? `?${params}` : ''
+    const source = new EventSource(`${API_CONFIG.BASE_URL}/api/graph/changes/stream${query}`)
+    const bind = (event, handler) => {
+      if (handler) {
+        source.addEventListener(event, e => handler(JSON.parse(e.data)))
+      }
+    }
+    bind('hello', handlers.onHello)
+    bind('mutation', handlers.onMutation)
+    bind('reset', handlers.onReset)
+    return source
+  },
+
+  /**
+   * 实体名称自动补全
+   * @param {string} query - 输入的名称片段
+   * @param {number} limit - 返回数量
+   */
+  autocompleteEntities(query, limit = 10) {
+    return apiClient.get('/entities/autocomplete', {
+      params: { q: query, limit }
+    })
+  },
+
   /**
    * 获取相似实体（添加节点第一步）
    * @param {string} entityName - 实体名称
@@ -127,6 +255,28 @@ export default {
     })
   },
 
+  /**
+   * 批量编辑节点和边（单事务）
+   * @param {Array} operations - [{ op, ... }]，op 为 rename_node / merge_nodes / delete_node / update_edge / delete_edge
+   * @param {boolean} atomic - 任一操作未成功时是否回滚整批
+   */
+  batchEditGraph(operations, atomic = true) {
+    return apiClient.post('/graph/batch', { operations, atomic })
+  },
+
+  /**
+   * 批量导入三元组
+   * @param {FormData} formData - 包含 file（CSV/JSONL）及可选的 file_format、batch_size
+   */
+  importTriples(formData) {
+    return apiClient.post('/triples/import', formData, {
+      headers: {
+        'Content-Type': 'multipart/form-data'
+      },
+      timeout: 0 // 大文件导入耗时不确定，不设超时
+    })
+  },
+
   /**
    * 验证实体组合的合理性
    * @param {Object} data - { entities, validation_type }
@@ -145,12 +295,33 @@ export default {
   },
 
   /**
-   * 获取图像分析历史记录
-   * @param {number} limit - 返回记录数量限制
+   * 获取图像分析历史记录（键集分页）
+   * @param {number} limit - 每页记录数
+   * @param {Object} options - { cursor, risk_level, detected_type }，cursor 为上一页返回的 next_cursor
    */
-  getAnalysisHistory(limit = 10) {
+  getAnalysisHistory(limit = 10, options = {}) {
     return apiClient.get('/image/analysis-history', {
-      params: { limit }
+      params: { limit, ...options }
+    })
+  },
+
+  /**
+   * 获取已保存的完整图像分析结果
+   * @param {string} analysisId - 分析ID
+   */
+  getAnalysisResult(analysisId) {
+    return apiClient.get(`/image/analysis/${encodeURIComponent(analysisId)}`)
+  },
+
+  /**
+   * 获取图像分析趋势（按小时/天汇总）
+   * @param {string} granularity - hour / day
+   * @param {string} start - 起始时间（含），可选
+   * @param {string} end - 结束时间（不含），可选
+   */
+  getAnalysisTrends(granularity = 'day', start = null, end = null) {
+    return apiClient.get('/image/analysis-trends', {
+      params: { granularity, start, end }
     })
   },
 